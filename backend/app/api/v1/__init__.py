@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from . import auth, users, projects, documents, comments, workflows, notifications, dashboards
+from . import auth, users, projects, documents, comments, workflows, notifications, dashboards, uploads, search, analysis
 
 router = APIRouter()
 router.include_router(auth.router)
@@ -10,4 +10,7 @@ router.include_router(documents.router)
 router.include_router(comments.router)
 router.include_router(workflows.router)
 router.include_router(notifications.router)
-router.include_router(dashboards.router)
\ No newline at end of file
+router.include_router(dashboards.router)
+router.include_router(uploads.router)
+router.include_router(search.router)
+router.include_router(analysis.router)
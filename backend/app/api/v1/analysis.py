@@ -0,0 +1,196 @@
+import json
+import uuid
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, get_db
+from app.schemas.analysis import AnalysisCacheStats, AnalysisQueueStats, AnalysisTimingStats, LLMUsage
+from app.services.analysis_cache_service import analysis_cache
+from app.services.analysis_metrics import analysis_metrics
+from app.services.analysis_progress import progress_event, progress_hub, progress_publisher
+from app.services.analysis_queue import analysis_queue
+from app.services.document_service import DocumentService
+from app.services.llm_client import rate_limiter
+from app.security import get_current_user, verify_project_access, verify_token
+
+router = APIRouter()
+document_service = DocumentService()
+
+
+def _analysis_snapshot(document_id: str) -> Optional[Dict]:
+    """
+    Current analysis state of a document as a progress event
+
+    The stored result when there is one (served from the metadata cache),
+    otherwise the latest published event, otherwise the newest job.
+
+    Returns:
+        Event dict, or None if the document does not exist
+    """
+    db = SessionLocal()
+    try:
+        result = document_service.get_analysis_result(db, document_id)
+        if result is None:
+            return None
+        if result["status"] == "completed":
+            return progress_event(document_id, "stored", result=result)
+        latest = progress_publisher.last(document_id)
+        if latest is not None:
+            return latest
+        job = analysis_queue.latest_job(db, uuid.UUID(document_id))
+        if job is None:
+            return progress_event(document_id, "pending")
+        if job["status"] == "failed":
+            return progress_event(document_id, "failed", error=job["last_error"])
+        return progress_event(document_id, "queued" if job["status"] == "queued" else "started", attempt=job["attempts"])
+    finally:
+        db.close()
+
+
+def _has_document_access(document_id: str, user_id: str) -> bool:
+    """Whether the user can see the document's project"""
+    db = SessionLocal()
+    try:
+        document = document_service.get_document(db, document_id)
+        return bool(document) and bool(verify_project_access(db, str(document.project_id), user_id))
+    finally:
+        db.close()
+
+
+def _checked_snapshot(document_id: str, user_id: str) -> Dict:
+    try:
+        if not _has_document_access(document_id, user_id):
+            raise HTTPException(status_code=404, detail="Document not found")
+        snapshot = _analysis_snapshot(document_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid document ID: {str(e)}")
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return snapshot
+
+
+@router.get("/analysis/cache/stats", response_model=AnalysisCacheStats)
+def get_analysis_cache_stats(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Analysis cache effectiveness
+
+    How many analyses were served from the content-hash cache, and the
+    model calls, processing time and prompt tokens that saved.
+    """
+    return analysis_cache.stats(db)
+
+
+@router.get("/analysis/llm/usage", response_model=LLMUsage)
+def get_llm_usage(current_user = Depends(get_current_user)):
+    """
+    Model quota use across all workers
+
+    Requests and tokens sent in the current and previous minute, against
+    the configured per-minute limits.
+    """
+    return rate_limiter.usage()
+
+
+@router.get("/analysis/queue/stats", response_model=AnalysisQueueStats)
+def get_analysis_queue_stats(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Analysis job queue depth
+
+    Jobs by status, leases that expired without a heartbeat, and how long
+    the oldest due job has been waiting.
+    """
+    return analysis_queue.stats(db)
+
+
+@router.get("/analysis/timings/stats", response_model=AnalysisTimingStats)
+def get_analysis_timing_stats(
+    project_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=3650),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Where analysis time goes
+
+    Median and 95th percentile of analysis duration and of each stage
+    (fetch, extract, llm, parse), with pages and characters read and
+    tokens used, over the analyses of the last days that ran the model.
+    """
+    try:
+        if project_id and not verify_project_access(db, project_id, str(current_user.id)):
+            raise HTTPException(status_code=404, detail="Project not found")
+        return analysis_metrics.stats(db, project_id, days=days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid project ID: {str(e)}")
+
+
+@router.get("/documents/{document_id}/analysis/events")
+async def stream_analysis_events(
+    document_id: str,
+    current_user = Depends(get_current_user)
+):
+    """
+    Live analysis progress as Server-Sent Events
+
+    Sends the current state first, then every stage as it happens
+    (queued, started, extracting, llm_call, parsing, retrying) and ends
+    with stored, carrying the analysis result, or failed. Comment lines
+    keep idle connections open.
+    """
+    # Database and Redis reads; keep them off the event loop
+    first = await run_in_threadpool(_checked_snapshot, document_id, str(current_user.id))
+
+    async def events():
+        async for event in progress_hub.stream(document_id, lambda: _analysis_snapshot(document_id) or first):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/documents/{document_id}/analysis/ws")
+async def analysis_events_websocket(
+    websocket: WebSocket,
+    document_id: str,
+    token: str = Query(...)
+):
+    """
+    Live analysis progress over a WebSocket
+
+    Browsers cannot set headers on WebSockets, so the access token is a
+    query parameter. Closes with 1008 when the token is invalid or the
+    user has no access to the document's project. Sends the same events as the SSE endpoint, as JSON
+    messages, and closes after stored or failed.
+    """
+    try:
+        user_id = verify_token(token, ValueError("Could not validate credentials"))
+        # Unknown documents and other projects' documents look the same
+        first = await run_in_threadpool(_checked_snapshot, document_id, user_id)
+    except (ValueError, HTTPException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    try:
+        async for event in progress_hub.stream(document_id, lambda: _analysis_snapshot(document_id) or first):
+            if event is not None:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
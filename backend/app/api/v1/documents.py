@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+import tarfile
+import zipfile
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
+from app.config import settings
 from app.database import get_db
-from app.schemas.document import DocumentCreate, DocumentUpdate, DocumentResponse, DocumentVersionResponse
+from app.schemas.document import DocumentCreate, DocumentUpdate, DocumentResponse, DocumentVersionResponse, BulkImportResponse, SimilarDocument
 from app.services.document_service import DocumentService
-from app.security import get_current_user
+from app.services.bulk_import_service import BulkImportService
+from app.services.preview_service import preview_service, PREVIEW_SIZES, PREVIEW_CONTENT_TYPE
+from app.services.similarity_service import similarity_service
+from app.tasks.document_tasks import enqueue_previews
+from app.security import get_current_user, verify_project_access
+from app.utils.helpers import encode_cursor, parse_fields
 
 router = APIRouter()
 document_service = DocumentService()
+bulk_import_service = BulkImportService()
 
 @router.post("/projects/{project_id}/documents", response_model=DocumentResponse)
 async def upload_document(
@@ -20,7 +31,7 @@ async def upload_document(
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return await document_service.upload_document(
+    document = await document_service.upload_document(
         db=db,
         project_id=project_id,
         file=file,
@@ -29,10 +40,48 @@ async def upload_document(
         description=description,
         discipline=discipline
     )
+    enqueue_previews([document.current_version_id])
+    return document
+
+@router.post("/projects/{project_id}/documents/bulk", response_model=BulkImportResponse)
+def bulk_import_documents(
+    project_id: str,
+    files: List[UploadFile] = File(...),
+    discipline: Optional[str] = Form(None),
+    unpack_archives: bool = Form(True),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Import many documents at once
+    
+    Accepts several files and/or ZIP/TAR archives (unpacked in streaming
+    mode) and returns a per-file result manifest.
+    """
+    if not verify_project_access(db, project_id, str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    try:
+        manifest = bulk_import_service.import_files(
+            db=db,
+            project_id=project_id,
+            user_id=str(current_user.id),
+            files=[(f.filename, f.file) for f in files],
+            discipline=discipline,
+            unpack_archives=unpack_archives
+        )
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {str(e)}")
+    
+    enqueue_previews([r["version_id"] for r in manifest["results"] if r["version_id"]])
+    return manifest
 
 @router.get("/documents/{document_id}", response_model=DocumentResponse)
 def get_document(document_id: str, db: Session = Depends(get_db)):
-    db_document = document_service.get_document(db, document_id=document_id)
+    try:
+        db_document = document_service.get_document_cached(db, document_id=document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
     if db_document is None:
         raise HTTPException(status_code=404, detail="Document not found")
     return db_document
@@ -40,24 +89,190 @@ def get_document(document_id: str, db: Session = Depends(get_db)):
 @router.get("/projects/{project_id}/documents", response_model=List[DocumentResponse])
 def list_project_documents(
     project_id: str,
-    skip: int = 0,
-    limit: int = 10,
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
     discipline: Optional[str] = None,
     status: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,status"),
     db: Session = Depends(get_db)
 ):
-    return document_service.list_project_documents(
-        db=db,
-        project_id=project_id,
-        skip=skip,
-        limit=limit,
-        discipline=discipline,
-        status=status
-    )
+    """
+    List project documents, newest first
+    
+    When a full page is returned, the X-Next-Cursor header (and a
+    Link rel="next" header) carries the cursor for the following page.
+    """
+    try:
+        selected = parse_fields(fields, DocumentResponse.model_fields)
+        documents = document_service.list_project_documents(
+            db=db,
+            project_id=project_id,
+            skip=skip,
+            limit=limit,
+            discipline=discipline,
+            status=status,
+            cursor=cursor,
+            fields=selected
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {}
+    if len(documents) == limit:
+        last = documents[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"]) if selected else encode_cursor(last.created_at, last.id)
+        next_url = request.url.remove_query_params(["skip", "cursor"]).include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    
+    if selected:
+        # Projected rows skip ORM hydration and response_model validation
+        rows = [{name: row[name] for name in selected} for row in documents]
+        return JSONResponse(content=jsonable_encoder(rows), headers=headers)
+    
+    response.headers.update(headers)
+    return documents
 
 @router.get("/documents/{document_id}/versions", response_model=List[DocumentVersionResponse])
 def get_document_versions(document_id: str, db: Session = Depends(get_db)):
-    return document_service.get_document_versions(db, document_id=document_id)
+    try:
+        return document_service.get_document_versions_cached(db, document_id=document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+
+@router.post("/documents/{document_id}/versions", response_model=DocumentVersionResponse)
+async def upload_document_version(
+    document_id: str,
+    file: UploadFile = File(...),
+    change_summary: Optional[str] = Form(None),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        document = document_service.get_document(db, document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+    if not document or not verify_project_access(db, str(document.project_id), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        version = await document_service.upload_new_version(
+            db=db,
+            document_id=document_id,
+            file=file,
+            user_id=str(current_user.id),
+            change_summary=change_summary
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    enqueue_previews([version.id])
+    return version
+
+@router.get("/documents/{document_id}/versions/{version_id}/content")
+def download_document_version(
+    document_id: str,
+    version_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream a version's file, reassembling it from chunks if needed"""
+    try:
+        document = document_service.get_document(db, document_id)
+        version = document_service.get_version(db, document_id, version_id) if document else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document or version ID")
+    if not version or not verify_project_access(db, str(document.project_id), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    headers = {"Content-Disposition": f'attachment; filename="{document.name}"'}
+    if version.file_size is not None:
+        headers["Content-Length"] = str(version.file_size)
+    if version.content_hash:
+        headers["ETag"] = f'"{version.content_hash}"'
+    return StreamingResponse(
+        document_service.open_version_stream(version),
+        media_type="application/octet-stream",
+        headers=headers
+    )
+
+@router.get("/documents/{document_id}/preview")
+def get_document_preview(
+    document_id: str,
+    request: Request,
+    size: str = Query("thumb", description=f"One of: {', '.join(PREVIEW_SIZES)}"),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Redirect to the current version's preview image
+    
+    The target URL contains the content hash and is cached for a year;
+    this redirect is only cached briefly, since a new version changes it.
+    """
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of: {', '.join(PREVIEW_SIZES)}")
+    try:
+        document = document_service.get_document(db, document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+    if not document or not verify_project_access(db, str(document.project_id), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    version = document_service.get_version(db, document_id, str(document.current_version_id)) if document.current_version_id else None
+    if not version or not preview_service.has_preview(version.content_hash, size):
+        raise HTTPException(status_code=404, detail="Preview not available")
+    
+    return RedirectResponse(
+        str(request.url_for(
+            "get_document_preview_image",
+            document_id=document_id,
+            content_hash=version.content_hash,
+            size=size
+        )),
+        status_code=307,
+        headers={"Cache-Control": "private, max-age=60"}
+    )
+
+@router.get("/documents/{document_id}/previews/{content_hash}/{size}", name="get_document_preview_image")
+def get_document_preview_image(
+    document_id: str,
+    content_hash: str,
+    size: str,
+    request: Request,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Serve a preview image; content-addressed, so it never changes"""
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    try:
+        document = document_service.get_document(db, document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+    if (
+        not document
+        or not verify_project_access(db, str(document.project_id), str(current_user.id))
+        or not document_service.get_document_version_by_hash(db, document_id, content_hash)
+    ):
+        raise HTTPException(status_code=404, detail="Preview not available")
+    
+    etag = f'"{content_hash}-{size}"'
+    headers = {"Cache-Control": "private, max-age=31536000, immutable", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    key = preview_service.preview_key(content_hash, size)
+    if not preview_service.storage.object_exists(key):
+        raise HTTPException(status_code=404, detail="Preview not available")
+    return StreamingResponse(
+        preview_service.storage.open_stream(key),
+        media_type=PREVIEW_CONTENT_TYPE,
+        headers=headers
+    )
 
 @router.post("/documents/{document_id}/restore/{version_id}", response_model=DocumentResponse)
 def restore_version(document_id: str, version_id: str, db: Session = Depends(get_db)):
@@ -73,7 +288,7 @@ def delete_document(document_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/documents/{document_id}/analysis")
-async def get_document_analysis(
+def get_document_analysis(
     document_id: str,
     db: Session = Depends(get_db)
 ):
@@ -82,48 +297,68 @@ async def get_document_analysis(
     
     Returns analysis if available, or status if still processing
     """
-    from app.models.document_analysis import DocumentAnalysis
-    import uuid
-    
     try:
-        # Check if analysis exists
-        analysis = db.query(DocumentAnalysis).filter(
-            DocumentAnalysis.document_id == uuid.UUID(document_id)
-        ).first()
-        
-        if not analysis:
-            # Check document status
-            from app.models.document import Document
-            document = db.query(Document).filter(
-                Document.id == uuid.UUID(document_id)
-            ).first()
-            
-            if not document:
-                raise HTTPException(status_code=404, detail="Document not found")
-            
-            return {
-                "status": "processing",
-                "message": "Analysis in progress"
-            }
-        
-        # Return analysis results
-        import json
-        
-        return {
-            "status": "completed",
-            "summary": analysis.summary,
-            "extracted_data": json.loads(analysis.extracted_data) if analysis.extracted_data else {},
-            "key_entities": analysis.key_entities or {},
-            "confidence_score": analysis.confidence_score,
-            "processing_time": analysis.processing_time,
-            "analyzed_by": analysis.analyzed_by,
-            "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else None
-        }
-        
+        result = document_service.get_analysis_result(db, document_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid document ID: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching analysis: {str(e)}")
+    
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return result
+
+
+@router.get("/documents/{document_id}/analysis/text")
+def get_document_analysis_text(
+    document_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Full extracted text of a document's analysis, with page offsets
+    
+    Kept out of GET /documents/{id}/analysis; fetch it only when needed.
+    """
+    try:
+        document = document_service.get_document(db, document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+    if not document or not verify_project_access(db, str(document.project_id), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    result = document_service.get_analysis_text(db, document_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return result
+
+
+@router.get("/documents/{document_id}/similar", response_model=List[SimilarDocument])
+def get_similar_documents(
+    document_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Documents of the same project whose analysis text is most alike
+
+    Scored by the best matching pair of text chunks, best first. Empty
+    until the document has been analyzed.
+    """
+    if not settings.SIMILARITY_ENABLED:
+        raise HTTPException(status_code=404, detail="Similar documents are disabled")
+    try:
+        document = document_service.get_document(db, document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document ID")
+    if not document or not verify_project_access(db, str(document.project_id), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    results = similarity_service.find_similar(db, document_id, limit=limit)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return results
 
 
 @router.post("/documents/{document_id}/analyze")
@@ -134,10 +369,14 @@ async def trigger_document_analysis(
     """
     Manually trigger AI analysis for a document
     
-    Useful for re-analyzing or analyzing documents that failed
+    Useful for re-analyzing or analyzing documents that failed. The job
+    jumps the queue; a document already queued or running keeps its job.
     """
     from app.models.document import Document
-    from app.tasks.ai_analysis_tasks import analyze_document_async
+    from app.services.analysis_progress import progress_publisher
+    from app.services.analysis_queue import analysis_queue
+    from app.tasks.ai_analysis_tasks import MANUAL_PRIORITY, process_analysis_jobs
+    from app.tasks.celery_app import PRIORITY_HIGH
     import uuid
     
     try:
@@ -149,17 +388,22 @@ async def trigger_document_analysis(
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # Trigger analysis task
-        file_path = f"uploads/{document.id}/{document.name}"
-        task = analyze_document_async.delay(document_id, file_path)
+        # Queue the job and start a drainer; identical content analyzed before is served from the cache
+        job_id = analysis_queue.enqueue(db, document.id, priority=MANUAL_PRIORITY)
+        db.commit()
+        progress_publisher.publish(document.id, "queued")
+        # Ahead of the drainers the beat started; any of them claims the job first
+        process_analysis_jobs.apply_async(priority=PRIORITY_HIGH)
         
         return {
-            "status": "triggered",
-            "message": "Analysis task started",
-            "task_id": task.id,
+            "status": "queued",
+            "message": "Analysis job queued",
+            "job_id": str(job_id),
             "document_id": document_id
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid document ID: {str(e)}")
     except Exception as e:
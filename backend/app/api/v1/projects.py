@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import uuid
 
 from app.database import get_db
@@ -8,12 +10,13 @@ from app.models.project import Project, ProjectMember, ProjectStatusEnum
 from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse, ProjectMemberResponse
 from app.services.project_service import ProjectService
 from app.security import get_current_user, verify_project_access
+from app.utils.helpers import parse_fields
 
 router = APIRouter()
 project_service = ProjectService()
 
 # CREATE Project
- @router.post("/projects", response_model=ProjectResponse)
+@router.post("/projects", response_model=ProjectResponse)
 async def create_project(
     project_data: ProjectCreate,
     current_user = Depends(get_current_user),
@@ -30,24 +33,32 @@ async def create_project(
     return new_project
 
 # READ Projects
- @router.get("/projects", response_model=List[ProjectResponse])
+@router.get("/projects", response_model=List[ProjectResponse])
 async def list_projects(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,status"),
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """List all projects for current user"""
+    try:
+        selected = parse_fields(fields, ProjectResponse.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     projects = project_service.list_user_projects(
         db=db,
-        user_id=current_user.id,
+        user_id=str(current_user.id),
         skip=skip,
-        limit=limit
+        limit=limit,
+        fields=selected
     )
+    if selected:
+        return JSONResponse(content=jsonable_encoder(projects))
     return projects
 
 # READ Single Project
- @router.get("/projects/{project_id}", response_model=ProjectResponse)
+@router.get("/projects/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: str,
     current_user = Depends(get_current_user),
@@ -60,7 +71,7 @@ async def get_project(
     return project
 
 # UPDATE Project
- @router.put("/projects/{project_id}", response_model=ProjectResponse)
+@router.put("/projects/{project_id}", response_model=ProjectResponse)
 async def update_project(
     project_id: str,
     project_data: ProjectUpdate,
@@ -76,7 +87,7 @@ async def update_project(
     return updated
 
 # DELETE Project
- @router.delete("/projects/{project_id}")
+@router.delete("/projects/{project_id}")
 async def delete_project(
     project_id: str,
     current_user = Depends(get_current_user),
@@ -91,7 +102,7 @@ async def delete_project(
     return {"message": "Project deleted successfully"}
 
 # ADD Member to Project
- @router.post("/projects/{project_id}/members")
+@router.post("/projects/{project_id}/members")
 async def add_project_member(
     project_id: str,
     member_email: str,
@@ -108,7 +119,7 @@ async def add_project_member(
     return {"message": "Member added", "member": member}
 
 # LIST Project Members
- @router.get("/projects/{project_id}/members", response_model=List[ProjectMemberResponse])
+@router.get("/projects/{project_id}/members", response_model=List[ProjectMemberResponse])
 async def list_project_members(
     project_id: str,
     current_user = Depends(get_current_user),
@@ -123,7 +134,7 @@ async def list_project_members(
     return members
 
 # REMOVE Member from Project
- @router.delete("/projects/{project_id}/members/{user_id}")
+@router.delete("/projects/{project_id}/members/{user_id}")
 async def remove_project_member(
     project_id: str,
     user_id: str,
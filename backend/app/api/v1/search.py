@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas.search import SearchResponse
+from app.services.search_service import search_service
+from app.security import get_current_user, verify_project_access
+
+router = APIRouter()
+
+# Ranked results are paged by offset; deep pages get expensive, and
+# nobody reads past the first few hundred hits
+MAX_SEARCH_OFFSET = 1000
+
+@router.get("/projects/{project_id}/search", response_model=SearchResponse)
+def search_project_documents(
+    project_id: str,
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Full-text search over document names, descriptions and analysis text
+
+    Results are ranked best first and carry a highlighted snippet. When
+    more results exist, next_offset is set and a Link rel="next" header
+    points at the following page.
+    """
+    try:
+        if not verify_project_access(db, project_id, str(current_user.id)):
+            raise HTTPException(status_code=404, detail="Project not found")
+        results = search_service.search(db, project_id=project_id, query=q, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if results["next_offset"] is not None and results["next_offset"] <= MAX_SEARCH_OFFSET:
+        next_url = request.url.include_query_params(offset=results["next_offset"])
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return results
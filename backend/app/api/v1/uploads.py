@@ -0,0 +1,186 @@
+"""
+Resumable Upload Endpoints
+
+tus-style protocol (https://tus.io/protocols/resumable-upload):
+
+    POST   /projects/{project_id}/uploads   create session (Upload-Length, Upload-Metadata)
+    HEAD   /uploads/{upload_id}             current Upload-Offset
+    PATCH  /uploads/{upload_id}             append chunk at Upload-Offset
+    POST   /uploads/{upload_id}/finalize    create Document/DocumentVersion
+    DELETE /uploads/{upload_id}             abort
+"""
+import base64
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+
+from app.config import settings
+from app.database import get_db
+from app.schemas.document import DocumentResponse
+from app.services.upload_service import UploadService, UploadConflictError
+from app.security import get_current_user, verify_project_access
+from app.tasks.document_tasks import enqueue_previews
+
+router = APIRouter()
+upload_service = UploadService()
+
+TUS_VERSION = "1.0.0"
+TUS_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+def _parse_upload_metadata(header: Optional[str]) -> Dict[str, str]:
+    """Decode a tus Upload-Metadata header ("key base64value,key2 base64value2")"""
+    metadata = {}
+    if not header:
+        return metadata
+    for pair in header.split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for '{parts[0]}'")
+    return metadata
+
+
+def _progress_headers(session) -> Dict[str, str]:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(session.upload_offset),
+        "Upload-Length": str(session.upload_length),
+        "Upload-Expires": session.expires_at.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Cache-Control": "no-store",
+    }
+
+
+def _get_owned_session(db: Session, upload_id: str, current_user):
+    try:
+        session = upload_service.get_session(db, upload_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid upload ID")
+    if not session or session.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@router.post("/projects/{project_id}/uploads", status_code=201)
+def create_upload(
+    project_id: str,
+    request: Request,
+    upload_length: int = Header(..., alias="Upload-Length"),
+    upload_metadata: Optional[str] = Header(None, alias="Upload-Metadata"),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a resumable upload session"""
+    if not verify_project_access(db, project_id, str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    metadata = _parse_upload_metadata(upload_metadata)
+    filename = metadata.get("filename")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Upload-Metadata must include a filename")
+
+    try:
+        session = upload_service.create_session(
+            db=db,
+            project_id=project_id,
+            user_id=str(current_user.id),
+            upload_length=upload_length,
+            filename=filename,
+            name=metadata.get("name"),
+            description=metadata.get("description"),
+            discipline=metadata.get("discipline"),
+            content_type=metadata.get("filetype") or metadata.get("content_type")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413 if "maximum size" in str(e) else 400, detail=str(e))
+
+    headers = _progress_headers(session)
+    headers["Location"] = str(request.url_for("get_upload_offset", upload_id=str(session.id)))
+    return Response(status_code=201, headers=headers)
+
+
+@router.head("/uploads/{upload_id}", name="get_upload_offset")
+def get_upload_offset(
+    upload_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Report how many bytes have been received"""
+    session = _get_owned_session(db, upload_id, current_user)
+    return Response(status_code=200, headers=_progress_headers(session))
+
+
+@router.patch("/uploads/{upload_id}")
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    content_type: Optional[str] = Header(None, alias="Content-Type"),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Append a chunk starting at Upload-Offset"""
+    if content_type != TUS_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {TUS_CONTENT_TYPE}")
+
+    # Database and storage calls block; keep them off the event loop
+    await run_in_threadpool(_get_owned_session, db, upload_id, current_user)
+
+    # Read the chunk incrementally so oversized bodies are rejected early
+    buffer = bytearray()
+    async for piece in request.stream():
+        buffer.extend(piece)
+        if len(buffer) > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunks may not exceed {settings.UPLOAD_CHUNK_MAX_SIZE} bytes"
+            )
+
+    try:
+        session = await run_in_threadpool(upload_service.append_chunk, db, upload_id, upload_offset, bytes(buffer))
+    except UploadConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(status_code=204, headers=_progress_headers(session))
+
+
+@router.post("/uploads/{upload_id}/finalize", response_model=DocumentResponse)
+def finalize_upload(
+    upload_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Turn a completed upload into a Document"""
+    _get_owned_session(db, upload_id, current_user)
+    try:
+        document = upload_service.finalize(db, upload_id)
+    except UploadConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    enqueue_previews([document.current_version_id])
+    return document
+
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+def abort_upload(
+    upload_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Abort an upload and discard received chunks"""
+    _get_owned_session(db, upload_id, current_user)
+    try:
+        upload_service.abort(db, upload_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(status_code=204, headers={"Tus-Resumable": TUS_VERSION})
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.database import get_db
 from app.schemas.workflow import RFICreate, RFIUpdate, RFIResponse, TransmittalCreate, TransmittalUpdate, TransmittalResponse
 from app.services.workflow_service import WorkflowService
 from app.security import get_current_user
+from app.utils.helpers import parse_fields
 
 router = APIRouter()
 workflow_service = WorkflowService()
@@ -25,8 +28,19 @@ def create_rfi(
     )
 
 @router.get("/projects/{project_id}/rfis", response_model=List[RFIResponse])
-def list_project_rfis(project_id: str, db: Session = Depends(get_db)):
-    return workflow_service.list_project_rfis(db, project_id=project_id)
+def list_project_rfis(
+    project_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,title,status"),
+    db: Session = Depends(get_db)
+):
+    try:
+        selected = parse_fields(fields, RFIResponse.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rfis = workflow_service.list_project_rfis(db, project_id=project_id, fields=selected)
+    if selected:
+        return JSONResponse(content=jsonable_encoder(rfis))
+    return rfis
 
 @router.get("/rfis/{rfi_id}", response_model=RFIResponse)
 def get_rfi(rfi_id: str, db: Session = Depends(get_db)):
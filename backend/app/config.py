@@ -24,10 +24,116 @@ class Settings(BaseSettings):
     AWS_S3_BUCKET: str = os.getenv("AWS_S3_BUCKET", "projectwise-documents")
     AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
     
+    # Storage
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "s3")  # s3, local
+    STORAGE_PATH: str = os.getenv("STORAGE_PATH", "./uploads")  # Root for the local backend
+    
+    # Resumable uploads
+    UPLOAD_MAX_SIZE: int = int(os.getenv("UPLOAD_MAX_SIZE", str(50 * 1024 ** 3)))  # 50 GiB
+    UPLOAD_CHUNK_MIN_SIZE: int = 5 * 1024 * 1024  # S3 multipart minimum (all parts but the last)
+    UPLOAD_CHUNK_MAX_SIZE: int = int(os.getenv("UPLOAD_CHUNK_MAX_SIZE", str(64 * 1024 * 1024)))
+    UPLOAD_SESSION_TTL_HOURS: int = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+    
+    # Bulk import
+    BULK_IMPORT_CONCURRENCY: int = int(os.getenv("BULK_IMPORT_CONCURRENCY", "16"))  # Parallel storage uploads
+    BULK_IMPORT_BATCH_SIZE: int = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))  # Rows per INSERT batch
+    BULK_IMPORT_MAX_BUFFERED_SIZE: int = 8 * 1024 * 1024  # Larger entries are streamed, not buffered
+    
+    # Version storage
+    DOCUMENT_STORAGE_MODE: str = os.getenv("DOCUMENT_STORAGE_MODE", "full")  # "full" or "chunked" (opt in; versions then share unchanged chunks)
+    CHUNK_MIN_SIZE: int = int(os.getenv("CHUNK_MIN_SIZE", str(64 * 1024)))
+    CHUNK_AVG_SIZE: int = int(os.getenv("CHUNK_AVG_SIZE", str(256 * 1024)))  # Power of two
+    CHUNK_MAX_SIZE: int = int(os.getenv("CHUNK_MAX_SIZE", str(1024 * 1024)))
+    CHUNK_UPLOAD_CONCURRENCY: int = int(os.getenv("CHUNK_UPLOAD_CONCURRENCY", "8"))
+    
+    # Text extraction
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", "0"))  # Process pool size; 0 = CPU count, 1 = no pool
+    EXTRACTION_DOCUMENT_PARALLELISM: int = int(os.getenv("EXTRACTION_DOCUMENT_PARALLELISM", "4"))  # Page ranges in flight per document
+    EXTRACTION_PAGES_PER_TASK: int = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "16"))
+    EXTRACTION_PARALLEL_MIN_PAGES: int = 64  # Smaller PDFs are parsed in-process
+    EXTRACTION_PARALLEL_MIN_CHARS: int = 200_000  # Smaller budgets finish within the first pages
+    
+    # AI backend
+    AI_BACKEND: str = os.getenv("AI_BACKEND", "gemini")  # gemini, fake, http
+    AI_BACKEND_URL: str = os.getenv("AI_BACKEND_URL", "")  # http backend endpoint
+    AI_BACKEND_MODEL: str = os.getenv("AI_BACKEND_MODEL", "http-llm")  # Reported, and part of cache keys
+    AI_FAKE_LATENCY_MS: float = float(os.getenv("AI_FAKE_LATENCY_MS", "800"))  # Median
+    AI_FAKE_LATENCY_SIGMA: float = float(os.getenv("AI_FAKE_LATENCY_SIGMA", "0.5"))  # Log-normal spread
+    AI_FAKE_ERROR_RATE: float = float(os.getenv("AI_FAKE_ERROR_RATE", "0"))
+    AI_FAKE_RESPONSE_SHAPE: str = os.getenv("AI_FAKE_RESPONSE_SHAPE", "markdown")  # json, markdown, text, mixed
+    AI_FAKE_SEED: int = int(os.getenv("AI_FAKE_SEED", "0"))
+    
+    # LLM client
+    LLM_REQUESTS_PER_MINUTE: int = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))  # Quota shared by all workers
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # In-flight requests per event loop
+    LLM_MAX_OUTPUT_TOKENS: int = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "1024"))  # Reserved per request until usage is known
+    LLM_REQUEST_TIMEOUT_SECONDS: float = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    LLM_BACKOFF_BASE_SECONDS: float = 1.0
+    LLM_BACKOFF_MAX_SECONDS: float = 60.0
+    
+    # Chunked (map-reduce) analysis of long documents
+    ANALYSIS_MAX_CHARS: int = int(os.getenv("ANALYSIS_MAX_CHARS", "400000"))  # Text read for analysis, ~100k tokens
+    ANALYSIS_STORED_TEXT_CHARS: int = int(os.getenv("ANALYSIS_STORED_TEXT_CHARS", "400000"))  # Extracted text kept per analysis, compressed
+    ANALYSIS_TEXT_CODEC: str = os.getenv("ANALYSIS_TEXT_CODEC", "zstd")  # zstd (falls back to zlib without zstandard), zlib or none
+    ANALYSIS_CHUNK_TOKENS: int = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "2500"))  # Prompt text per chunk
+    ANALYSIS_MAX_ENTITIES_PER_TYPE: int = 50  # Merged entities kept per category
+    
+    # Analysis job queue
+    ANALYSIS_JOB_BATCH_SIZE: int = int(os.getenv("ANALYSIS_JOB_BATCH_SIZE", "4"))  # Jobs claimed at a time
+    ANALYSIS_JOB_LEASE_SECONDS: int = int(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "300"))  # Renewed every third of it
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "5"))
+    ANALYSIS_ENQUEUE_BATCH_SIZE: int = int(os.getenv("ANALYSIS_ENQUEUE_BATCH_SIZE", "1000"))  # Documents queued per scan
+    ANALYSIS_QUEUE_DRAINERS: int = int(os.getenv("ANALYSIS_QUEUE_DRAINERS", "4"))  # Drain tasks kept running
+    ANALYSIS_DRAIN_SECONDS: int = int(os.getenv("ANALYSIS_DRAIN_SECONDS", "50"))  # A drain task claims no new batch after this; beat starts drainers every minute
+    
+    # Live analysis progress (Redis pub/sub to WebSocket and SSE clients)
+    ANALYSIS_PROGRESS_MIN_INTERVAL_SECONDS: float = 0.5  # Between page or chunk count events
+    ANALYSIS_PROGRESS_TTL_SECONDS: int = 3600  # Latest event kept for clients connecting later
+    ANALYSIS_PROGRESS_KEEPALIVE_SECONDS: float = float(os.getenv("ANALYSIS_PROGRESS_KEEPALIVE_SECONDS", "15"))  # Idle streams re-check the result
+    
+    # Retention
+    # Soft-deleted documents are archived after this many days; keep it
+    # longer than any KPI window that counts deleted uploads
+    DOCUMENT_RETENTION_DAYS: int = int(os.getenv("DOCUMENT_RETENTION_DAYS", "90"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))  # Documents per transaction
+    
+    # Search
+    SEARCH_MAX_BODY_CHARS: int = int(os.getenv("SEARCH_MAX_BODY_CHARS", "500000"))  # Keeps tsvectors under the 1 MB limit
+    SEARCH_HEADLINE_CHARS: int = 100_000  # Text scanned when building a snippet
+    
+    # Similar documents (local vector index per project)
+    SIMILARITY_ENABLED: bool = os.getenv("SIMILARITY_ENABLED", "true").lower() == "true"
+    SIMILARITY_EMBEDDER: str = os.getenv("SIMILARITY_EMBEDDER", "hashing")
+    SIMILARITY_DIM: int = int(os.getenv("SIMILARITY_DIM", "512"))  # Power of two; changing it rebuilds the indexes
+    SIMILARITY_INDEX_PATH: str = os.getenv("SIMILARITY_INDEX_PATH", "./similarity_index")  # Ignored by git; point it at a data volume in production
+    SIMILARITY_CHUNK_CHARS: int = int(os.getenv("SIMILARITY_CHUNK_CHARS", "1000"))  # Text embedded per vector
+    SIMILARITY_MAX_CHUNKS: int = int(os.getenv("SIMILARITY_MAX_CHUNKS", "2000"))  # Per document
+    SIMILARITY_IVF_MIN_VECTORS: int = int(os.getenv("SIMILARITY_IVF_MIN_VECTORS", "20000"))  # Smaller indexes are searched exhaustively
+    SIMILARITY_IVF_PROBES: int = int(os.getenv("SIMILARITY_IVF_PROBES", "12"))  # Lists scanned per search; more is slower but closer to exact
+    
+    # Celery (queues, routes and worker profiles in app.tasks.celery_app)
+    CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+    CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+    WORKER_ANALYSIS_CONCURRENCY: int = int(os.getenv("WORKER_ANALYSIS_CONCURRENCY", "8"))  # Threads; keep above ANALYSIS_QUEUE_DRAINERS so manual runs start at once
+    WORKER_CPU_CONCURRENCY: int = int(os.getenv("WORKER_CPU_CONCURRENCY", "0"))  # Processes; 0 = CPU count
+    WORKER_BACKGROUND_CONCURRENCY: int = int(os.getenv("WORKER_BACKGROUND_CONCURRENCY", "2"))
+    TASK_LOCK_TTL_SECONDS: int = int(os.getenv("TASK_LOCK_TTL_SECONDS", "120"))  # Renewed while the task runs; frees a dead worker's lock
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))  # Prometheus endpoint of a worker; 0 = off
+    
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))  # Seconds; caches fall back to the DB
+    
+    # Metadata cache
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", "300"))  # Redis tier
+    CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))  # Bounds staleness on other processes
+    CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "10000"))
+    CACHE_LOCK_TIMEOUT_MS: int = 5000  # Longest a miss waits for another process's load
     
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
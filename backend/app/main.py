@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import logging
 
-from app.api.v1 import auth, users, projects, documents, comments, workflows, notifications, dashboards
+from app.api.v1 import auth, users, projects, documents, comments, workflows, notifications, dashboards, uploads, search, analysis
 from app.config import settings
 from app.database import engine
 from app.models import Base
@@ -26,6 +26,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination and resumable-upload state travel in response headers
+    expose_headers=["X-Next-Cursor", "Link", "Location", "Upload-Offset", "Upload-Length", "Tus-Resumable"],
 )
 
 # Logging
@@ -41,9 +43,12 @@ app.include_router(comments.router, prefix="/api/v1", tags=["comments"])
 app.include_router(workflows.router, prefix="/api/v1", tags=["workflows"])
 app.include_router(notifications.router, prefix="/api/v1", tags=["notifications"])
 app.include_router(dashboards.router, prefix="/api/v1", tags=["dashboards"])
+app.include_router(uploads.router, prefix="/api/v1", tags=["uploads"])
+app.include_router(search.router, prefix="/api/v1", tags=["search"])
+app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
 
 # WebSocket endpoints
- @app.websocket("/ws/documents/{document_id}")
+@app.websocket("/ws/documents/{document_id}")
 async def websocket_document_endpoint(websocket, document_id: str):
     await manager.connect(websocket, document_id)
     try:
@@ -54,11 +59,11 @@ async def websocket_document_endpoint(websocket, document_id: str):
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(document_id, websocket)
 
- @app.get("/")
+@app.get("/")
 async def root():
     return {"message": "ProjectWise Modern API", "version": "1.0.0"}
 
- @app.get("/health")
+@app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
@@ -5,4 +5,12 @@ from .document import Document, DocumentVersion
 from .comment import Comment
 from .workflow import RFI, Transmittal, WorkflowTemplate
 from .notification import Notification
-from .kpi import KPIMetric, KPIHistory, DashboardAlert
\ No newline at end of file
+from .kpi import KPIMetric, KPIHistory, DashboardAlert
+from .upload_session import UploadSession
+from .chunk import StorageChunk
+from .search import DocumentSearchEntry
+from .archive import DocumentArchive
+from .document_analysis import DocumentAnalysis, DocumentAnalysisText
+from .analysis_cache import AnalysisCacheEntry, AnalysisChunkCacheEntry
+from .analysis_job import AnalysisJob
+from .task_fence import TaskFence
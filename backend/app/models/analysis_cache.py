@@ -0,0 +1,70 @@
+from datetime import datetime
+import uuid
+from typing import Optional
+from sqlalchemy import Column, String, UUID, DateTime, Float, Integer, Boolean, LargeBinary, JSON, UniqueConstraint
+from sqlalchemy.orm import deferred
+from .base import Base
+from app.utils.compression import decompress_text
+
+class AnalysisCacheEntry(Base):
+    """
+    Extraction and AI analysis result for a file's content
+
+    Keyed by content hash plus the versions of everything that shaped the
+    result, so identical bytes (re-uploads, restored versions, copies in
+    other projects) are analyzed once, and changing the extractor, model
+    or prompt naturally misses.
+    """
+    __tablename__ = "analysis_cache"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 hex of the file
+    extractor_version = Column(String(32), nullable=False)
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(32), nullable=False)
+
+    # Extraction
+    text_codec = Column(String(16))  # zstd, zlib or none; compressed like document_analysis_text
+    text_data = deferred(Column(LargeBinary))
+    page_offsets = Column(JSON)
+    pages_read = Column(Integer)
+    truncated = Column(Boolean, default=False)
+
+    # Parsed model response: summary, extracted_data, key_entities, confidence_score
+    result = Column(JSON, nullable=False)
+
+    # Cost of producing the entry, saved again on every hit
+    processing_time = Column(Float)  # seconds
+    prompt_chars = Column(Integer)
+
+    hit_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint('content_hash', 'extractor_version', 'model', 'prompt_version', name='uq_analysis_cache_key'),
+    )
+
+    @property
+    def extracted_text(self) -> Optional[str]:
+        """Extracted text, loaded and decompressed on first access"""
+        if self.text_data is None:
+            return None
+        return decompress_text(self.text_codec, self.text_data)
+
+class AnalysisChunkCacheEntry(Base):
+    """
+    Model result for one chunk of a long document's text
+
+    Chunked analysis maps every chunk separately; keyed by the chunk's
+    text, so re-analyzing an edited document only calls the model for
+    the chunks whose text changed.
+    """
+    __tablename__ = "analysis_chunk_cache"
+
+    chunk_hash = Column(String(64), primary_key=True)  # SHA-256 of file type and chunk text
+    model = Column(String(100), primary_key=True)
+    prompt_version = Column(String(32), primary_key=True)
+    result = Column(JSON, nullable=False)  # summary, extracted_data, key_entities, confidence_score
+    prompt_chars = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
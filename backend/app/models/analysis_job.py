@@ -0,0 +1,60 @@
+import enum
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, UUID, DateTime, Integer, ForeignKey, Text, Index, text
+from .base import Base
+
+class AnalysisJobStatusEnum(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class AnalysisJob(Base):
+    """
+    Durable analysis work item
+
+    Workers claim queued jobs in batches with SELECT ... FOR UPDATE SKIP
+    LOCKED and hold them under a lease they renew with heartbeats. A job
+    whose lease ran out (its worker died) is claimed again until
+    max_attempts; a finished job is only recorded by the worker still
+    holding the lease.
+    """
+    __tablename__ = "analysis_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False, default=AnalysisJobStatusEnum.QUEUED)
+    priority = Column(Integer, nullable=False, default=0)  # Higher is claimed first
+
+    # Attempts and retry scheduling
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+
+    # Lease held by the claiming worker
+    leased_by = Column(String(255))
+    lease_expires_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # At most one open job per document, so enqueueing twice is a no-op
+        Index(
+            'uq_analysis_jobs_open_document', 'document_id',
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')")
+        ),
+        # Claim order over open jobs only
+        Index(
+            'idx_analysis_jobs_claim', 'status', 'priority', 'created_at',
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')")
+        ),
+        Index('idx_analysis_jobs_document', 'document_id'),
+    )
@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, UUID, DateTime, JSON, Index
+from .base import Base
+
+class DocumentArchive(Base):
+    """
+    Long-deleted document moved out of the live tables
+
+    payload keeps the document row and its versions, comments and
+    analysis as JSON, so a document can still be audited or restored
+    by hand after its storage has been reclaimed.
+    """
+    __tablename__ = "document_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)  # Original document ID
+    project_id = Column(UUID(as_uuid=True), nullable=False)  # No FK: projects may be removed later
+    name = Column(String(255))
+    deleted_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    payload = Column(JSON, nullable=False)  # {"document": {...}, "versions": [...], "comments": [...], "analysis": [...]}
+
+    __table_args__ = (
+        Index('idx_document_archive_project_archived', 'project_id', 'archived_at'),
+    )
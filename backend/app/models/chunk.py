@@ -0,0 +1,17 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, BigInteger, Integer
+from .base import Base
+
+class StorageChunk(Base):
+    """
+    Content-defined chunk shared by chunked document versions
+
+    Stored once under chunks/<hash> however many versions contain it;
+    ref_count is the number of versions whose manifest lists it.
+    """
+    __tablename__ = "storage_chunks"
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 hex of the chunk bytes
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,7 +1,7 @@
 import enum
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, UUID, DateTime, Integer, ForeignKey, Boolean, Enum, Text
+from sqlalchemy import Column, String, UUID, DateTime, Integer, ForeignKey, Boolean, Enum, Text, Index, UniqueConstraint, JSON, text
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -19,6 +19,10 @@ class FileTypeEnum(str, enum.Enum):
     TXT = "txt"
     IMAGE = "image"
 
+class StorageModeEnum(str, enum.Enum):
+    FULL = "full"  # Whole file at file_path
+    CHUNKED = "chunked"  # Content-defined chunks listed in chunk_manifest
+
 class Document(Base):
     __tablename__ = "documents"
     
@@ -30,6 +34,7 @@ class Document(Base):
     discipline = Column(String(100))
     status = Column(String(50), default=DocumentStatusEnum.DRAFT)
     current_version_id = Column(UUID(as_uuid=True), ForeignKey("document_versions.id"))
+    version_counter = Column(Integer, nullable=False, default=0, server_default="0")  # Last allocated version_number
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -37,8 +42,35 @@ class Document(Base):
     
     # Relationships
     project = relationship("Project", back_populates="documents")
-    versions = relationship("DocumentVersion", back_populates="document", cascade="all, delete-orphan")
+    versions = relationship("DocumentVersion", back_populates="document", foreign_keys="DocumentVersion.document_id", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="document", cascade="all, delete-orphan")
+    
+    # Keyset pagination indexes over live rows only, matching the
+    # (created_at, id) ordering of list_project_documents
+    __table_args__ = (
+        Index(
+            'idx_documents_project_created_live', 'project_id', 'created_at', 'id',
+            postgresql_where=text('deleted_at IS NULL'),
+            postgresql_include=['name', 'status', 'discipline', 'file_type'],
+            sqlite_where=text('deleted_at IS NULL')
+        ),
+        Index(
+            'idx_documents_project_discipline_created_live', 'project_id', 'discipline', 'created_at', 'id',
+            postgresql_where=text('deleted_at IS NULL'),
+            sqlite_where=text('deleted_at IS NULL')
+        ),
+        Index(
+            'idx_documents_project_status_created_live', 'project_id', 'status', 'created_at', 'id',
+            postgresql_where=text('deleted_at IS NULL'),
+            sqlite_where=text('deleted_at IS NULL')
+        ),
+        # Retention scans deleted rows only, so the index stays tiny
+        Index(
+            'idx_documents_deleted_at', 'deleted_at',
+            postgresql_where=text('deleted_at IS NOT NULL'),
+            sqlite_where=text('deleted_at IS NOT NULL')
+        ),
+    )
 
 class DocumentVersion(Base):
     __tablename__ = "document_versions"
@@ -48,9 +80,16 @@ class DocumentVersion(Base):
     version_number = Column(Integer, nullable=False)
     file_path = Column(String(500), nullable=False)  # S3 URL
     file_size = Column(Integer)  # in bytes
+    content_hash = Column(String(64))  # SHA-256 of the full file
+    storage_mode = Column(String(20), nullable=False, default=StorageModeEnum.FULL, server_default="full")
+    chunk_manifest = Column(JSON)  # [[chunk_hash, size], ...] when chunked
     uploader_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     change_summary = Column(String(500))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
-    document = relationship("Document", back_populates="versions")
\ No newline at end of file
+    document = relationship("Document", back_populates="versions", foreign_keys=[document_id])
+    
+    __table_args__ = (
+        UniqueConstraint('document_id', 'version_number', name='uq_document_versions_document_version'),
+    )
\ No newline at end of file
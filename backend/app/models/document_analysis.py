@@ -1,9 +1,11 @@
 import enum
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, UUID, DateTime, Float, ForeignKey, Text, JSON
-from sqlalchemy.orm import relationship
+from typing import Optional
+from sqlalchemy import Column, String, UUID, DateTime, Float, ForeignKey, Integer, LargeBinary, Text, JSON
+from sqlalchemy.orm import deferred, relationship
 from .base import Base
+from app.utils.compression import compress_text, decompress_text
 
 class DocumentAnalysis(Base):
     __tablename__ = "document_analysis"
@@ -14,16 +16,75 @@ class DocumentAnalysis(Base):
     # AI Analysis Results
     summary = Column(Text)  # 3-sentence summary
     extracted_data = Column(Text)  # Key data extracted
-    ocr_text = Column(Text)  # Full OCR text
+    _ocr_text = deferred(Column("ocr_text", Text))  # Inline text of analyses stored before document_analysis_text
+    page_offsets = deferred(Column(JSON))  # Start offset of each page within ocr_text
     key_entities = Column(JSON)  # {persons, companies, dates, etc}
     
     # Quality Metrics
     confidence_score = Column(Float)  # 0-1 confidence
     processing_time = Column(Float)  # seconds
     
+    # Where the time went (see app.services.analysis_metrics); null for
+    # cache hits and analyses stored before these were recorded
+    cache_status = Column(String(20))  # hit, extraction_hit or miss
+    fetch_seconds = Column(Float)
+    extract_seconds = Column(Float)
+    llm_seconds = Column(Float)
+    parse_seconds = Column(Float)
+    pages_read = Column(Integer)
+    input_chars = Column(Integer)
+    llm_calls = Column(Integer)
+    prompt_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    
     # Traceability
     analyzed_by = Column(String(100))  # AI model version
     analyzed_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     document = relationship("Document", backref="analysis")
+    stored_text = relationship(
+        "DocumentAnalysisText",
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    
+    @property
+    def ocr_text(self) -> Optional[str]:
+        """Extracted text, loaded and decompressed on first access"""
+        if self.stored_text is not None:
+            return self.stored_text.text
+        return self._ocr_text
+    
+    @ocr_text.setter
+    def ocr_text(self, value: Optional[str]):
+        self._ocr_text = None
+        if not value:
+            self.stored_text = None
+            return
+        codec, data = compress_text(value)
+        if self.stored_text is None:
+            self.stored_text = DocumentAnalysisText()
+        self.stored_text.codec = codec
+        self.stored_text.data = data
+        self.stored_text.chars = len(value)
+
+class DocumentAnalysisText(Base):
+    """
+    Compressed extracted text of an analysis
+    
+    Kept out of document_analysis so that analysis lookups (summaries,
+    scores, dashboards) never read it; it is only loaded through
+    DocumentAnalysis.ocr_text.
+    """
+    __tablename__ = "document_analysis_text"
+    
+    analysis_id = Column(UUID(as_uuid=True), ForeignKey("document_analysis.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String(16), nullable=False)  # zstd, zlib or none
+    data = Column(LargeBinary, nullable=False)
+    chars = Column(Integer, nullable=False)  # Length of the decompressed text
+    
+    @property
+    def text(self) -> str:
+        return decompress_text(self.codec, self.data)
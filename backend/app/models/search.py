@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Column, String, UUID, DateTime, ForeignKey, Text, Index
+from .base import Base
+
+class DocumentSearchEntry(Base):
+    """
+    Text indexed for full-text search, one row per document
+
+    On PostgreSQL the table also has a generated, GIN-indexed
+    search_vector tsvector column (see migration 006). It is left out
+    of the model because it is computed by the database. SQLite keeps
+    the same text in an FTS5 table instead (see SearchService).
+    """
+    __tablename__ = "document_search"
+
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(255))
+    description = Column(String(1000))
+    summary = Column(Text)
+    body = Column(Text)  # Extracted text, truncated to SEARCH_MAX_BODY_CHARS
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_document_search_project', 'project_id'),
+    )
@@ -0,0 +1,18 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, BigInteger
+from .base import Base
+
+class TaskFence(Base):
+    """
+    Highest fencing token that wrote under a task lock
+
+    A run holding a task lock (app.services.task_lock) records its token
+    here in the same transaction as its writes. A token lower than the
+    stored one belongs to a run whose lock expired and was taken over,
+    so its transaction is rolled back instead of committed.
+    """
+    __tablename__ = "task_fences"
+
+    key = Column(String(200), primary_key=True)  # Lock key, e.g. kpi:project:<uuid>
+    token = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,47 @@
+import enum
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, UUID, DateTime, BigInteger, ForeignKey, JSON, Index
+from .base import Base
+
+class UploadSessionStatusEnum(str, enum.Enum):
+    ACTIVE = "active"
+    COMPLETED = "completed"
+    ABORTED = "aborted"
+
+class UploadSession(Base):
+    """
+    Resumable (tus-style) upload in progress
+
+    Chunk state lives here rather than in API process memory, so any
+    node can accept the next PATCH for a session.
+    """
+    __tablename__ = "upload_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+
+    # Target document metadata
+    filename = Column(String(255), nullable=False)
+    name = Column(String(255))
+    description = Column(String(1000))
+    discipline = Column(String(100))
+    content_type = Column(String(255))
+
+    # Progress
+    upload_length = Column(BigInteger, nullable=False)  # Declared total size in bytes
+    upload_offset = Column(BigInteger, nullable=False, default=0)  # Bytes received so far
+    storage_key = Column(String(500), nullable=False)
+    storage_upload_id = Column(String(255), nullable=False)  # Multipart upload ID
+    parts = Column(JSON, default=list)  # [{"PartNumber": 1, "ETag": "..."}]
+
+    status = Column(String(50), nullable=False, default=UploadSessionStatusEnum.ACTIVE)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=True)  # Set on finalize
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_upload_sessions_status_expires', 'status', 'expires_at'),
+    )
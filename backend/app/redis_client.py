@@ -0,0 +1,29 @@
+"""
+Shared Redis connection
+
+One connection pool per process, created on first use so importing the
+app never needs a running Redis.
+"""
+import threading
+
+import redis
+
+from app.config import settings
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide Redis client"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30
+                )
+    return _client
@@ -0,0 +1,47 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+class AnalysisCacheStats(BaseModel):
+    entries: int
+    hits: int
+    misses: int  # Analyses that called the model and were cached
+    hit_rate: float
+    llm_calls_saved: int
+    processing_seconds_saved: float
+    prompt_tokens_saved: int  # Estimated from prompt length
+
+class LLMMinuteUsage(BaseModel):
+    requests: int
+    tokens: int
+
+class LLMUsage(BaseModel):
+    requests_per_minute_limit: int
+    tokens_per_minute_limit: int
+    shared: bool  # False while Redis is unavailable and limits are per process
+    current_minute: LLMMinuteUsage
+    previous_minute: LLMMinuteUsage
+
+class AnalysisQueueStats(BaseModel):
+    queued: int  # Including jobs waiting out a retry backoff
+    running: int
+    succeeded: int
+    failed: int
+    expired_leases: int  # Running jobs whose worker stopped heartbeating
+    oldest_queued_seconds: float  # Age of the oldest job that is due
+
+class Percentiles(BaseModel):
+    p50: Optional[float] = None  # None without samples
+    p95: Optional[float] = None
+
+class AnalysisTimingStats(BaseModel):
+    analyses: int  # That ran, excluding cache hits
+    total: Percentiles  # Seconds
+    fetch: Percentiles
+    extract: Percentiles
+    llm: Percentiles  # Including waits for the model quota
+    parse: Percentiles
+    pages_read: Percentiles
+    input_chars: Percentiles
+    prompt_tokens: Percentiles
+    output_tokens: Percentiles
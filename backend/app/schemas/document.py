@@ -34,9 +34,35 @@ class DocumentVersionResponse(BaseModel):
     version_number: int
     file_path: str
     file_size: int
+    content_hash: Optional[str] = None
+    storage_mode: str = "full"
     uploader_id: uuid.UUID
     change_summary: str
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+class BulkImportFileResult(BaseModel):
+    filename: str
+    status: str  # created, failed
+    document_id: Optional[uuid.UUID] = None
+    version_id: Optional[uuid.UUID] = None
+    size: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkImportResponse(BaseModel):
+    project_id: uuid.UUID
+    total: int
+    created: int
+    failed: int
+    results: List[BulkImportFileResult]
+
+class SimilarDocument(BaseModel):
+    document_id: uuid.UUID
+    name: str
+    file_type: Optional[str] = None
+    discipline: Optional[str] = None
+    status: Optional[str] = None
+    score: float  # Cosine similarity of the best matching chunks, -1 to 1
+    matches: int  # Chunk pairs among the nearest neighbours
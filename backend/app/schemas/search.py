@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional, List
+import uuid
+
+class SearchHit(BaseModel):
+    document_id: uuid.UUID
+    name: str
+    discipline: Optional[str] = None
+    status: Optional[str] = None
+    file_type: Optional[str] = None
+    rank: float
+    snippet: Optional[str] = None  # Matches wrapped in <mark></mark>
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchHit]
+    next_offset: Optional[int] = None
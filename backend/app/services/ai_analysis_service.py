@@ -2,96 +2,150 @@
 AI Analysis Service
 Gemini 2.0 Flash Integration
 
-Provides document analysis using Google's Gemini AI
+Provides document analysis using Google's Gemini AI, or another
+backend selected with AI_BACKEND (see llm_backends)
 """
-import os
 import time
 import logging
-from typing import Dict, Optional
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
+import threading
+from typing import Callable, Dict, Optional
 import json
 
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.analysis_metrics import AnalysisTimings
+from app.services.analysis_progress import AnalysisProgress
+from app.services.chunked_analysis import ChunkedAnalyzer
+from app.services.llm_backends import LLMBackend, create_backend
+from app.services.llm_client import LLMClient, LLMRetryableError, parse_json_response, token_usage
+from app.services.text_extraction import EXTRACTOR_VERSION, extract_text
+
 logger = logging.getLogger(__name__)
 
+# Characters of document text sent in one prompt, and stored (compressed,
+# see DocumentAnalysisText) as ocr_text. Longer texts, up to
+# ANALYSIS_MAX_CHARS, are analyzed in chunks; extraction stops once the
+# largest of these has been read
+PROMPT_TEXT_CHARS = 10000
+STORED_TEXT_CHARS = settings.ANALYSIS_STORED_TEXT_CHARS
+EXTRACTION_BUDGET_CHARS = max(PROMPT_TEXT_CHARS, STORED_TEXT_CHARS, settings.ANALYSIS_MAX_CHARS)
+
+# Bump when the prompt or the parsing of its response changes, so cached
+# analyses made with the old one are not reused
+PROMPT_VERSION = "2"
+
+# Extracted text depends on the extractor and on how much of it is read
+EXTRACTION_CACHE_VERSION = f"{EXTRACTOR_VERSION}-{EXTRACTION_BUDGET_CHARS}"
+
 
 class AIAnalysisService:
     """Service for AI-powered document analysis"""
     
-    def __init__(self):
-        """Initialize Gemini AI"""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            logger.warning("GEMINI_API_KEY not found in environment")
-            self.model = None
-        else:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            logger.info("Gemini AI initialized successfully")
+    def __init__(self, backend: LLMBackend = None):
+        """
+        Args:
+            backend: Model backend; by default created from AI_BACKEND on
+                first use, so importing the service configures nothing
+        """
+        self._backend = backend
+        self._llm = None
+        self._chunked = None
+        self._lock = threading.Lock()
+    
+    @property
+    def backend(self) -> LLMBackend:
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_backend()
+        return self._backend
     
-    def extract_text_from_pdf(self, file_path: str) -> str:
+    @property
+    def llm(self) -> LLMClient:
+        if self._llm is None:
+            self._llm = LLMClient(self.backend.generate)
+        return self._llm
+    
+    @property
+    def chunked(self) -> ChunkedAnalyzer:
+        if self._chunked is None:
+            self._chunked = ChunkedAnalyzer(self.llm, self.model_name, PROMPT_TEXT_CHARS)
+        return self._chunked
+    
+    @property
+    def model_name(self) -> str:
+        """Model in use, recorded as analyzed_by and part of cache keys"""
+        return self.backend.model_name
+    
+    def use_backend(self, backend: LLMBackend):
+        """Switch to another backend, e.g. a fake for load tests"""
+        with self._lock:
+            self._backend = backend
+            self._llm = None
+            self._chunked = None
+    
+    def extract_text_from_pdf(self, file_path: str, max_chars: int = EXTRACTION_BUDGET_CHARS) -> str:
         """
         Extract text from PDF file
         
         Args:
             file_path: Path to PDF file
+            max_chars: Stop reading pages once this much text is collected
             
         Returns:
             Extracted text content
         """
-        try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
-        except Exception as e:
-            logger.error(f"Error extracting PDF text: {e}")
-            return ""
+        return self.extract_text_from_file(file_path, "pdf", max_chars)["text"]
     
-    def extract_text_from_docx(self, file_path: str) -> str:
+    def extract_text_from_docx(self, file_path: str, max_chars: int = EXTRACTION_BUDGET_CHARS) -> str:
         """
         Extract text from DOCX file
         
         Args:
             file_path: Path to DOCX file
+            max_chars: Stop reading paragraphs once this much text is collected
             
         Returns:
             Extracted text content
         """
-        try:
-            doc = DocxDocument(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text.strip()
-        except Exception as e:
-            logger.error(f"Error extracting DOCX text: {e}")
-            return ""
+        return self.extract_text_from_file(file_path, "docx", max_chars)["text"]
     
-    def extract_text_from_file(self, file_path: str, file_type: str) -> str:
+    def extract_text_from_file(
+        self,
+        file_path: str,
+        file_type: str,
+        max_chars: int = EXTRACTION_BUDGET_CHARS,
+        on_page: Callable[[int, int], None] = None
+    ) -> Dict:
         """
-        Extract text from file based on type
+        Extract text from file based on type, up to a character budget
         
         Args:
             file_path: Path to file
             file_type: File extension (pdf, docx, dwg, etc)
+            max_chars: Character budget
+            on_page: Progress callback, called with (parts read, part count)
             
         Returns:
-            Extracted text content
+            Dict with text, page_offsets, pages_read and truncated
         """
         file_type = file_type.lower()
         
-        if file_type == "pdf":
-            return self.extract_text_from_pdf(file_path)
-        elif file_type in ["docx", "doc"]:
-            return self.extract_text_from_docx(file_path)
-        elif file_type == "dwg":
+        if file_type == "dwg":
             # DWG files require special CAD libraries
             # For now, return placeholder
-            return "[DWG file - CAD drawing. Text extraction not available]"
-        else:
+            return {"text": "[DWG file - CAD drawing. Text extraction not available]", "page_offsets": [0], "pages_read": 1, "truncated": False}
+        if file_type not in ["pdf", "docx", "doc", "xlsx", "xlsm", "txt"]:
             logger.warning(f"Unsupported file type: {file_type}")
-            return ""
+        
+        try:
+            extracted = extract_text(file_path, file_type, max_chars=max_chars, on_page=on_page)
+            extracted["text"] = extracted["text"].strip()
+            return extracted
+        except Exception as e:
+            logger.error(f"Error extracting {file_type} text: {e}")
+            return {"text": "", "page_offsets": [], "pages_read": 0, "truncated": False}
     
     def analyze_document(
         self,
@@ -113,31 +167,102 @@ class AIAnalysisService:
         start_time = time.time()
         
         # Check if model is available
-        if not self.model:
-            return {
-                "summary": "AI analysis unavailable - API key not configured",
-                "extracted_data": "{}",
-                "ocr_text": "",
-                "key_entities": {},
-                "confidence_score": 0.0,
-                "processing_time": 0.0,
-                "analyzed_by": "gemini-2.0-flash-exp (unavailable)"
-            }
+        if not self.is_available():
+            return self._unavailable_result()
         
+        timings = AnalysisTimings()
         try:
             # Extract text from document
             logger.info(f"Extracting text from {filename}")
-            text_content = self.extract_text_from_file(file_path, file_type)
+            with timings.stage("extract"):
+                extracted = self.extract_text_from_file(file_path, file_type)
+        except Exception as e:
+            logger.error(f"Error analyzing document: {e}", exc_info=True)
+            return self._error_result(e, time.time() - start_time)
+        
+        return self.analyze_text(extracted, file_type, filename, start_time, timings=timings)
+    
+    def analyze_text(
+        self,
+        extracted: Dict,
+        file_type: str,
+        filename: str,
+        start_time: float = None,
+        db: Session = None,
+        progress: Optional[AnalysisProgress] = None,
+        timings: Optional[AnalysisTimings] = None
+    ) -> Dict:
+        """
+        Analyze already extracted document text using Gemini AI
+        
+        Text longer than one prompt is analyzed chunk by chunk and merged.
+        
+        Args:
+            extracted: extract_text_from_file result
+            file_type: File extension
+            filename: Original filename
+            start_time: When the analysis started, for processing_time
+            db: Session for caching chunk results (the caller commits)
+            progress: Receives llm_call and parsing stages
+            timings: Receives the llm and parse stages, input sizes and
+                token counts; earlier stages (fetch, extract) are the
+                caller's
+            
+        Returns:
+            Analysis results dictionary; status is "ok" only when the
+            model answered, prompt_chars is the prompt length and
+            timings holds AnalysisTimings.as_columns()
             
-            if not text_content:
+        Raises:
+            LLMRetryableError: The model stayed throttled or unavailable
+        """
+        start_time = start_time or time.time()
+        timings = timings or AnalysisTimings()
+        
+        if not self.is_available():
+            return self._unavailable_result()
+        
+        try:
+            text_content = extracted["text"]
+            timings.input(extracted)
+            logger.info(
+                f"Read {extracted['pages_read']} pages of {filename}"
+                f"{' (budget reached)' if extracted['truncated'] else ''}"
+            )
+            
+            # Page starts within the stored excerpt
+            page_offsets = [offset for offset in extracted["page_offsets"] if offset < STORED_TEXT_CHARS]
+            
+            # Whitespace alone leaves no chunks to analyze
+            if not text_content or text_content.isspace():
                 return {
+                    "status": "no_text",
                     "summary": "Unable to extract text from document",
                     "extracted_data": "{}",
                     "ocr_text": "",
+                    "page_offsets": [],
                     "key_entities": {},
                     "confidence_score": 0.0,
                     "processing_time": time.time() - start_time,
-                    "analyzed_by": "gemini-2.0-flash-exp"
+                    "timings": timings.as_columns(),
+                    "analyzed_by": self.model_name
+                }
+            
+            if len(text_content) > PROMPT_TEXT_CHARS:
+                merged = self.chunked.analyze(extracted, file_type, filename, db=db, progress=progress, timings=timings)
+                return {
+                    "status": "ok",
+                    "summary": merged["summary"],
+                    "extracted_data": json.dumps(merged["extracted_data"]),
+                    "ocr_text": text_content[:STORED_TEXT_CHARS],
+                    "page_offsets": page_offsets,
+                    "key_entities": merged["key_entities"],
+                    "confidence_score": merged["confidence_score"],
+                    "processing_time": time.time() - start_time,
+                    "prompt_chars": merged["prompt_chars"],
+                    "chunks": merged["chunks"],
+                    "timings": timings.as_columns(),
+                    "analyzed_by": self.model_name
                 }
             
             # Prepare prompt for Gemini
@@ -153,7 +278,7 @@ Document filename: {filename}
 Document type: {file_type}
 
 Document content:
-{text_content[:10000]}  # Limit to first 10k chars
+{text_content[:PROMPT_TEXT_CHARS]}
 
 Please respond in the following JSON format:
 {{
@@ -169,73 +294,91 @@ Please respond in the following JSON format:
 }}
 """
             
-            # Call Gemini AI
+            # Call Gemini AI, within the shared rate limit
             logger.info(f"Analyzing document with Gemini AI: {filename}")
-            response = self.model.generate_content(prompt)
+            if progress:
+                progress.stage("llm_call", chunks=0, chunk_total=1)
+            with timings.stage("llm"):
+                response = self.llm.generate_sync(prompt)
+            timings.calls([token_usage(prompt, response)])
+            if progress:
+                progress.stage("parsing")
             
             # Parse response
-            try:
-                # Try to extract JSON from response
-                response_text = response.text
-                
-                # Find JSON in response (might be wrapped in markdown)
-                if "```json" in response_text:
-                    json_start = response_text.find("```json") + 7
-                    json_end = response_text.find("```", json_start)
-                    json_text = response_text[json_start:json_end].strip()
-                elif "```" in response_text:
-                    json_start = response_text.find("```") + 3
-                    json_end = response_text.find("```", json_start)
-                    json_text = response_text[json_start:json_end].strip()
-                else:
-                    json_text = response_text
-                
-                analysis_result = json.loads(json_text)
-                
-                processing_time = time.time() - start_time
-                
+            with timings.stage("parse"):
+                try:
+                    analysis_result = parse_json_response(response.text)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Error parsing Gemini response: {e}")
+                    analysis_result = None
+            processing_time = time.time() - start_time
+            
+            if analysis_result is not None:
                 return {
+                    "status": "ok",
                     "summary": analysis_result.get("summary", "No summary available"),
                     "extracted_data": json.dumps(analysis_result.get("extracted_data", {})),
-                    "ocr_text": text_content[:5000],  # Store first 5k chars
+                    "ocr_text": text_content[:STORED_TEXT_CHARS],
+                    "page_offsets": page_offsets,
                     "key_entities": analysis_result.get("key_entities", {}),
                     "confidence_score": float(analysis_result.get("confidence_score", 0.85)),
                     "processing_time": processing_time,
-                    "analyzed_by": "gemini-2.0-flash-exp"
+                    "prompt_chars": len(prompt),
+                    "timings": timings.as_columns(),
+                    "analyzed_by": self.model_name
                 }
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing Gemini response: {e}")
-                # Fallback: use raw response as summary
-                processing_time = time.time() - start_time
-                
-                return {
-                    "summary": response.text[:500] if response.text else "Analysis completed",
-                    "extracted_data": "{}",
-                    "ocr_text": text_content[:5000],
-                    "key_entities": {},
-                    "confidence_score": 0.75,
-                    "processing_time": processing_time,
-                    "analyzed_by": "gemini-2.0-flash-exp"
-                }
-        
-        except Exception as e:
-            logger.error(f"Error analyzing document: {e}", exc_info=True)
-            processing_time = time.time() - start_time
             
+            # Fallback: use raw response as summary
             return {
-                "summary": f"Error during analysis: {str(e)}",
+                "status": "ok",
+                "summary": response.text[:500] if response.text else "Analysis completed",
                 "extracted_data": "{}",
-                "ocr_text": "",
+                "ocr_text": text_content[:STORED_TEXT_CHARS],
+                "page_offsets": page_offsets,
                 "key_entities": {},
-                "confidence_score": 0.0,
+                "confidence_score": 0.75,
                 "processing_time": processing_time,
-                "analyzed_by": "gemini-2.0-flash-exp (error)"
+                "prompt_chars": len(prompt),
+                "timings": timings.as_columns(),
+                "analyzed_by": self.model_name
             }
+        
+        except LLMRetryableError:
+            # Still throttled after backing off; the task retries later
+            raise
+        except Exception as e:
+            logger.error(f"Error analyzing document: {e}", exc_info=True)
+            return self._error_result(e, time.time() - start_time)
+    
+    def _unavailable_result(self) -> Dict:
+        return {
+            "status": "unavailable",
+            "summary": "AI analysis unavailable - API key not configured",
+            "extracted_data": "{}",
+            "ocr_text": "",
+            "page_offsets": [],
+            "key_entities": {},
+            "confidence_score": 0.0,
+            "processing_time": 0.0,
+            "analyzed_by": f"{self.model_name} (unavailable)"
+        }
+    
+    def _error_result(self, error: Exception, processing_time: float) -> Dict:
+        return {
+            "status": "error",
+            "summary": f"Error during analysis: {str(error)}",
+            "extracted_data": "{}",
+            "ocr_text": "",
+            "page_offsets": [],
+            "key_entities": {},
+            "confidence_score": 0.0,
+            "processing_time": processing_time,
+            "analyzed_by": f"{self.model_name} (error)"
+        }
     
     def is_available(self) -> bool:
         """Check if AI analysis is available"""
-        return self.model is not None
+        return self.backend.available
 
 
 # Singleton instance
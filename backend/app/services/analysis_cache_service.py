@@ -0,0 +1,241 @@
+"""
+Analysis Cache
+
+Extraction and AI analysis results are stored per file content, keyed by
+(content hash, extractor version, model, prompt version). Analyzing bytes
+that were analyzed before (a re-upload, a restored version, a copy in
+another project) is a unique-index lookup instead of an extraction and a
+model call. When only the model or prompt changed, the cached extraction
+is re-used and just the model is called again.
+
+Every hit is counted on its entry, which is what the stats report: the
+model calls, processing seconds and prompt tokens that hits avoided.
+"""
+import time
+import logging
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.models.document import DocumentVersion
+from app.services.analysis_metrics import AnalysisTimings
+from app.services.analysis_progress import AnalysisProgress
+from app.services.ai_analysis_service import (
+    EXTRACTION_CACHE_VERSION,
+    PROMPT_VERSION,
+    STORED_TEXT_CHARS,
+    ai_service,
+)
+from app.services.document_service import DocumentService
+from app.services.text_extraction import CHARS_PER_TOKEN
+from app.utils.compression import compress_text, decompress_text
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCacheKey(NamedTuple):
+    content_hash: str
+    extractor_version: str
+    model: str
+    prompt_version: str
+
+
+class AnalysisCacheService:
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer or ai_service
+        self.document_service = DocumentService()
+
+    def key_for(self, content_hash: str) -> AnalysisCacheKey:
+        """Cache key of the current extractor, model and prompt for some content"""
+        return AnalysisCacheKey(content_hash, EXTRACTION_CACHE_VERSION, self.analyzer.model_name, PROMPT_VERSION)
+
+    def analyze_version(
+        self,
+        db: Session,
+        version: DocumentVersion,
+        file_type: str,
+        filename: str,
+        progress: Optional[AnalysisProgress] = None
+    ) -> Dict:
+        """
+        Analyze a document version, re-using earlier work on the same content
+
+        Args:
+            db: Database session (the caller commits)
+            version: Document version to analyze
+            file_type: File type (pdf, docx, ...)
+            filename: Original filename, for the prompt
+            progress: Receives extraction and model call progress; cache
+                hits skip straight to the result
+
+        Returns:
+            AIAnalysisService result plus cache: "hit" (no extraction or
+            model call), "extraction_hit" (model call only) or "miss";
+            hits have no timings
+        """
+        start_time = time.time()
+        timings = AnalysisTimings()
+        had_hash = bool(version.content_hash)
+
+        if had_hash:
+            cached = self.get_analysis(db, self.key_for(version.content_hash), start_time)
+            if cached is not None:
+                return cached
+        with timings.stage("extract"):
+            extracted = self.get_extraction(db, version.content_hash) if had_hash else None
+
+        cache_status = "extraction_hit"
+        if extracted is None:
+            cache_status = "miss"
+            with ExitStack() as stack:
+                with timings.stage("fetch"):
+                    path = stack.enter_context(self.document_service.version_file(db, version, f".{file_type}"))
+                if not had_hash:
+                    # The hash was only known once the file had been read
+                    cached = self.get_analysis(db, self.key_for(version.content_hash), start_time)
+                    if cached is not None:
+                        return cached
+                if progress:
+                    progress.stage("extracting")
+                with timings.stage("extract"):
+                    extracted = self.analyzer.extract_text_from_file(
+                        path, file_type, on_page=progress.pages if progress else None
+                    )
+
+        result = self.analyzer.analyze_text(
+            extracted, file_type, filename, start_time, db=db, progress=progress, timings=timings
+        )
+        if result["status"] == "ok":
+            self.store(db, self.key_for(version.content_hash), extracted, result)
+        result["cache"] = cache_status
+        return result
+
+    def get_analysis(self, db: Session, key: AnalysisCacheKey, start_time: float = None) -> Optional[Dict]:
+        """
+        Cached analysis for a key, counting the hit
+
+        Returns:
+            Result shaped like AIAnalysisService.analyze_document, or None
+        """
+        entry = db.execute(
+            select(AnalysisCacheEntry).where(
+                AnalysisCacheEntry.content_hash == key.content_hash,
+                AnalysisCacheEntry.extractor_version == key.extractor_version,
+                AnalysisCacheEntry.model == key.model,
+                AnalysisCacheEntry.prompt_version == key.prompt_version
+            )
+        ).scalars().first()
+        if entry is None:
+            return None
+
+        db.execute(
+            update(AnalysisCacheEntry)
+            .where(AnalysisCacheEntry.id == entry.id)
+            .values(hit_count=AnalysisCacheEntry.hit_count + 1, last_hit_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False}
+        )
+
+        text = entry.extracted_text or ""
+        return {
+            "status": "ok",
+            "summary": entry.result.get("summary"),
+            "extracted_data": entry.result.get("extracted_data", "{}"),
+            "ocr_text": text[:STORED_TEXT_CHARS],
+            "page_offsets": [offset for offset in entry.page_offsets or [] if offset < STORED_TEXT_CHARS],
+            "key_entities": entry.result.get("key_entities", {}),
+            "confidence_score": entry.result.get("confidence_score", 0.0),
+            "processing_time": time.time() - (start_time or time.time()),
+            "prompt_chars": entry.prompt_chars,
+            "analyzed_by": entry.model,
+            "cache": "hit",
+        }
+
+    def get_extraction(self, db: Session, content_hash: str) -> Optional[Dict]:
+        """Extracted text of content by the current extractor, whatever model analyzed it"""
+        row = db.execute(
+            select(
+                AnalysisCacheEntry.text_codec,
+                AnalysisCacheEntry.text_data,
+                AnalysisCacheEntry.page_offsets,
+                AnalysisCacheEntry.pages_read,
+                AnalysisCacheEntry.truncated
+            ).where(
+                AnalysisCacheEntry.content_hash == content_hash,
+                AnalysisCacheEntry.extractor_version == EXTRACTION_CACHE_VERSION
+            ).limit(1)
+        ).first()
+        if row is None:
+            return None
+        return {
+            "text": decompress_text(row.text_codec, row.text_data) if row.text_data is not None else "",
+            "page_offsets": row.page_offsets or [],
+            "pages_read": row.pages_read or 0,
+            "truncated": bool(row.truncated),
+        }
+
+    def store(self, db: Session, key: AnalysisCacheKey, extracted: Dict, result: Dict):
+        """Record a successful analysis (the caller commits)"""
+        text_codec, text_data = compress_text(extracted["text"])
+        row = {
+            **key._asdict(),
+            "text_codec": text_codec,
+            "text_data": text_data,
+            "page_offsets": extracted["page_offsets"],
+            "pages_read": extracted["pages_read"],
+            "truncated": extracted["truncated"],
+            "result": {
+                "summary": result["summary"],
+                "extracted_data": result["extracted_data"],
+                "key_entities": result["key_entities"],
+                "confidence_score": result["confidence_score"],
+            },
+            "processing_time": result["processing_time"],
+            "prompt_chars": result.get("prompt_chars"),
+            "hit_count": 0,
+            "created_at": datetime.utcnow(),
+        }
+        # Two workers may have analyzed the same content concurrently
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.execute(
+            insert(AnalysisCacheEntry).values(row).on_conflict_do_nothing(
+                index_elements=["content_hash", "extractor_version", "model", "prompt_version"]
+            )
+        )
+
+    def stats(self, db: Session) -> Dict:
+        """
+        Hit rate and cost saved
+
+        Every entry is one analysis that ran the model and every hit one
+        that did not, so hit_rate is the share of successful analyses
+        served from the cache.
+        """
+        entries, hits, seconds_saved, chars_saved = db.execute(
+            select(
+                func.count(AnalysisCacheEntry.id),
+                func.coalesce(func.sum(AnalysisCacheEntry.hit_count), 0),
+                func.coalesce(func.sum(AnalysisCacheEntry.hit_count * AnalysisCacheEntry.processing_time), 0.0),
+                func.coalesce(func.sum(AnalysisCacheEntry.hit_count * AnalysisCacheEntry.prompt_chars), 0)
+            )
+        ).one()
+        total = entries + hits
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": entries,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "llm_calls_saved": hits,
+            "processing_seconds_saved": round(float(seconds_saved), 2),
+            "prompt_tokens_saved": int(chars_saved) // CHARS_PER_TOKEN,
+        }
+
+
+# Singleton instance
+analysis_cache = AnalysisCacheService()
@@ -0,0 +1,253 @@
+"""
+Analysis Metrics
+
+Where the time of an analysis goes. Every analysis that runs records
+its stages on its DocumentAnalysis row:
+
+- fetch: copying the stored version to a local file
+- extract: text extraction
+- llm: model calls, including waits for the shared rate limit
+- parse: parsing the model response, or merging chunk results
+
+along with the pages and characters it read and the model calls and
+prompt and output tokens it used. Cache hits record none of these.
+
+The same numbers are exported as Prometheus histograms, and model calls
+are timed individually (provider latency and rate limit waits). Workers
+serve them on METRICS_PORT; prefork children share them through
+PROMETHEUS_MULTIPROC_DIR. prometheus_client is optional: without it
+nothing is exported but the rows are still written.
+"""
+import os
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+from app.config import settings
+from app.models.document import Document
+from app.models.document_analysis import DocumentAnalysis
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("fetch", "extract", "llm", "parse")
+
+# File types reported as themselves in metric labels; others are "other"
+LABELED_FILE_TYPES = {"pdf", "docx", "doc", "xlsx", "xlsm", "txt", "dwg"}
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120, 300, 600)
+PAGES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+CHARS_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 200_000, 500_000, 1_000_000, 2_000_000)
+TOKENS_BUCKETS = (100, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000)
+
+if prometheus_client is not None:
+    ANALYSIS_SECONDS = prometheus_client.Histogram(
+        "projectwise_analysis_seconds", "Analysis duration", ["file_type", "cache"], buckets=SECONDS_BUCKETS
+    )
+    STAGE_SECONDS = prometheus_client.Histogram(
+        "projectwise_analysis_stage_seconds", "Analysis stage duration", ["stage", "file_type"], buckets=SECONDS_BUCKETS
+    )
+    INPUT_PAGES = prometheus_client.Histogram(
+        "projectwise_analysis_input_pages", "Pages read per analysis", ["file_type"], buckets=PAGES_BUCKETS
+    )
+    INPUT_CHARS = prometheus_client.Histogram(
+        "projectwise_analysis_input_chars", "Characters extracted per analysis", ["file_type"], buckets=CHARS_BUCKETS
+    )
+    TOKENS = prometheus_client.Histogram(
+        "projectwise_analysis_tokens", "Model tokens per analysis", ["kind"], buckets=TOKENS_BUCKETS
+    )
+    LLM_CALL_SECONDS = prometheus_client.Histogram(
+        "projectwise_llm_call_seconds", "Provider latency of one model call attempt", ["outcome"], buckets=SECONDS_BUCKETS
+    )
+    LLM_WAIT_SECONDS = prometheus_client.Histogram(
+        "projectwise_llm_rate_limit_wait_seconds", "Wait for the shared model quota", buckets=SECONDS_BUCKETS
+    )
+
+
+class AnalysisTimings:
+    """Stage durations and sizes of one analysis, filled in as it runs"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.pages_read: Optional[int] = None
+        self.input_chars: Optional[int] = None
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the block to a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def input(self, extracted: Dict):
+        self.pages_read = extracted.get("pages_read")
+        self.input_chars = len(extracted.get("text") or "")
+
+    def calls(self, usages: Iterable[Tuple[int, int]]):
+        """Count model calls, as (prompt tokens, output tokens) pairs"""
+        for prompt_tokens, output_tokens in usages:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+
+    def as_columns(self) -> Dict:
+        """DocumentAnalysis column values"""
+        return {
+            **{f"{stage}_seconds": self.seconds.get(stage) for stage in STAGES},
+            "pages_read": self.pages_read,
+            "input_chars": self.input_chars,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+class AnalysisMetrics:
+    def observe(self, file_type: str, cache: str, processing_time: float, timings: Optional[Dict]):
+        """
+        Export one stored analysis
+
+        Args:
+            file_type: File type of the document
+            cache: Cache outcome (hit, extraction_hit or miss)
+            processing_time: Total seconds
+            timings: AnalysisTimings.as_columns(); None for cache hits
+        """
+        if prometheus_client is None:
+            return
+        file_type = (file_type or "").lower()
+        file_type = file_type if file_type in LABELED_FILE_TYPES else "other"
+        ANALYSIS_SECONDS.labels(file_type, cache or "none").observe(processing_time or 0.0)
+        if not timings:
+            return
+        for stage in STAGES:
+            if timings.get(f"{stage}_seconds") is not None:
+                STAGE_SECONDS.labels(stage, file_type).observe(timings[f"{stage}_seconds"])
+        if timings.get("pages_read") is not None:
+            INPUT_PAGES.labels(file_type).observe(timings["pages_read"])
+        if timings.get("input_chars") is not None:
+            INPUT_CHARS.labels(file_type).observe(timings["input_chars"])
+        if timings.get("llm_calls"):
+            TOKENS.labels("prompt").observe(timings["prompt_tokens"])
+            TOKENS.labels("output").observe(timings["output_tokens"])
+
+    def observe_call(self, seconds: float, outcome: str):
+        """One model call attempt: "ok" or "error" """
+        if prometheus_client is not None:
+            LLM_CALL_SECONDS.labels(outcome).observe(seconds)
+
+    def observe_wait(self, seconds: float):
+        if prometheus_client is not None:
+            LLM_WAIT_SECONDS.observe(seconds)
+
+    def start_server(self, port: int = None) -> bool:
+        """
+        Serve the metrics of this process (and of its prefork children,
+        with PROMETHEUS_MULTIPROC_DIR set) over HTTP
+
+        Returns:
+            Whether a server was started
+        """
+        port = port if port is not None else settings.METRICS_PORT
+        if not port or prometheus_client is None:
+            return False
+        registry = prometheus_client.REGISTRY
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        prometheus_client.start_http_server(port, registry=registry)
+        logger.info(f"Serving metrics on port {port}")
+        return True
+
+    def stats(self, db: Session, project_id: str = None, days: int = 30, percentiles: Tuple[int, ...] = (50, 95)) -> Dict:
+        """
+        Percentiles of analysis duration and of each stage
+
+        Only analyses that ran (not cache hits) stored within the window
+        are counted; analyses stored before stages were recorded count
+        towards the total only.
+
+        Args:
+            db: Database session
+            project_id: Only this project's documents (default: all)
+            days: Window in days
+            percentiles: Percentiles to report
+
+        Returns:
+            Dict with analyses (count), total and each stage as
+            {"p50": seconds, ...}, and pages_read, input_chars,
+            prompt_tokens and output_tokens percentiles
+
+        Raises:
+            ValueError: Invalid project ID
+        """
+        columns = {
+            "total": DocumentAnalysis.processing_time,
+            **{stage: getattr(DocumentAnalysis, f"{stage}_seconds") for stage in STAGES},
+            "pages_read": DocumentAnalysis.pages_read,
+            "input_chars": DocumentAnalysis.input_chars,
+            "prompt_tokens": DocumentAnalysis.prompt_tokens,
+            "output_tokens": DocumentAnalysis.output_tokens,
+        }
+        filters = [
+            DocumentAnalysis.analyzed_at >= datetime.utcnow() - timedelta(days=days),
+            func.coalesce(DocumentAnalysis.cache_status, "") != "hit",
+        ]
+        joins = []
+        if project_id:
+            joins.append((Document, DocumentAnalysis.document_id == Document.id))
+            filters.append(Document.project_id == uuid.UUID(project_id))
+
+        count_query = db.query(func.count(DocumentAnalysis.id))
+        for target, on in joins:
+            count_query = count_query.join(target, on)
+        result = {"analyses": count_query.filter(*filters).scalar() or 0}
+        for name, column in columns.items():
+            result[name] = {
+                f"p{p}": value
+                for p, value in zip(percentiles, self._percentiles(db, column, joins, filters, percentiles))
+            }
+        return result
+
+    def _percentiles(self, db: Session, column, joins, filters, percentiles) -> List[Optional[float]]:
+        if db.bind.dialect.name == "postgresql":
+            query = db.query(*[func.percentile_cont(p / 100).within_group(column) for p in percentiles])
+            for target, on in joins:
+                query = query.join(target, on)
+            row = query.filter(*filters, column.isnot(None)).one()
+            return [round(float(value), 3) if value is not None else None for value in row]
+
+        # Interpolated like percentile_cont
+        query = db.query(column)
+        for target, on in joins:
+            query = query.join(target, on)
+        values = sorted(value for value, in query.filter(*filters, column.isnot(None)))
+        if not values:
+            return [None] * len(percentiles)
+        results = []
+        for p in percentiles:
+            position = (len(values) - 1) * p / 100
+            low = int(position)
+            high = min(low + 1, len(values) - 1)
+            results.append(round(values[low] + (values[high] - values[low]) * (position - low), 3))
+        return results
+
+
+# Singleton instance
+analysis_metrics = AnalysisMetrics()
@@ -0,0 +1,278 @@
+"""
+Analysis Progress
+
+Live progress of document analyses, pushed to clients instead of polled.
+Workers publish small JSON events on a per-document Redis channel and
+keep the latest one under a short-lived key, so a client connecting
+mid-analysis starts from the current stage. Each API process holds a
+single pub/sub connection and fans events out to its WebSocket and SSE
+clients.
+
+Stages, in order: queued, started, extracting (pages, page_total),
+llm_call (chunks, chunk_total), parsing, and then stored (with the
+analysis result, as GET /documents/{id}/analysis returns it), retrying
+(error, attempt) or failed (error). Stored and failed end a stream;
+pending is only reported for documents nothing has been queued for.
+
+Publishing never fails an analysis: on Redis errors events are dropped
+for a few seconds, and streams fall back to re-reading the (cached)
+analysis result every ANALYSIS_PROGRESS_KEEPALIVE_SECONDS.
+"""
+import asyncio
+import json
+import time
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("pending", "queued", "started", "extracting", "llm_call", "parsing", "stored", "retrying", "failed")
+TERMINAL_STAGES = ("stored", "failed")
+
+# How long publishing is skipped after a Redis error
+REDIS_BACKOFF_SECONDS = 5.0
+
+# Events buffered per client before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def progress_event(document_id: str, stage: str, **data) -> Dict:
+    return {"document_id": str(document_id), "stage": stage, "at": datetime.utcnow().isoformat(), **data}
+
+
+class AnalysisProgress:
+    """
+    Progress reporter for one analysis
+
+    Handed down to extraction and the model calls. Page and chunk counts
+    are published at most every ANALYSIS_PROGRESS_MIN_INTERVAL_SECONDS
+    (and always for the last one), so a 2,000-page PDF costs a handful
+    of messages.
+    """
+
+    def __init__(self, publisher: "ProgressPublisher", document_id: str):
+        self.publisher = publisher
+        self.document_id = str(document_id)
+        self.min_interval = settings.ANALYSIS_PROGRESS_MIN_INTERVAL_SECONDS
+        self._last_count_at = 0.0
+
+    def stage(self, stage: str, **data):
+        self.publisher.publish(self.document_id, stage, **data)
+
+    def pages(self, done: int, total: int):
+        if self._due(done, total):
+            self.stage("extracting", pages=done, page_total=total)
+
+    def chunks(self, done: int, total: int):
+        if self._due(done, total):
+            self.stage("llm_call", chunks=done, chunk_total=total)
+
+    def _due(self, done: int, total: int) -> bool:
+        now = time.monotonic()
+        if done < total and now - self._last_count_at < self.min_interval:
+            return False
+        self._last_count_at = now
+        return True
+
+
+class ProgressPublisher:
+    """Worker side: publishes events and keeps the latest per document"""
+
+    def __init__(
+        self,
+        namespace: str = "pw:analysis",
+        redis_factory: Callable[[], redis.Redis] = get_redis,
+        snapshot_ttl: int = None
+    ):
+        self.namespace = namespace
+        self.redis_factory = redis_factory
+        self.snapshot_ttl = snapshot_ttl or settings.ANALYSIS_PROGRESS_TTL_SECONDS
+        self._redis_skip_until = 0.0
+
+    def channel(self, document_id) -> str:
+        return f"{self.namespace}:{document_id}"
+
+    def tracker(self, document_id) -> AnalysisProgress:
+        return AnalysisProgress(self, document_id)
+
+    def publish(self, document_id, stage: str, **data):
+        self.publish_many([document_id], stage, **data)
+
+    def publish_many(self, document_ids: List, stage: str, **data):
+        """Publish the same stage for several documents in one round trip"""
+        if not document_ids or time.monotonic() < self._redis_skip_until:
+            return
+        try:
+            pipe = self.redis_factory().pipeline(transaction=False)
+            for document_id in document_ids:
+                payload = json.dumps(progress_event(document_id, stage, **data), default=str)
+                pipe.publish(self.channel(document_id), payload)
+                pipe.set(self._snapshot_key(document_id), payload, ex=self.snapshot_ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Progress Redis unavailable, dropping events for {REDIS_BACKOFF_SECONDS:.0f}s: {e}")
+            self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+    def last(self, document_id) -> Optional[Dict]:
+        """Latest event published for a document, if still kept"""
+        if time.monotonic() < self._redis_skip_until:
+            return None
+        try:
+            payload = self.redis_factory().get(self._snapshot_key(document_id))
+        except redis.RedisError as e:
+            logger.warning(f"Progress Redis unavailable: {e}")
+            self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+            return None
+        return json.loads(payload) if payload else None
+
+    def _snapshot_key(self, document_id) -> str:
+        return f"{self.channel(document_id)}:last"
+
+
+class ProgressHub:
+    """
+    API side: one pub/sub connection per process, fanned out to clients
+
+    Channels are subscribed while at least one local client watches the
+    document. When the connection fails every subscriber is told (a None
+    in its queue) and the next subscription reconnects.
+    """
+
+    def __init__(self, publisher: ProgressPublisher, url: str = None):
+        self.publisher = publisher
+        self.url = url or settings.REDIS_URL
+        self._client = None
+        self._pubsub = None
+        self._reader = None
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+        self._lock = None
+        self._loop = None
+
+    @asynccontextmanager
+    async def subscription(self, document_id) -> AsyncIterator[asyncio.Queue]:
+        """Queue receiving the document's events while the context is open"""
+        channel = self.publisher.channel(document_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._bind_loop()
+
+        async with self._lock:
+            try:
+                if channel not in self._queues:
+                    await self._connect()
+                    await self._pubsub.subscribe(channel)
+                self._queues.setdefault(channel, set()).add(queue)
+                if self._reader is None or self._reader.done():
+                    self._reader = asyncio.create_task(self._read())
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f"Progress subscription failed, clients fall back to polling: {e}")
+                await self._reset()
+                queue.put_nowait(None)
+
+        try:
+            yield queue
+        finally:
+            async with self._lock:
+                queues = self._queues.get(channel)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self._queues[channel]
+                        try:
+                            await self._pubsub.unsubscribe(channel)
+                        except (redis.RedisError, OSError, AttributeError):
+                            pass
+
+    async def stream(self, document_id, snapshot: Callable[[], Optional[Dict]]) -> AsyncIterator[Optional[Dict]]:
+        """
+        Events for one document until a terminal stage
+
+        Args:
+            document_id: Document UUID
+            snapshot: Current state as an event (sync, run in a thread);
+                sent first, and again on every keepalive in case an
+                event was missed
+
+        Yields:
+            Events, with None as a keepalive when nothing happened for
+            ANALYSIS_PROGRESS_KEEPALIVE_SECONDS
+        """
+        # Subscribe before reading the snapshot so nothing falls in between
+        async with self.subscription(document_id) as queue:
+            current = await run_in_threadpool(snapshot)
+            yield current
+            while current["stage"] not in TERMINAL_STAGES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.ANALYSIS_PROGRESS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    event = None
+                if event is None:
+                    latest = await run_in_threadpool(snapshot)
+                    if latest["stage"] in TERMINAL_STAGES:
+                        yield latest
+                        return
+                    yield None
+                    continue
+                current = event
+                yield event
+
+    def _bind_loop(self):
+        # Connections and locks belong to one event loop; start over in a new one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._client = self._pubsub = self._reader = None
+            self._queues = {}
+
+    async def _connect(self):
+        if self._pubsub is None:
+            self._client = aioredis.Redis.from_url(self.url, socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT)
+            self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+    async def _read(self):
+        try:
+            while self._queues:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not message or message.get("type") != "message":
+                    continue
+                channel = message["channel"].decode()
+                event = json.loads(message["data"])
+                for queue in list(self._queues.get(channel, ())):
+                    if queue.full():
+                        # A slow client loses its oldest events, not the newest
+                        queue.get_nowait()
+                    queue.put_nowait(event)
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Progress pub/sub connection lost: {e}")
+            for queues in self._queues.values():
+                for queue in queues:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+            self._queues.clear()
+            await self._reset()
+
+    async def _reset(self):
+        pubsub, client = self._pubsub, self._client
+        self._pubsub = self._client = None
+        try:
+            if pubsub is not None:
+                await pubsub.close()
+            if client is not None:
+                await client.close()
+        except (redis.RedisError, OSError):
+            pass
+
+
+# Singleton instances
+progress_publisher = ProgressPublisher()
+progress_hub = ProgressHub(progress_publisher)
@@ -0,0 +1,413 @@
+"""
+Analysis Job Queue
+
+Durable queue of documents to analyze, kept in analysis_jobs. Workers
+claim a batch of jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of them drain the queue concurrently without ever picking the
+same job, and each claimed job carries a lease (worker id plus expiry)
+that the worker renews with heartbeats while it is busy.
+
+A worker that dies simply stops renewing; once its lease has expired
+the job is claimable again, up to max_attempts. Completion is fenced on
+the lease: it only succeeds while leased_by is still the worker's id,
+and it is committed in the same transaction as the analysis rows, so a
+document is analyzed exactly once even when a slow worker loses its
+lease to another.
+
+At most one open (queued or running) job exists per document, enforced
+by a partial unique index, so enqueueing is idempotent.
+"""
+import os
+import socket
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, exists, func, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.analysis_job import AnalysisJob, AnalysisJobStatusEnum
+from app.models.document import Document
+from app.models.document_analysis import DocumentAnalysis
+from app.services.llm_client import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (AnalysisJobStatusEnum.QUEUED.value, AnalysisJobStatusEnum.RUNNING.value)
+
+# Document statuses the pending scan enqueues
+PENDING_DOCUMENT_STATUSES = ("draft", "review")
+
+# Requeue delays grow from this, capped at RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 15
+RETRY_MAX_SECONDS = 600
+
+# Claim attempts when other workers won every candidate job
+CLAIM_ROUNDS = 3
+
+
+def new_worker_id() -> str:
+    """Lease owner id, unique per drain run"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class AnalysisQueue:
+    def enqueue(self, db: Session, document_id: uuid.UUID, priority: int = 0) -> uuid.UUID:
+        """
+        Queue a document for analysis (the caller commits)
+
+        Args:
+            db: Database session
+            document_id: Document UUID
+            priority: Higher is claimed first; manual triggers use 10
+
+        Returns:
+            Id of the document's open job, new or already queued
+        """
+        insert = self._insert(db)
+        db.execute(
+            insert(AnalysisJob).values(
+                id=uuid.uuid4(),
+                document_id=document_id,
+                status=AnalysisJobStatusEnum.QUEUED.value,
+                priority=priority,
+                attempts=0,
+                max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+                run_after=datetime.utcnow(),
+                created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(
+                index_elements=["document_id"],
+                index_where=text("status IN ('queued', 'running')")
+            )
+        )
+        job_id, current_priority = db.execute(
+            select(AnalysisJob.id, AnalysisJob.priority).where(
+                AnalysisJob.document_id == document_id,
+                AnalysisJob.status.in_(OPEN_STATUSES)
+            )
+        ).one()
+        if current_priority < priority:
+            # A manual trigger jumps a job the scan queued earlier
+            db.execute(update(AnalysisJob).where(AnalysisJob.id == job_id).values(priority=priority))
+        return job_id
+
+    def enqueue_pending(self, db: Session, limit: int = None) -> List[uuid.UUID]:
+        """
+        Queue documents that have neither an analysis nor a job (the caller commits)
+
+        Documents whose jobs failed for good are marked failed and so are
+        not picked up again; re-analysis is a manual trigger.
+
+        Returns:
+            Ids of the documents queued
+        """
+        limit = limit or settings.ANALYSIS_ENQUEUE_BATCH_SIZE
+        document_ids = db.execute(
+            select(Document.id).where(
+                Document.status.in_(PENDING_DOCUMENT_STATUSES),
+                Document.deleted_at.is_(None),
+                ~exists().where(DocumentAnalysis.document_id == Document.id),
+                ~exists().where(AnalysisJob.document_id == Document.id)
+            ).order_by(Document.created_at).limit(limit)
+        ).scalars().all()
+        if not document_ids:
+            return []
+
+        now = datetime.utcnow()
+        insert = self._insert(db)
+        db.execute(
+            insert(AnalysisJob).on_conflict_do_nothing(
+                index_elements=["document_id"],
+                index_where=text("status IN ('queued', 'running')")
+            ),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "document_id": document_id,
+                    "status": AnalysisJobStatusEnum.QUEUED.value,
+                    "priority": 0,
+                    "attempts": 0,
+                    "max_attempts": settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+                    "run_after": now,
+                    "created_at": now,
+                }
+                for document_id in document_ids
+            ]
+        )
+        return document_ids
+
+    def claim(self, db: Session, worker_id: str, batch_size: int = None, lease_seconds: int = None) -> List[Dict]:
+        """
+        Lease a batch of jobs to a worker and commit
+
+        Claimable are queued jobs that are due, and running jobs whose
+        lease expired, while they have attempts left. Rows locked by
+        another claiming worker are skipped rather than waited for.
+
+        Returns:
+            List of dicts with id, document_id and attempts (this one
+            included); empty once nothing is claimable
+        """
+        batch_size = batch_size or settings.ANALYSIS_JOB_BATCH_SIZE
+        lease_seconds = lease_seconds or settings.ANALYSIS_JOB_LEASE_SECONDS
+
+        for _ in range(CLAIM_ROUNDS):
+            found, jobs = self._claim_once(db, worker_id, batch_size, lease_seconds)
+            if jobs or not found:
+                return jobs
+        return []
+
+    def _claim_once(self, db: Session, worker_id: str, batch_size: int, lease_seconds: int):
+        now = datetime.utcnow()
+        claimable = and_(
+            or_(
+                and_(AnalysisJob.status == AnalysisJobStatusEnum.QUEUED.value, AnalysisJob.run_after <= now),
+                and_(AnalysisJob.status == AnalysisJobStatusEnum.RUNNING.value, AnalysisJob.lease_expires_at < now)
+            ),
+            AnalysisJob.attempts < AnalysisJob.max_attempts
+        )
+        job_ids = db.execute(
+            select(AnalysisJob.id).where(claimable).order_by(
+                AnalysisJob.priority.desc(),
+                AnalysisJob.created_at
+            ).limit(batch_size).with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not job_ids:
+            db.commit()
+            return False, []
+
+        # Re-checked on write, so a job is never leased twice even where
+        # the database ignores FOR UPDATE (SQLite in development)
+        db.execute(
+            update(AnalysisJob).where(AnalysisJob.id.in_(job_ids), claimable).values(
+                status=AnalysisJobStatusEnum.RUNNING.value,
+                attempts=AnalysisJob.attempts + 1,
+                leased_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                heartbeat_at=now,
+                started_at=func.coalesce(AnalysisJob.started_at, now)
+            ).execution_options(synchronize_session=False)
+        )
+        jobs = db.execute(
+            select(AnalysisJob.id, AnalysisJob.document_id, AnalysisJob.attempts).where(
+                AnalysisJob.id.in_(job_ids),
+                AnalysisJob.leased_by == worker_id,
+                AnalysisJob.heartbeat_at == now
+            ).order_by(AnalysisJob.priority.desc(), AnalysisJob.created_at)
+        ).all()
+        db.commit()
+        return True, [{"id": job_id, "document_id": document_id, "attempts": attempts} for job_id, document_id, attempts in jobs]
+
+    def heartbeat(self, db: Session, job_ids: List[uuid.UUID], worker_id: str, lease_seconds: int = None) -> int:
+        """
+        Extend the leases a worker still holds and commit
+
+        Returns:
+            Number of leases extended; fewer than job_ids means some were lost
+        """
+        if not job_ids:
+            return 0
+        lease_seconds = lease_seconds or settings.ANALYSIS_JOB_LEASE_SECONDS
+        now = datetime.utcnow()
+        result = db.execute(
+            update(AnalysisJob).where(
+                AnalysisJob.id.in_(job_ids),
+                AnalysisJob.status == AnalysisJobStatusEnum.RUNNING.value,
+                AnalysisJob.leased_by == worker_id
+            ).values(
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_seconds)
+            ).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+    def complete(self, db: Session, job_id: uuid.UUID, worker_id: str) -> bool:
+        """
+        Mark a job succeeded, in the caller's transaction (the caller commits)
+
+        Returns:
+            False when the worker no longer holds the lease; the caller must
+            roll back its results, another worker owns the job now
+        """
+        job = self._leased(db, job_id, worker_id)
+        if job is None:
+            return False
+        job.status = AnalysisJobStatusEnum.SUCCEEDED.value
+        job.finished_at = datetime.utcnow()
+        job.lease_expires_at = None
+        job.last_error = None
+        return True
+
+    def fail(
+        self,
+        db: Session,
+        job_id: uuid.UUID,
+        worker_id: str,
+        error: str,
+        retry_after: float = None,
+        permanent: bool = False
+    ) -> Optional[str]:
+        """
+        Record a failed attempt (the caller commits)
+
+        The job is queued again after a jittered backoff (or retry_after)
+        while it has attempts left and the error is not permanent;
+        otherwise it fails for good and the document is marked failed.
+
+        Returns:
+            New job status, or None when the lease was lost
+        """
+        job = self._leased(db, job_id, worker_id)
+        if job is None:
+            return None
+        now = datetime.utcnow()
+        job.last_error = (error or "")[:2000]
+        job.leased_by = None
+        job.lease_expires_at = None
+        if not permanent and job.attempts < job.max_attempts:
+            delay = retry_after or backoff_delay(job.attempts, base=RETRY_BASE_SECONDS, cap=RETRY_MAX_SECONDS)
+            job.status = AnalysisJobStatusEnum.QUEUED.value
+            job.run_after = now + timedelta(seconds=delay)
+        else:
+            job.status = AnalysisJobStatusEnum.FAILED.value
+            job.finished_at = now
+            db.execute(update(Document).where(Document.id == job.document_id).values(status="failed"))
+        return job.status
+
+    def reap(self, db: Session) -> List[uuid.UUID]:
+        """
+        Fail running jobs whose lease expired with no attempts left (the caller commits)
+
+        Their workers died on every attempt, so nobody may claim them again.
+
+        Returns:
+            Document ids whose jobs were failed
+        """
+        now = datetime.utcnow()
+        jobs = db.execute(
+            select(AnalysisJob).where(
+                AnalysisJob.status == AnalysisJobStatusEnum.RUNNING.value,
+                AnalysisJob.lease_expires_at < now,
+                AnalysisJob.attempts >= AnalysisJob.max_attempts
+            ).with_for_update(skip_locked=True)
+        ).scalars().all()
+        for job in jobs:
+            job.status = AnalysisJobStatusEnum.FAILED.value
+            job.finished_at = now
+            job.leased_by = None
+            job.last_error = job.last_error or "Lease expired on the last attempt"
+        document_ids = [job.document_id for job in jobs]
+        if document_ids:
+            db.execute(update(Document).where(Document.id.in_(document_ids)).values(status="failed"))
+        return document_ids
+
+    def stats(self, db: Session) -> Dict:
+        """Job counts by status and the age of the oldest due queued job"""
+        counts = dict(db.execute(select(AnalysisJob.status, func.count()).group_by(AnalysisJob.status)).all())
+        now = datetime.utcnow()
+        oldest = db.execute(
+            select(func.min(AnalysisJob.created_at)).where(
+                AnalysisJob.status == AnalysisJobStatusEnum.QUEUED.value,
+                AnalysisJob.run_after <= now
+            )
+        ).scalar()
+        expired = db.execute(
+            select(func.count()).select_from(AnalysisJob).where(
+                AnalysisJob.status == AnalysisJobStatusEnum.RUNNING.value,
+                AnalysisJob.lease_expires_at < now
+            )
+        ).scalar()
+        return {
+            **{status.value: counts.get(status.value, 0) for status in AnalysisJobStatusEnum},
+            "expired_leases": expired,
+            "oldest_queued_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        }
+
+    def latest_job(self, db: Session, document_id: uuid.UUID) -> Optional[Dict]:
+        """Status, attempts and last error of a document's newest job"""
+        row = db.execute(
+            select(AnalysisJob.id, AnalysisJob.status, AnalysisJob.attempts, AnalysisJob.last_error).where(
+                AnalysisJob.document_id == document_id
+            ).order_by(AnalysisJob.created_at.desc()).limit(1)
+        ).first()
+        if row is None:
+            return None
+        return {"id": row.id, "status": row.status, "attempts": row.attempts, "last_error": row.last_error}
+
+    def _leased(self, db: Session, job_id: uuid.UUID, worker_id: str) -> Optional[AnalysisJob]:
+        # Row lock until the caller commits, so a claim cannot slip in between
+        return db.execute(
+            select(AnalysisJob).where(
+                AnalysisJob.id == job_id,
+                AnalysisJob.status == AnalysisJobStatusEnum.RUNNING.value,
+                AnalysisJob.leased_by == worker_id
+            ).with_for_update()
+        ).scalar_one_or_none()
+
+    def _insert(self, db: Session):
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert
+
+
+class LeaseKeeper:
+    """
+    Renews a worker's leases from a background thread
+
+    Jobs are added when claimed and discarded when finished; every
+    lease_seconds / 3 the remaining ones are extended with a session of
+    the thread's own.
+    """
+
+    def __init__(self, worker_id: str, lease_seconds: int = None):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or settings.ANALYSIS_JOB_LEASE_SECONDS
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="analysis-lease-keeper", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def add(self, job_ids: List[uuid.UUID]):
+        with self._lock:
+            self._jobs.update(job_ids)
+
+    def discard(self, job_id: uuid.UUID):
+        with self._lock:
+            self._jobs.discard(job_id)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                job_ids = list(self._jobs)
+            if not job_ids:
+                continue
+            db = SessionLocal()
+            try:
+                renewed = analysis_queue.heartbeat(db, job_ids, self.worker_id, self.lease_seconds)
+                if renewed < len(job_ids):
+                    logger.warning(f"Worker {self.worker_id} lost {len(job_ids) - renewed} analysis job lease(s)")
+            except Exception as e:
+                # Next beat tries again; the lease outlives a few misses
+                logger.warning(f"Analysis job heartbeat failed: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+
+# Singleton instance
+analysis_queue = AnalysisQueue()
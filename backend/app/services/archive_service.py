@@ -0,0 +1,181 @@
+"""
+Document Retention Service
+
+Soft-deleted documents stay in the live tables until DOCUMENT_RETENTION_DAYS
+have passed. This service then moves each one, with its versions, comments
+and analysis, into document_archive as a JSON payload and deletes the live
+rows in batches. Storage is reclaimed once the batch has committed: whole
+files no version references any more, previews of content no remaining
+version has, and content-defined chunks whose reference count dropped to
+zero.
+"""
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from app.config import settings
+from app.models.archive import DocumentArchive
+from app.models.comment import Comment
+from app.models.document import Document, DocumentVersion, StorageModeEnum
+from app.models.document_analysis import DocumentAnalysis, DocumentAnalysisText
+from app.models.upload_session import UploadSession
+from app.services.cache_service import metadata_cache
+from app.services.chunk_store import chunk_store
+from app.services.preview_service import PREVIEW_SIZES, preview_service
+from app.services.search_service import search_service
+from app.services.storage_service import storage_service
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveService:
+    def __init__(self, storage=None):
+        self.storage = storage or storage_service
+        self.chunk_store = chunk_store
+
+    def archive_deleted_documents(
+        self,
+        db: Session,
+        retention_days: int = None,
+        batch_size: int = None
+    ) -> Dict:
+        """
+        Archive one batch of documents deleted more than retention_days ago
+
+        Args:
+            db: Database session
+            retention_days: Minimum age of the soft delete
+            batch_size: Documents per transaction
+
+        Returns:
+            Dict with documents, versions, comments and storage objects handled
+        """
+        retention_days = retention_days if retention_days is not None else settings.DOCUMENT_RETENTION_DAYS
+        batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+        # Served by the partial idx_documents_deleted_at index
+        documents = db.execute(
+            select(Document)
+            .where(Document.deleted_at != None, Document.deleted_at < cutoff)
+            .order_by(Document.deleted_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+
+        result = {"documents": 0, "versions": 0, "comments": 0, "objects_deleted": 0, "chunks_deleted": 0}
+        if not documents:
+            return result
+
+        ids = [document.id for document in documents]
+        versions = self._rows_for(db, DocumentVersion, ids)
+        comments = self._rows_for(db, Comment, ids)
+        # Deferred and side-table text included, without a query per row
+        analyses = self._rows_for(db, DocumentAnalysis, ids, undefer("*"), selectinload(DocumentAnalysis.stored_text))
+
+        now = datetime.utcnow()
+        db.execute(insert(DocumentArchive), [
+            {
+                "id": document.id,
+                "project_id": document.project_id,
+                "name": document.name,
+                "deleted_at": document.deleted_at,
+                "archived_at": now,
+                "payload": jsonable_encoder({
+                    "document": self._row_to_dict(document),
+                    "versions": [self._row_to_dict(v) for v in versions.get(document.id, [])],
+                    "comments": [self._row_to_dict(c) for c in comments.get(document.id, [])],
+                    "analysis": [self._row_to_dict(a) for a in analyses.get(document.id, [])],
+                }),
+            }
+            for document in documents
+        ])
+
+        all_versions = [v for rows in versions.values() for v in rows]
+        orphaned_chunks = []
+        for version in all_versions:
+            if version.storage_mode == StorageModeEnum.CHUNKED and version.chunk_manifest:
+                orphaned_chunks.extend(self.chunk_store.release(db, version.chunk_manifest))
+        file_paths = {v.file_path for v in all_versions if v.storage_mode != StorageModeEnum.CHUNKED}
+        content_hashes = {v.content_hash for v in all_versions if v.content_hash}
+
+        # Dependents first; documents and versions reference each other
+        db.execute(
+            update(UploadSession).where(UploadSession.document_id.in_(ids)).values(document_id=None),
+            execution_options={"synchronize_session": False}
+        )
+        search_service.remove_documents(db, ids)
+        db.execute(
+            update(Document).where(Document.id.in_(ids)).values(current_version_id=None),
+            execution_options={"synchronize_session": False}
+        )
+        db.execute(
+            delete(DocumentAnalysisText).where(DocumentAnalysisText.analysis_id.in_(
+                select(DocumentAnalysis.id).where(DocumentAnalysis.document_id.in_(ids))
+            )),
+            execution_options={"synchronize_session": False}
+        )
+        for model in (DocumentAnalysis, Comment, DocumentVersion):
+            db.execute(delete(model).where(model.document_id.in_(ids)), execution_options={"synchronize_session": False})
+        db.execute(delete(Document).where(Document.id.in_(ids)), execution_options={"synchronize_session": False})
+        db.commit()
+
+        for document_id in ids:
+            metadata_cache.invalidate(
+                f"document:{document_id}",
+                f"document:{document_id}:versions",
+                f"document:{document_id}:analysis"
+            )
+
+        # Storage is only touched once the rows are gone for good
+        result["objects_deleted"] = self._delete_unreferenced_files(db, file_paths, content_hashes)
+        result["chunks_deleted"] = self.chunk_store.purge_orphans(db, orphaned_chunks)
+        db.commit()
+
+        result.update(documents=len(ids), versions=len(all_versions), comments=sum(len(c) for c in comments.values()))
+        logger.info(f"Archived {len(ids)} deleted documents")
+        return result
+
+    def purge_orphaned_chunks(self, db: Session, limit: int = 1000) -> int:
+        """Sweep chunks left unreferenced by interrupted purges"""
+        deleted = self.chunk_store.purge_orphans(db, limit=limit)
+        db.commit()
+        return deleted
+
+    def _delete_unreferenced_files(self, db: Session, file_paths: set, content_hashes: set) -> int:
+        still_used_paths = set(db.execute(
+            select(DocumentVersion.file_path).where(DocumentVersion.file_path.in_(list(file_paths)))
+        ).scalars()) if file_paths else set()
+        still_used_hashes = set(db.execute(
+            select(DocumentVersion.content_hash).where(DocumentVersion.content_hash.in_(list(content_hashes)))
+        ).scalars()) if content_hashes else set()
+
+        keys = [self.storage.key_from_url(path) for path in file_paths - still_used_paths]
+        keys += [
+            preview_service.preview_key(content_hash, size)
+            for content_hash in content_hashes - still_used_hashes
+            for size in PREVIEW_SIZES
+        ]
+
+        deleted = 0
+        for key in keys:
+            try:
+                self.storage.delete_object(key)
+                deleted += 1
+            except Exception as e:
+                logger.warning(f"Could not delete archived object {key}: {e}")
+        return deleted
+
+    def _rows_for(self, db: Session, model, document_ids: List[uuid.UUID], *options) -> Dict[uuid.UUID, list]:
+        grouped: Dict[uuid.UUID, list] = {}
+        for row in db.execute(select(model).where(model.document_id.in_(document_ids)).options(*options)).scalars():
+            grouped.setdefault(row.document_id, []).append(row)
+        return grouped
+
+    def _row_to_dict(self, row) -> Dict:
+        return {column.name: getattr(row, column.key) for column in row.__table__.columns}
@@ -0,0 +1,286 @@
+"""
+Bulk Document Import Service
+
+Imports many files in one request: plain multi-file uploads and ZIP/TAR
+archives (unpacked in streaming mode). Objects are pushed to storage by a
+bounded thread pool while the archive is still being read, and
+Document/DocumentVersion rows are written with batched INSERTs instead of
+one transaction per file.
+"""
+import os
+import uuid
+import tarfile
+import zipfile
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.document import Document, DocumentVersion, DocumentStatusEnum
+from app.services.dirty_projects import dirty_projects
+from app.services.document_service import DocumentService
+from app.services.search_service import search_service
+from app.services.storage_service import storage_service
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz")
+
+# Archive entries that are never documents
+IGNORED_PREFIXES = ("__MACOSX/", "._")
+IGNORED_NAMES = {".DS_Store", "Thumbs.db", "desktop.ini"}
+
+
+class BulkImportService:
+    def __init__(
+        self,
+        storage=None,
+        concurrency: int = None,
+        batch_size: int = None,
+        max_buffered_size: int = None
+    ):
+        self.storage = storage or storage_service
+        self.document_service = DocumentService()
+        self.concurrency = concurrency or settings.BULK_IMPORT_CONCURRENCY
+        self.batch_size = batch_size or settings.BULK_IMPORT_BATCH_SIZE
+        self.max_buffered_size = max_buffered_size or settings.BULK_IMPORT_MAX_BUFFERED_SIZE
+
+    def import_files(
+        self,
+        db: Session,
+        project_id: str,
+        user_id: str,
+        files: List[Tuple[str, BinaryIO]],
+        discipline: str = None,
+        unpack_archives: bool = True
+    ) -> Dict:
+        """
+        Import a list of (filename, fileobj) pairs into a project
+
+        Args:
+            db: Database session
+            project_id: Project UUID
+            user_id: Uploader UUID
+            files: Uploaded files; archives are expanded when unpack_archives is set
+            discipline: Discipline applied to every imported document
+            unpack_archives: Treat .zip/.tar files as containers
+
+        Returns:
+            Manifest dict with per-file results and totals
+        """
+        results: List[Dict] = []
+        pending: List[Dict] = []
+        futures = deque()
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for path, fileobj, size in self._iter_entries(files, unpack_archives):
+                entry = {
+                    "filename": path,
+                    "storage_key": self.document_service.new_storage_key(project_id),
+                    "size": size,
+                }
+
+                if size is not None and size <= self.max_buffered_size:
+                    # Small entries are buffered so the reader can move on to
+                    # the next archive member while the pool uploads this one
+                    data = fileobj.read()
+                    entry["size"] = len(data)
+                    in_flight.acquire()
+                    future = pool.submit(self._store_bytes, entry, data)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+                else:
+                    # Large entries are streamed straight from the archive
+                    self._collect(self._store_stream(entry, fileobj), results, pending)
+
+                # Collect finished uploads in submission order
+                while futures and futures[0].done():
+                    self._collect(futures.popleft().result(), results, pending)
+                self._flush_batches(db, project_id, user_id, discipline, pending)
+
+            for future in futures:
+                self._collect(future.result(), results, pending)
+
+        self._flush_batches(db, project_id, user_id, discipline, pending, final=True)
+
+        created = sum(1 for r in results if r["status"] == "created")
+        return {
+            "project_id": project_id,
+            "total": len(results),
+            "created": created,
+            "failed": len(results) - created,
+            "results": [self._manifest_entry(r) for r in results],
+        }
+
+    def _iter_entries(
+        self,
+        files: List[Tuple[str, BinaryIO]],
+        unpack_archives: bool
+    ) -> Iterator[Tuple[str, BinaryIO, Optional[int]]]:
+        """Yield (path, fileobj, size) for every importable file"""
+        for filename, fileobj in files:
+            lower = filename.lower()
+            if unpack_archives and lower.endswith(".zip"):
+                yield from self._iter_zip(fileobj)
+            elif unpack_archives and lower.endswith(ARCHIVE_SUFFIXES):
+                yield from self._iter_tar(fileobj)
+            else:
+                yield filename, fileobj, self._fileobj_size(fileobj)
+
+    def _iter_zip(self, fileobj: BinaryIO) -> Iterator[Tuple[str, BinaryIO, Optional[int]]]:
+        # Members are decompressed lazily, one at a time
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or self._is_ignored(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member, info.file_size
+
+    def _iter_tar(self, fileobj: BinaryIO) -> Iterator[Tuple[str, BinaryIO, Optional[int]]]:
+        # "r|*" reads the archive as a forward-only stream (any compression)
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile() or self._is_ignored(member.name):
+                    continue
+                yield member.name, archive.extractfile(member), member.size
+
+    def _store_bytes(self, entry: Dict, data: bytes) -> Dict:
+        try:
+            self.storage.put_object(entry["storage_key"], data)
+            entry["status"] = "stored"
+        except Exception as e:
+            logger.warning(f"Bulk import failed to store {entry['filename']}: {e}")
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        return entry
+
+    def _store_stream(self, entry: Dict, fileobj: BinaryIO) -> Dict:
+        try:
+            self.storage.upload_fileobj(entry["storage_key"], fileobj)
+            entry["status"] = "stored"
+        except Exception as e:
+            logger.warning(f"Bulk import failed to store {entry['filename']}: {e}")
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        return entry
+
+    def _collect(self, entry: Dict, results: List[Dict], pending: List[Dict]):
+        results.append(entry)
+        if entry["status"] == "stored":
+            pending.append(entry)
+
+    def _flush_batches(
+        self,
+        db: Session,
+        project_id: str,
+        user_id: str,
+        discipline: str,
+        pending: List[Dict],
+        final: bool = False
+    ):
+        """Insert rows for stored entries once a full batch is available"""
+        while len(pending) >= self.batch_size or (final and pending):
+            batch = pending[:self.batch_size]
+            del pending[:self.batch_size]
+            self._insert_batch(db, project_id, user_id, discipline, batch)
+
+    def _insert_batch(
+        self,
+        db: Session,
+        project_id: str,
+        user_id: str,
+        discipline: str,
+        batch: List[Dict]
+    ):
+        """Create Document and DocumentVersion rows for one batch"""
+        now = datetime.utcnow()
+        project_uuid = uuid.UUID(project_id)
+        user_uuid = uuid.UUID(user_id)
+        documents, versions, pointers = [], [], []
+
+        for entry in batch:
+            document_id = uuid.uuid4()
+            version_id = uuid.uuid4()
+            basename = os.path.basename(entry["filename"]) or entry["filename"]
+            documents.append({
+                "id": document_id,
+                "project_id": project_uuid,
+                "name": basename[:255],
+                "file_type": self.document_service._get_file_type(basename.split(".")[-1].lower()),
+                "discipline": discipline,
+                "status": DocumentStatusEnum.DRAFT,
+                "owner_id": user_uuid,
+                "version_counter": 1,
+                "created_at": now,
+                "updated_at": now,
+            })
+            versions.append({
+                "id": version_id,
+                "document_id": document_id,
+                "version_number": 1,
+                "file_path": self.storage.url_for(entry["storage_key"]),
+                "file_size": entry["size"],
+                "uploader_id": user_uuid,
+                "change_summary": "Bulk import",
+                "created_at": now,
+            })
+            # current_version_id is set after both rows exist (circular FK)
+            pointers.append({"id": document_id, "current_version_id": version_id})
+            entry["document_id"] = document_id
+            entry["version_id"] = version_id
+
+        try:
+            db.execute(insert(Document), documents)
+            db.execute(insert(DocumentVersion), versions)
+            db.execute(update(Document), pointers)
+            search_service.index_entries(db, [search_service.build_entry(row) for row in documents])
+            db.commit()
+            dirty_projects.mark(project_uuid)
+            for entry in batch:
+                entry["status"] = "created"
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Bulk import batch of {len(batch)} rows failed: {e}", exc_info=True)
+            for entry in batch:
+                entry["status"] = "failed"
+                entry["error"] = "Database insert failed"
+                entry.pop("document_id", None)
+                entry.pop("version_id", None)
+                self._discard_object(entry["storage_key"])
+
+    def _discard_object(self, storage_key: str):
+        try:
+            self.storage.delete_object(storage_key)
+        except Exception as e:
+            logger.warning(f"Could not remove orphaned object {storage_key}: {e}")
+
+    def _manifest_entry(self, entry: Dict) -> Dict:
+        return {
+            "filename": entry["filename"],
+            "status": entry["status"],
+            "document_id": entry.get("document_id"),
+            "version_id": entry.get("version_id"),
+            "size": entry.get("size"),
+            "error": entry.get("error"),
+        }
+
+    def _is_ignored(self, path: str) -> bool:
+        basename = os.path.basename(path)
+        return path.startswith(IGNORED_PREFIXES) or basename.startswith("._") or basename in IGNORED_NAMES
+
+    def _fileobj_size(self, fileobj: BinaryIO) -> Optional[int]:
+        try:
+            position = fileobj.tell()
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell() - position
+            fileobj.seek(position)
+            return size
+        except (AttributeError, OSError):
+            return None
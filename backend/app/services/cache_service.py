@@ -0,0 +1,325 @@
+"""
+Two-Tier Cache
+
+Read-through cache for hot metadata: a small per-process LRU in front of
+Redis. Values are JSON documents.
+
+- Local tier: a few seconds of TTL, so an invalidation made by another
+  process is seen after at most CACHE_LOCAL_TTL_SECONDS.
+- Redis tier: shared by every API and worker process; invalidated
+  explicitly on writes and expired after CACHE_TTL_SECONDS.
+- Invalidation races: invalidate() bumps a generation counter per key,
+  and a loader only writes its value back if the generation is the one
+  it saw before reading. A value read just before a write committed is
+  returned to its caller but never cached over the invalidation.
+- Stampede protection: concurrent misses for one key in a process wait
+  on a per-key lock, and across processes a short Redis lock (SET NX PX)
+  lets one loader run while the others poll for its result.
+
+Redis errors never fail a request: the cache steps aside for a few
+seconds and values are loaded from the database.
+"""
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Deletes the lock only if it still holds our token
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Writes the value only if the key's generation is still ARGV[1]
+_SET_IF_GENERATION = """
+if (redis.call("get", KEYS[2]) or "") == ARGV[1] then
+    redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Generations outlive values by far, so a loader never sees one expire
+GENERATION_TTL_FACTOR = 10
+
+# How long Redis is skipped after an error
+REDIS_BACKOFF_SECONDS = 5.0
+
+
+class LocalLRUCache:
+    """Thread-safe LRU of JSON payloads with a per-entry deadline"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key: str, payload: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        namespace: str = "cache",
+        redis_factory: Callable[[], redis.Redis] = get_redis,
+        ttl: int = None,
+        local_ttl: float = None,
+        max_entries: int = None,
+        lock_timeout_ms: int = None
+    ):
+        self.namespace = namespace
+        self.redis_factory = redis_factory
+        self.ttl = ttl or settings.CACHE_TTL_SECONDS
+        self.lock_timeout_ms = lock_timeout_ms or settings.CACHE_LOCK_TIMEOUT_MS
+        self.local = LocalLRUCache(
+            max_entries or settings.CACHE_LOCAL_MAX_ENTRIES,
+            local_ttl if local_ttl is not None else settings.CACHE_LOCAL_TTL_SECONDS
+        )
+        self.enabled = settings.CACHE_ENABLED
+        self._key_locks: Dict[str, list] = {}
+        self._key_locks_guard = threading.Lock()
+        self._redis_skip_until = 0.0
+        self._stats = {"local_hits": 0, "redis_hits": 0, "loads": 0, "lock_waits": 0}
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int = None,
+        cacheable: Callable[[Any], bool] = None
+    ) -> Any:
+        """
+        Return the cached value for key, calling loader on a miss
+
+        Args:
+            key: Cache key (namespaced internally)
+            loader: Produces the value; None results are not cached
+            ttl: Redis TTL override in seconds
+            cacheable: Values it rejects are returned but not cached,
+                e.g. states about to change
+
+        Returns:
+            The value after a JSON round trip (UUIDs and datetimes become
+            strings), identical whichever tier served it
+        """
+        if not self.enabled:
+            return self._normalize(loader())
+
+        payload = self.local.get(key)
+        if payload is not _MISSING:
+            self._stats["local_hits"] += 1
+            return json.loads(payload)
+
+        # Threads of this process missing the same key load it once
+        with self._single_flight(key):
+            payload = self.local.get(key)
+            if payload is not _MISSING:
+                self._stats["local_hits"] += 1
+                return json.loads(payload)
+
+            payload = self._redis_get(key)
+            cached = True
+            if payload is None:
+                payload, cached = self._load_with_lock(key, loader, ttl or self.ttl, cacheable)
+            else:
+                self._stats["redis_hits"] += 1
+
+            if payload is None:
+                return None
+            if cached:
+                self.local.set(key, payload)
+            return json.loads(payload)
+
+    def invalidate(self, *keys: str):
+        """Drop keys from both tiers (call after the write has committed)"""
+        for key in keys:
+            self.local.delete(key)
+        client = self._redis()
+        if client is None or not keys:
+            return
+        try:
+            pipeline = client.pipeline()
+            pipeline.delete(*[self._redis_key(key) for key in keys])
+            for key in keys:
+                # Loaders that read before this write no longer match
+                pipeline.incr(self._generation_key(key))
+                pipeline.expire(self._generation_key(key), self.ttl * GENERATION_TTL_FACTOR)
+            pipeline.execute()
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def _load_with_lock(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int,
+        cacheable: Callable[[Any], bool] = None
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Load a missing key, letting only one process run the loader at a time
+
+        Returns:
+            (payload, whether it may be cached locally)
+        """
+        client = self._redis()
+        lock_key = self._redis_key(key) + ":lock"
+        token = uuid.uuid4().hex
+        locked = False
+        generation = ""
+
+        if client is not None:
+            try:
+                locked = bool(client.set(lock_key, token, nx=True, px=self.lock_timeout_ms))
+                # Read before the loader, so a write committed after it shows
+                generation = (client.get(self._generation_key(key)) or b"").decode()
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                client = None
+
+            if client is not None and not locked:
+                # Someone else is loading; wait for their result
+                self._stats["lock_waits"] += 1
+                payload = self._wait_for_value(client, key, lock_key)
+                if payload is not None:
+                    return payload, True
+
+        try:
+            self._stats["loads"] += 1
+            value = loader()
+            if value is None:
+                return None, False
+            payload = json.dumps(jsonable_encoder(value), separators=(",", ":"))
+            if cacheable is not None and not cacheable(value):
+                return payload, False
+            if client is not None:
+                try:
+                    written = client.eval(
+                        _SET_IF_GENERATION, 2,
+                        self._redis_key(key), self._generation_key(key),
+                        generation, payload, ttl
+                    )
+                except redis.RedisError as e:
+                    self._redis_failed(e)
+                    written = True
+                if not written:
+                    # Invalidated while loading: the value may predate the write
+                    return payload, False
+            return payload, True
+        finally:
+            if locked:
+                try:
+                    client.eval(_RELEASE_LOCK, 1, lock_key, token)
+                except redis.RedisError as e:
+                    self._redis_failed(e)
+
+    def _wait_for_value(self, client: redis.Redis, key: str, lock_key: str) -> Optional[str]:
+        deadline = time.monotonic() + self.lock_timeout_ms / 1000.0
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            try:
+                payload, lock_held = client.pipeline().get(self._redis_key(key)).exists(lock_key).execute()
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                return None
+            if payload is not None:
+                return payload.decode()
+            if not lock_held:
+                # Loader finished without a cacheable value, or gave up
+                return None
+        return None
+
+    def _redis_get(self, key: str) -> Optional[str]:
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            payload = client.get(self._redis_key(key))
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+        return payload.decode() if payload is not None else None
+
+    def _redis(self) -> Optional[redis.Redis]:
+        if time.monotonic() < self._redis_skip_until:
+            return None
+        return self.redis_factory()
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Cache Redis unavailable, using the database for {REDIS_BACKOFF_SECONDS:.0f}s: {error}")
+        self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _generation_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}:gen"
+
+    def _normalize(self, value: Any) -> Any:
+        if value is None:
+            return None
+        return json.loads(json.dumps(jsonable_encoder(value)))
+
+    @contextmanager
+    def _single_flight(self, key: str):
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+
+# Document, version and analysis metadata
+metadata_cache = TwoTierCache(namespace="pw:meta:v1")
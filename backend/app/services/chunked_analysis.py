@@ -0,0 +1,388 @@
+"""
+Chunked Analysis
+
+Map-reduce analysis for documents longer than one prompt. The extracted
+text is split into chunks of about ANALYSIS_CHUNK_TOKENS, every chunk is
+analyzed concurrently through the rate-limited LLM client (map), and the
+results are merged (reduce): entities and extracted data are merged and
+deduplicated locally, and one more model call condenses the per-chunk
+summaries into the document summary.
+
+Chunks are made of whole pages, and a chunk also ends after any page
+whose text hash has its low bits clear, so boundaries depend on content
+rather than on position. An edit only changes the chunks around it, and
+with per-chunk results cached by chunk text, re-analyzing an edited
+document only calls the model for those chunks.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.analysis_cache import AnalysisChunkCacheEntry
+from app.services.analysis_metrics import AnalysisTimings
+from app.services.analysis_progress import AnalysisProgress
+from app.services.llm_client import LLMClient, LLMRetryableError, parse_json_response, token_usage
+from app.services.text_extraction import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Bump when the chunk prompt or its parsing changes
+MAP_PROMPT_VERSION = "1"
+
+# A chunk past half its size ends after pages whose hash is 0 mod this
+CUT_MODULUS = 4
+
+MAP_PROMPT = """
+Analyze the following section of a longer {file_type} document and provide:
+
+1. A concise 2-3 sentence summary of this section
+2. Key data extracted (dates, numbers, names, etc.) in JSON format
+3. Key entities (persons, companies, locations, dates) in JSON format
+4. Confidence score (0-1) for the analysis quality
+
+Section content:
+{text}
+
+Please respond in the following JSON format:
+{{
+    "summary": "2-3 sentence summary here",
+    "extracted_data": {{"key1": "value1", "key2": "value2"}},
+    "key_entities": {{
+        "persons": ["name1", "name2"],
+        "companies": ["company1"],
+        "locations": ["location1"],
+        "dates": ["date1"]
+    }},
+    "confidence_score": 0.95
+}}
+"""
+
+REDUCE_PROMPT = """
+The following are summaries of consecutive sections of the document "{filename}" ({file_type}).
+Write a concise 3-sentence summary of the whole document.
+
+{summaries}
+
+Please respond in the following JSON format:
+{{
+    "summary": "3-sentence summary here"
+}}
+"""
+
+
+def split_into_chunks(text: str, page_offsets: List[int], max_chars: int) -> List[str]:
+    """
+    Split text into chunks of whole pages of at most max_chars
+
+    Pages longer than max_chars are split at line breaks (or, failing
+    that, hard). A chunk ends when the next page would not fit, or once
+    it is half full after a page whose CRC-32 is a multiple of
+    CUT_MODULUS.
+    """
+    bounds = sorted({offset for offset in page_offsets if 0 < offset < len(text)})
+    starts = [0] + bounds
+    pages = [text[start:end] for start, end in zip(starts, bounds + [len(text)])]
+
+    pieces = []
+    for page in pages:
+        pieces.extend(_split_long(page, max_chars))
+
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) > max_chars:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece)
+        if size >= max_chars // 2 and zlib.crc32(piece.encode()) % CUT_MODULUS == 0:
+            chunks.append("".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind("\n", 0, max_chars) + 1 or max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def chunk_hash(file_type: str, text: str) -> str:
+    return hashlib.sha256(f"{file_type}\n{text}".encode()).hexdigest()
+
+
+def _entity_key(name: str) -> str:
+    # "ACME Corp." and "Acme corp" are one entity
+    return re.sub(r"\s+", " ", name).strip(" .,;:").casefold()
+
+
+def merge_entities(entity_maps: List[Dict], max_per_type: int = None) -> Dict[str, List[str]]:
+    """
+    Merge key_entities from several chunks
+
+    Entities are deduplicated case- and whitespace-insensitively, keeping
+    the first spelling seen, and ordered by how many chunks mention them.
+    """
+    max_per_type = max_per_type or settings.ANALYSIS_MAX_ENTITIES_PER_TYPE
+    merged: Dict[str, Dict[str, list]] = {}
+    for entities in entity_maps:
+        if not isinstance(entities, dict):
+            continue
+        for category, names in entities.items():
+            if isinstance(names, str):
+                names = [names]
+            if not isinstance(names, list):
+                continue
+            seen = merged.setdefault(category, {})
+            for name in names:
+                if not isinstance(name, str) or not _entity_key(name):
+                    continue
+                entry = seen.setdefault(_entity_key(name), [name, 0])
+                entry[1] += 1
+    return {
+        category: [name for name, _ in sorted(seen.values(), key=lambda entry: -entry[1])][:max_per_type]
+        for category, seen in merged.items()
+    }
+
+
+def merge_extracted_data(data_maps: List[Dict]) -> Dict:
+    """Merge extracted_data from several chunks; keys with differing values get a list of them"""
+    merged: Dict[str, list] = {}
+    for data in data_maps:
+        if not isinstance(data, dict):
+            continue
+        for key, value in data.items():
+            values = merged.setdefault(key, [])
+            if value not in values:
+                values.append(value)
+    return {key: values[0] if len(values) == 1 else values for key, values in merged.items()}
+
+
+class ChunkedAnalyzer:
+    def __init__(self, llm: LLMClient, model_name: str, prompt_chars: int):
+        """
+        Args:
+            llm: Rate-limited client for the model
+            model_name: Model name, part of the chunk cache key
+            prompt_chars: Most text per prompt; chunks are at most this
+        """
+        self.llm = llm
+        self.model_name = model_name
+        self.prompt_chars = prompt_chars
+
+    def chunk_chars(self) -> int:
+        return min(self.prompt_chars, settings.ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN)
+
+    def analyze(
+        self,
+        extracted: Dict,
+        file_type: str,
+        filename: str,
+        db: Optional[Session] = None,
+        progress: Optional[AnalysisProgress] = None,
+        timings: Optional[AnalysisTimings] = None
+    ) -> Dict:
+        """
+        Analyze a long text chunk by chunk and merge the results
+
+        Args:
+            extracted: extract_text_from_file result
+            file_type: File type, part of every prompt
+            filename: Original filename, for the reduce prompt
+            db: Session for the chunk cache (the caller commits); None
+                analyzes every chunk
+            progress: Receives chunk counts as chunks finish, and the
+                parsing stage before the merge
+            timings: Receives the llm (map and reduce calls) and parse
+                (merge) stages and the token counts of the calls made
+
+        Returns:
+            Dict with summary, extracted_data (dict), key_entities,
+            confidence_score, prompt_chars (of the calls made) and chunks
+            ({"total", "cached"})
+
+        Raises:
+            LLMRetryableError: Chunks stayed throttled; the others are cached
+        """
+        timings = timings or AnalysisTimings()
+        chunks = split_into_chunks(extracted["text"], extracted["page_offsets"], self.chunk_chars())
+        hashes = [chunk_hash(file_type, chunk) for chunk in chunks]
+        cached = self._load_cached(db, hashes) if db is not None else {}
+
+        # Repeated sections (boilerplate pages) are sent once
+        missing = {}
+        for chunk, h in zip(chunks, hashes):
+            if h not in cached:
+                missing.setdefault(h, chunk)
+        cached_count = sum(1 for h in hashes if h in cached)
+        logger.info(
+            f"Analyzing {filename} in {len(chunks)} chunks "
+            f"({cached_count} cached, {len(missing)} distinct to analyze)"
+        )
+        if progress:
+            progress.stage("llm_call", chunks=len(chunks) - len(missing), chunk_total=len(chunks))
+        with timings.stage("llm"):
+            mapped = asyncio.run(self._map(list(missing.values()), file_type, progress, len(chunks)))
+
+        results: Dict[str, Dict] = dict(cached)
+        new_rows = []
+        errors = []
+        prompt_chars = 0
+        for h, outcome in zip(missing, mapped):
+            if isinstance(outcome, BaseException):
+                errors.append(outcome)
+                continue
+            result, chars, usage = outcome
+            results[h] = result
+            prompt_chars += chars
+            timings.calls([usage])
+            new_rows.append({"chunk_hash": h, "result": result, "prompt_chars": chars})
+        if db is not None and new_rows:
+            self._store(db, new_rows)
+        if errors:
+            # Chunks done so far stay cached for the retry
+            if db is not None and new_rows:
+                db.commit()
+            raise next((e for e in errors if isinstance(e, LLMRetryableError)), errors[0])
+
+        if progress:
+            progress.stage("parsing")
+        ordered = [results[h] for h in hashes]
+        with timings.stage("llm"):
+            summary, reduce_chars, usages = asyncio.run(self._reduce([r["summary"] for r in ordered], file_type, filename))
+        timings.calls(usages)
+        weights = [len(chunk) for chunk in chunks]
+
+        with timings.stage("parse"):
+            merged = {
+                "summary": summary,
+                "extracted_data": merge_extracted_data([r.get("extracted_data") for r in ordered]),
+                "key_entities": merge_entities([r.get("key_entities") for r in ordered]),
+                "confidence_score": sum(float(r.get("confidence_score", 0.75)) * w for r, w in zip(ordered, weights)) / sum(weights),
+                "prompt_chars": prompt_chars + reduce_chars,
+                "chunks": {"total": len(chunks), "cached": cached_count},
+            }
+        return merged
+
+    async def _map(self, chunks: List[str], file_type: str, progress: Optional[AnalysisProgress], total: int) -> List:
+        done = total - len(chunks)
+
+        async def analyze_and_report(chunk):
+            nonlocal done
+            outcome = await self._analyze_chunk(chunk, file_type)
+            done += 1
+            if progress:
+                progress.chunks(done, total)
+            return outcome
+
+        return await asyncio.gather(
+            *[analyze_and_report(chunk) for chunk in chunks],
+            return_exceptions=True
+        )
+
+    async def _analyze_chunk(self, text: str, file_type: str) -> Tuple[Dict, int, Tuple[int, int]]:
+        prompt = MAP_PROMPT.format(file_type=file_type, text=text)
+        response = await self.llm.generate(prompt)
+        try:
+            parsed = parse_json_response(response.text)
+        except json.JSONDecodeError:
+            # Fallback: use raw response as summary
+            parsed = {"summary": response.text[:500], "confidence_score": 0.75}
+        return {
+            "summary": str(parsed.get("summary", "")),
+            "extracted_data": parsed.get("extracted_data", {}),
+            "key_entities": parsed.get("key_entities", {}),
+            "confidence_score": float(parsed.get("confidence_score", 0.85)),
+        }, len(prompt), token_usage(prompt, response)
+
+    async def _reduce(self, summaries: List[str], file_type: str, filename: str) -> Tuple[str, int, List[Tuple[int, int]]]:
+        """Condense chunk summaries, in rounds while they do not fit in one prompt"""
+        prompt_chars = 0
+        usages = []
+        while True:
+            groups = self._group(summaries)
+            prompts = [
+                REDUCE_PROMPT.format(
+                    filename=filename,
+                    file_type=file_type,
+                    summaries="\n\n".join(f"Section {i + 1}: {s}" for i, s in enumerate(group))
+                )
+                for group in groups
+            ]
+            responses = await asyncio.gather(*[self.llm.generate(prompt) for prompt in prompts])
+            prompt_chars += sum(len(prompt) for prompt in prompts)
+            usages.extend(token_usage(prompt, response) for prompt, response in zip(prompts, responses))
+            summaries = [self._summary_of(response.text) for response in responses]
+            if len(summaries) == 1:
+                return summaries[0], prompt_chars, usages
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        groups, current, size = [], [], 0
+        for summary in summaries:
+            if current and size + len(summary) > self.prompt_chars:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += len(summary)
+        groups.append(current)
+        # Always make progress, even with one oversized summary per group
+        if len(groups) == len(summaries) > 1:
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        return groups
+
+    def _summary_of(self, text: str) -> str:
+        try:
+            return str(parse_json_response(text).get("summary", ""))
+        except (json.JSONDecodeError, AttributeError):
+            return text[:500]
+
+    def _load_cached(self, db: Session, hashes: List[str]) -> Dict[str, Dict]:
+        cached = {}
+        unique = list(set(hashes))
+        for i in range(0, len(unique), 500):
+            rows = db.execute(
+                select(AnalysisChunkCacheEntry.chunk_hash, AnalysisChunkCacheEntry.result).where(
+                    AnalysisChunkCacheEntry.chunk_hash.in_(unique[i:i + 500]),
+                    AnalysisChunkCacheEntry.model == self.model_name,
+                    AnalysisChunkCacheEntry.prompt_version == MAP_PROMPT_VERSION
+                )
+            )
+            cached.update({h: result for h, result in rows})
+        return cached
+
+    def _store(self, db: Session, rows: List[Dict]):
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        now = datetime.utcnow()
+        # Repeated chunks within one document are stored once
+        unique = {row["chunk_hash"]: row for row in rows}
+        db.execute(
+            insert(AnalysisChunkCacheEntry).on_conflict_do_nothing(
+                index_elements=["chunk_hash", "model", "prompt_version"]
+            ),
+            [
+                {**row, "model": self.model_name, "prompt_version": MAP_PROMPT_VERSION, "created_at": now}
+                for row in unique.values()
+            ]
+        )
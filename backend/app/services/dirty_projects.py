@@ -0,0 +1,98 @@
+"""
+Dirty Projects
+
+Projects whose KPI inputs changed since their KPIs were last computed.
+Write paths (documents created or deleted, RFIs created or updated,
+transmittals created, analyses stored) add the project to a Redis set
+after their commit; the periodic KPI task pops the set and recomputes
+only those projects, so KPI load follows activity rather than the
+number of projects.
+
+Marks are best effort: a mark lost to a Redis outage, and KPIs that
+change with time alone (the 24-hour upload window of KPI-001), are
+caught by the slower full sweep over every active project.
+"""
+import time
+import logging
+from typing import Callable, List, Optional
+
+import redis
+
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# How long Redis is skipped after an error
+REDIS_BACKOFF_SECONDS = 5.0
+
+# Members popped per SPOP
+POP_BATCH_SIZE = 500
+
+
+class DirtyProjectSet:
+    def __init__(self, key: str = "pw:kpi:dirty", redis_factory: Callable[[], redis.Redis] = get_redis):
+        self.key = key
+        self.redis_factory = redis_factory
+        self._redis_skip_until = 0.0
+
+    def mark(self, *project_ids):
+        """Flag projects for KPI recomputation; never raises"""
+        if not project_ids:
+            return
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.sadd(self.key, *[str(project_id) for project_id in project_ids])
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def pop_all(self) -> Optional[List[str]]:
+        """
+        Take every flagged project
+
+        Popping is atomic, so projects marked meanwhile stay for the next
+        run and concurrent runs never get the same project.
+
+        Returns:
+            Project IDs, or None when Redis is unavailable and which
+            projects changed is unknown
+        """
+        client = self._redis()
+        if client is None:
+            return None
+        popped = []
+        try:
+            while True:
+                batch = client.spop(self.key, POP_BATCH_SIZE)
+                if not batch:
+                    break
+                popped.extend(member.decode() for member in batch)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            # Hand back what was taken; the rest waits for the next run
+            return popped or None
+        return popped
+
+    def size(self) -> Optional[int]:
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            return client.scard(self.key)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+
+    def _redis(self) -> Optional[redis.Redis]:
+        if time.monotonic() < self._redis_skip_until:
+            return None
+        return self.redis_factory()
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Dirty project set Redis unavailable for {REDIS_BACKOFF_SECONDS:.0f}s: {error}")
+        self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+
+# Singleton instance
+dirty_projects = DirtyProjectSet()
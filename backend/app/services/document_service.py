@@ -1,22 +1,33 @@
 import uuid
 import os
+import hashlib
+import json
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional
 from fastapi import UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy import desc, select, tuple_, update
 from datetime import datetime
-import boto3
 
-from app.models.document import Document, DocumentVersion, DocumentStatusEnum, FileTypeEnum
 from app.config import settings
+from app.models.document import Document, DocumentVersion, DocumentStatusEnum, FileTypeEnum, StorageModeEnum
+from app.models.document_analysis import DocumentAnalysis
+from app.schemas.document import DocumentResponse, DocumentVersionResponse
+from app.services.cache_service import metadata_cache
+from app.services.chunk_store import chunk_store
+from app.services.dirty_projects import dirty_projects
+from app.services.search_service import search_service
+from app.services.similarity_service import similarity_service
+from app.services.storage_service import storage_service
+from app.utils.helpers import decode_cursor
 
 class DocumentService:
     def __init__(self):
-        self.s3_client = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
+        self.storage = storage_service
+        self.chunk_store = chunk_store
+        self.search = search_service
+        self.cache = metadata_cache
     
     async def upload_document(
         self,
@@ -30,33 +41,113 @@ class DocumentService:
     ) -> Document:
         """Upload a new document or new version"""
         
-        # Determine file type
-        file_ext = file.filename.split(".")[-1].lower()
-        file_type = self._get_file_type(file_ext)
+        # Upload to storage
+        stored = self._store_file(db, project_id, file)
+        
+        return self.create_document_record(
+            db,
+            project_id=project_id,
+            user_id=user_id,
+            filename=file.filename,
+            name=name,
+            description=description,
+            discipline=discipline,
+            **stored
+        )
+    
+    async def upload_new_version(
+        self,
+        db: Session,
+        document_id: str,
+        file: UploadFile,
+        user_id: str,
+        change_summary: str = None
+    ) -> DocumentVersion:
+        """Upload a new version of an existing document"""
+        document = self.get_document(db, document_id)
+        if not document:
+            raise ValueError("Document not found")
         
-        # Upload to S3
-        s3_key = f"projects/{project_id}/documents/{uuid.uuid4()}"
-        file_content = await file.read()
+        # Store the file before taking the counter lock, so the lock is
+        # only held for the short allocate-and-insert transaction. In chunked
+        # mode only chunks not shared with earlier versions are uploaded.
+        stored = self._store_file(db, str(document.project_id), file)
         
-        self.s3_client.put_object(
-            Bucket=settings.AWS_S3_BUCKET,
-            Key=s3_key,
-            Body=file_content,
-            ContentType=file.content_type
+        version = DocumentVersion(
+            id=uuid.uuid4(),
+            document_id=document.id,
+            version_number=self.allocate_version_number(db, document.id),
+            uploader_id=uuid.UUID(user_id),
+            change_summary=change_summary or f"Uploaded {file.filename}",
+            **stored
         )
+        db.add(version)
+        document.current_version_id = version.id
+        document.updated_at = datetime.utcnow()
+        db.commit()
+        self.invalidate_document_cache(document.id)
+        db.refresh(version)
+        
+        return version
+    
+    def allocate_version_number(self, db: Session, document_id: uuid.UUID) -> int:
+        """
+        Reserve the next version number for a document
         
-        s3_url = f"s3://{settings.AWS_S3_BUCKET}/{s3_key}"
+        Increments documents.version_counter with UPDATE ... RETURNING. The
+        updated row stays locked until the caller commits, so concurrent
+        uploads for the same document are serialized and each gets a
+        distinct number without loading existing versions. The unique
+        (document_id, version_number) index backs this up.
+        """
+        version_number = db.execute(
+            update(Document)
+            .where(Document.id == document_id, Document.deleted_at == None)
+            .values(version_counter=Document.version_counter + 1)
+            .returning(Document.version_counter),
+            execution_options={"synchronize_session": False}
+        ).scalar_one_or_none()
+        
+        if version_number is None:
+            raise ValueError("Document not found")
+        return version_number
+    
+    def new_storage_key(self, project_id: str) -> str:
+        """Allocate a storage key for a new document file"""
+        return f"projects/{project_id}/documents/{uuid.uuid4()}"
+    
+    def create_document_record(
+        self,
+        db: Session,
+        project_id: str,
+        user_id: str,
+        filename: str,
+        file_path: str,
+        file_size: int,
+        name: str = None,
+        description: str = None,
+        discipline: str = None,
+        content_hash: str = None,
+        storage_mode: str = StorageModeEnum.FULL,
+        chunk_manifest: list = None
+    ) -> Document:
+        """Create a document and its first version for an already stored file"""
+        
+        # Determine file type
+        file_ext = filename.split(".")[-1].lower()
+        file_type = self._get_file_type(file_ext)
         
         # Create document record
         document = Document(
             id=uuid.uuid4(),
             project_id=uuid.UUID(project_id),
-            name=name or file.filename,
+            name=name or filename,
             description=description,
             file_type=file_type,
             discipline=discipline,
             owner_id=uuid.UUID(user_id),
-            status=DocumentStatusEnum.DRAFT
+            status=DocumentStatusEnum.DRAFT,
+            version_counter=1
         )
         
         # Create first version
@@ -64,17 +155,25 @@ class DocumentService:
             id=uuid.uuid4(),
             document_id=document.id,
             version_number=1,
-            file_path=s3_url,
-            file_size=len(file_content),
+            file_path=file_path,
+            file_size=file_size,
+            content_hash=content_hash,
+            storage_mode=storage_mode,
+            chunk_manifest=chunk_manifest,
             uploader_id=uuid.UUID(user_id),
             change_summary="Initial upload"
         )
         
-        document.current_version_id = version.id
         document.versions.append(version)
         
         db.add(document)
+        # documents and document_versions reference each other, so the
+        # current version pointer is set once both rows exist
+        db.flush()
+        document.current_version_id = version.id
+        self.search.index_entries(db, [self.search.build_entry(document)])
         db.commit()
+        dirty_projects.mark(document.project_id)
         db.refresh(document)
         
         return document
@@ -93,21 +192,50 @@ class DocumentService:
         skip: int = 0,
         limit: int = 10,
         discipline: str = None,
-        status: str = None
+        status: str = None,
+        cursor: str = None,
+        fields: list = None
     ) -> list:
-        """List documents in project with optional filters"""
-        query = db.query(Document).filter(
+        """
+        List documents in project with optional filters
+        
+        Pages are ordered by (created_at, id) descending. Passing the cursor
+        of the previous page's last row seeks straight to the next page via
+        the partial indexes on live rows; skip is kept for older clients.
+        
+        With fields, only those columns (plus the id/created_at sort key) are
+        selected and plain dicts are returned instead of ORM instances.
+        """
+        conditions = [
             Document.project_id == uuid.UUID(project_id),
             Document.deleted_at == None
-        )
+        ]
         
         if discipline:
-            query = query.filter(Document.discipline == discipline)
+            conditions.append(Document.discipline == discipline)
         
         if status:
-            query = query.filter(Document.status == status)
+            conditions.append(Document.status == status)
+        
+        if cursor:
+            created_at, document_id = decode_cursor(cursor)
+            conditions.append(
+                tuple_(Document.created_at, Document.id) < tuple_(created_at, document_id)
+            )
+        
+        if fields:
+            columns = dict.fromkeys(["id", "created_at", *fields])
+            stmt = select(*[getattr(Document, name) for name in columns]).where(*conditions)
+        else:
+            stmt = select(Document).where(*conditions)
+        
+        stmt = stmt.order_by(desc(Document.created_at), desc(Document.id)).limit(limit)
+        if skip and not cursor:
+            stmt = stmt.offset(skip)
         
-        return query.order_by(desc(Document.created_at)).offset(skip).limit(limit).all()
+        if fields:
+            return [dict(row) for row in db.execute(stmt).mappings()]
+        return db.execute(stmt).scalars().all()
     
     def get_document_versions(self, db: Session, document_id: str) -> list:
         """Get all versions of a document"""
@@ -118,6 +246,9 @@ class DocumentService:
     def restore_version(self, db: Session, document_id: str, version_id: str) -> Document:
         """Restore document to a previous version"""
         document = self.get_document(db, document_id)
+        if not document:
+            raise ValueError("Document not found")
+        
         version = db.query(DocumentVersion).filter(
             DocumentVersion.id == uuid.UUID(version_id),
             DocumentVersion.document_id == uuid.UUID(document_id)
@@ -130,18 +261,24 @@ class DocumentService:
         new_version = DocumentVersion(
             id=uuid.uuid4(),
             document_id=document.id,
-            version_number=len(document.versions) + 1,
+            version_number=self.allocate_version_number(db, document.id),
             file_path=version.file_path,
             file_size=version.file_size,
+            content_hash=version.content_hash,
+            storage_mode=version.storage_mode,
+            chunk_manifest=version.chunk_manifest,
             change_summary=f"Restored from version {version.version_number}"
         )
+        if version.storage_mode == StorageModeEnum.CHUNKED:
+            # The restored version shares the old version's chunks
+            self.chunk_store.retain(db, version.chunk_manifest)
         
-        document.versions.append(new_version)
         document.current_version_id = new_version.id
         document.updated_at = datetime.utcnow()
         
         db.add(new_version)
         db.commit()
+        self.invalidate_document_cache(document.id)
         
         return document
     
@@ -150,7 +287,203 @@ class DocumentService:
         document = self.get_document(db, document_id)
         if document:
             document.deleted_at = datetime.utcnow()
+            self.search.remove_document(db, document.id)
             db.commit()
+            self.invalidate_document_cache(document.id)
+            dirty_projects.mark(document.project_id)
+            similarity_service.remove(document.project_id, [document.id])
+    
+    def get_document_cached(self, db: Session, document_id: str) -> Optional[Dict]:
+        """Document metadata (DocumentResponse fields) through the metadata cache"""
+        document_id = str(uuid.UUID(document_id))
+        
+        def load():
+            document = self.get_document(db, document_id)
+            return DocumentResponse.model_validate(document).model_dump() if document else None
+        
+        return self.cache.get_or_load(f"document:{document_id}", load)
+    
+    def get_document_versions_cached(self, db: Session, document_id: str) -> List[Dict]:
+        """Version list (DocumentVersionResponse fields) through the metadata cache"""
+        document_id = str(uuid.UUID(document_id))
+        
+        def load():
+            versions = self.get_document_versions(db, document_id)
+            # Unknown documents are not cached
+            return [DocumentVersionResponse.model_validate(v).model_dump() for v in versions] or None
+        
+        return self.cache.get_or_load(f"document:{document_id}:versions", load) or []
+    
+    def get_analysis_result(self, db: Session, document_id: str) -> Optional[Dict]:
+        """
+        Analysis results for a document, or its processing status
+        
+        One query when the analysis exists; cached until the analysis task
+        or a document write invalidates it. The processing status is not
+        cached, since it changes as soon as the analysis is stored.
+        
+        Returns:
+            Result dict, or None if the document does not exist
+        """
+        document_id = str(uuid.UUID(document_id))
+        
+        def load():
+            analysis = db.query(DocumentAnalysis).filter(
+                DocumentAnalysis.document_id == uuid.UUID(document_id)
+            ).first()
+            
+            if not analysis:
+                if not self.get_document(db, document_id):
+                    return None
+                return {
+                    "status": "processing",
+                    "message": "Analysis in progress"
+                }
+            
+            return {
+                "status": "completed",
+                "summary": analysis.summary,
+                "extracted_data": json.loads(analysis.extracted_data) if analysis.extracted_data else {},
+                "key_entities": analysis.key_entities or {},
+                "confidence_score": analysis.confidence_score,
+                "processing_time": analysis.processing_time,
+                "analyzed_by": analysis.analyzed_by,
+                "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else None
+            }
+        
+        return self.cache.get_or_load(
+            f"document:{document_id}:analysis",
+            load,
+            cacheable=lambda result: result["status"] != "processing"
+        )
+    
+    def get_analysis_text(self, db: Session, document_id: str) -> Optional[Dict]:
+        """
+        Extracted text of a live document's analysis
+        
+        Not cached: the text is large and rarely read, which is why
+        get_analysis_result leaves it out.
+        
+        Returns:
+            Dict with text, page_offsets and chars, or None without a
+            document or analysis
+        """
+        analysis = db.query(DocumentAnalysis).join(
+            Document, Document.id == DocumentAnalysis.document_id
+        ).options(
+            undefer(DocumentAnalysis.page_offsets)
+        ).filter(
+            DocumentAnalysis.document_id == uuid.UUID(document_id),
+            Document.deleted_at == None
+        ).first()
+        if not analysis:
+            return None
+        text = analysis.ocr_text or ""
+        return {
+            "document_id": document_id,
+            "text": text,
+            "page_offsets": analysis.page_offsets or [],
+            "chars": len(text)
+        }
+    
+    def invalidate_document_cache(self, document_id):
+        """Drop cached metadata, versions and analysis for a document"""
+        document_id = str(document_id)
+        self.cache.invalidate(
+            f"document:{document_id}",
+            f"document:{document_id}:versions",
+            f"document:{document_id}:analysis"
+        )
+    
+    def get_version(self, db: Session, document_id: str, version_id: str) -> DocumentVersion:
+        """Get a version of a live document"""
+        return db.query(DocumentVersion).join(
+            Document, Document.id == DocumentVersion.document_id
+        ).filter(
+            DocumentVersion.id == uuid.UUID(version_id),
+            DocumentVersion.document_id == uuid.UUID(document_id),
+            Document.deleted_at == None
+        ).first()
+    
+    def get_document_version_by_hash(self, db: Session, document_id: str, content_hash: str) -> DocumentVersion:
+        """Get any version of a document with the given content hash"""
+        return db.query(DocumentVersion).filter(
+            DocumentVersion.document_id == uuid.UUID(document_id),
+            DocumentVersion.content_hash == content_hash
+        ).first()
+    
+    def open_version_stream(self, version: DocumentVersion) -> Iterator[bytes]:
+        """Stream a version's file contents, reassembling chunked versions"""
+        if version.storage_mode == StorageModeEnum.CHUNKED:
+            return self.chunk_store.open_stream(version.chunk_manifest)
+        return self.storage.open_stream(self.storage.key_from_url(version.file_path))
+    
+    @contextmanager
+    def version_file(self, db: Session, version: DocumentVersion, suffix: str = "") -> Iterator[str]:
+        """
+        Copy a version's contents to a temporary file for tools that need a path
+        
+        A version stored without a content hash gets it recorded on the way.
+        
+        Args:
+            db: Database session
+            version: Document version
+            suffix: File name suffix, e.g. ".pdf"
+        
+        Yields:
+            Path of the temporary file, removed on exit
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix) as target:
+            digest = hashlib.sha256()
+            for piece in self.open_version_stream(version):
+                digest.update(piece)
+                target.write(piece)
+            target.flush()
+            
+            if not version.content_hash:
+                version.content_hash = digest.hexdigest()
+                db.commit()
+                self.invalidate_document_cache(version.document_id)
+            
+            yield target.name
+    
+    def _store_file(self, db: Session, project_id: str, file: UploadFile) -> Dict:
+        """
+        Store an uploaded file in the configured storage mode
+        
+        Returns:
+            DocumentVersion storage fields (file_path, file_size, content_hash,
+            storage_mode, chunk_manifest)
+        """
+        if settings.DOCUMENT_STORAGE_MODE == StorageModeEnum.CHUNKED:
+            file.file.seek(0)
+            stored = self.chunk_store.store_stream(db, file.file)
+            return {
+                "file_path": f"chunks://{stored['content_hash']}",
+                "file_size": stored["size"],
+                "content_hash": stored["content_hash"],
+                "storage_mode": StorageModeEnum.CHUNKED,
+                "chunk_manifest": stored["manifest"],
+            }
+        
+        storage_key = self.new_storage_key(project_id)
+        file_size, content_hash = self._stream_to_storage(storage_key, file)
+        return {
+            "file_path": self.storage.url_for(storage_key),
+            "file_size": file_size,
+            "content_hash": content_hash,
+            "storage_mode": StorageModeEnum.FULL,
+            "chunk_manifest": None,
+        }
+    
+    def _stream_to_storage(self, storage_key: str, file: UploadFile) -> tuple:
+        """Stream an uploaded file to storage without reading it into memory"""
+        file.file.seek(0, os.SEEK_END)
+        file_size = file.file.tell()
+        file.file.seek(0)
+        reader = HashingReader(file.file)
+        self.storage.upload_fileobj(storage_key, reader, content_type=file.content_type)
+        return file_size, reader.hexdigest()
     
     def _get_file_type(self, extension: str) -> str:
         """Determine file type from extension"""
@@ -164,4 +497,20 @@ class DocumentService:
             "png": FileTypeEnum.IMAGE,
             "gif": FileTypeEnum.IMAGE,
         }
-        return extension_map.get(extension, FileTypeEnum.PDF)
\ No newline at end of file
+        return extension_map.get(extension, FileTypeEnum.PDF)
+
+
+class HashingReader:
+    """File wrapper that computes the SHA-256 of everything read through it"""
+    
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self._hash = hashlib.sha256()
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self._hash.update(data)
+        return data
+    
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
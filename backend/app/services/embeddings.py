@@ -0,0 +1,75 @@
+"""
+Text Embedders
+
+Turn chunks of analysis text into unit-length vectors for the similarity
+index, chosen with SIMILARITY_EMBEDDER:
+
+- "hashing": offline feature hashing of words and word pairs with
+  sublinear term frequency. No model, no network and no fitted
+  vocabulary, so every process embeds identically and an index never
+  needs refitting; drawing numbers and spec section numbers
+  ("S-201", "03.30.00") are kept as single tokens.
+
+Every embedder has a name that includes anything changing its vectors;
+an index built with another name is rebuilt rather than mixed.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+# Too common in specs and drawings to say anything about similarity
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or shall that the this to was were will with
+""".split())
+
+
+class Embedder:
+    """Maps texts to L2-normalized float32 vectors of a fixed dimension"""
+
+    name: str = "unknown"
+    dim: int = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    def __init__(self, dim: int = None):
+        self.dim = dim or settings.SIMILARITY_DIM
+        if self.dim & (self.dim - 1):
+            raise ValueError("SIMILARITY_DIM must be a power of two")
+        self.name = f"hashing-v1-{self.dim}"
+
+    def tokens(self, text: str) -> List[str]:
+        return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        mask = self.dim - 1
+        for row, text in enumerate(texts):
+            tokens = self.tokens(text)
+            features = Counter(tokens)
+            features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+            for feature, count in features.items():
+                h = zlib.crc32(feature.encode())
+                # The top bit picks the sign, so collisions tend to cancel
+                vectors[row, h & mask] += (1.0 + math.log(count)) * (1.0 if h >> 31 else -1.0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def create_embedder(name: Optional[str] = None) -> Embedder:
+    """Embedder selected by SIMILARITY_EMBEDDER (or name)"""
+    name = (name or settings.SIMILARITY_EMBEDDER).lower()
+    if name == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
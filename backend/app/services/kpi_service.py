@@ -14,6 +14,7 @@ import uuid
 
 from app.models.document import Document
 from app.models.workflow import RFI, Transmittal
+from app.services.analysis_metrics import analysis_metrics
 
 
 class KPIService:
@@ -124,42 +125,36 @@ class KPIService:
     def calculate_ai_analysis_time(
         db: Session,
         project_id: str,
-        percentile: int = 50
+        percentile: int = 50,
+        days: int = 30
     ) -> Dict:
         """
         KPI-002: AI Analysis Time (P50)
         
         Measures AI processing performance
-        Formula: 50th percentile of processing times
+        Formula: 50th percentile of DocumentAnalysis.processing_time over
+        the analyses that ran (cache hits excluded)
         
-        Note: This is a placeholder implementation. In production, you would:
-        1. Add a DocumentAnalysis model with processing_time field
-        2. Query actual processing times from that model
+        The stage breakdown (fetch, extract, llm, parse) of the same
+        analyses is in analysis_metrics.stats().
         
         Args:
             db: Database session
             project_id: Project UUID
             percentile: Percentile to calculate (default 50 for median)
+            days: Time window in days (default 30)
             
         Returns:
             Dict with KPI data
         """
-        # Placeholder: In production, query DocumentAnalysis.processing_time
-        # For now, return simulated data
+        stats = analysis_metrics.stats(db, project_id, days=days, percentiles=(percentile,))
         
-        # Example query (when DocumentAnalysis model exists):
-        # analyses = db.query(DocumentAnalysis.processing_time).join(
-        #     Document, DocumentAnalysis.document_id == Document.id
-        # ).filter(
-        #     Document.project_id == uuid.UUID(project_id)
-        # ).all()
-        
-        # Simulated value for now
-        p50_value = 25.0  # seconds
+        # No analyses in the window: nothing was slow
+        value = stats["total"][f"p{percentile}"] or 0.0
         
         return {
             "kpi_id": "KPI-002",
-            "value": round(p50_value, 2),
+            "value": round(value, 2),
             "target": 30.0,
             "threshold_warning": 35.0,
             "threshold_critical": 45.0,
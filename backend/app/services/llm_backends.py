@@ -0,0 +1,233 @@
+"""
+LLM Backends
+
+Providers behind LLMClient, chosen with AI_BACKEND:
+
+- "gemini": Google Gemini (needs GEMINI_API_KEY)
+- "fake": deterministic in-process stand-in with configurable latency,
+  error rate and response shape, for load tests and local development
+- "http": any service speaking the small JSON protocol below, such as
+  the stand-in server in benchmarks/llm_stub_server.py
+
+HTTP protocol: POST {"model": ..., "prompt": ...} to AI_BACKEND_URL,
+answered with {"text": ..., "usage": {"total_tokens": ...}}; usage may
+also carry prompt_tokens and completion_tokens. Throttling
+is a 429 with an optional Retry-After header.
+
+The fake answers from a hash of the prompt, so the same prompt always
+gets the same response and latency. Whether an attempt fails is drawn
+from the prompt and the attempt number, so runs are repeatable and a
+retried prompt eventually succeeds.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import urllib.error
+import urllib.request
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.llm_client import LLMResponse
+from app.services.text_extraction import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash-exp"
+
+FAKE_RESPONSE_SHAPES = ("json", "markdown", "text", "mixed")
+
+
+class LLMBackendError(Exception):
+    """A backend answered with an error status"""
+
+    def __init__(self, message: str, code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """One model provider"""
+
+    model_name: str = "unknown"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, api_key: str = None, model_name: str = GEMINI_MODEL_NAME):
+        self.model_name = model_name
+        self.model = None
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            logger.warning("GEMINI_API_KEY not found in environment")
+            return
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        logger.info("Gemini AI initialized successfully")
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        response = await self.model.generate_content_async(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            response.text,
+            getattr(usage, "total_token_count", None),
+            getattr(usage, "prompt_token_count", None),
+            getattr(usage, "candidates_token_count", None)
+        )
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic stand-in for a model
+
+    Latency is log-normal around latency_ms (the median) with the given
+    spread (sigma); error_rate of the attempts fail with a 429 or 503.
+    Responses echo recognisable facts from the prompt (capitalised
+    names, dates) in the requested shape:
+
+    - json: a bare JSON object
+    - markdown: the object in a ```json fence
+    - text: prose that is not JSON
+    - mixed: one of the three per prompt
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = None,
+        latency_sigma: float = None,
+        error_rate: float = None,
+        shape: str = None,
+        seed: int = None,
+        model_name: str = "fake-llm"
+    ):
+        self.latency_ms = latency_ms if latency_ms is not None else settings.AI_FAKE_LATENCY_MS
+        self.latency_sigma = latency_sigma if latency_sigma is not None else settings.AI_FAKE_LATENCY_SIGMA
+        self.error_rate = error_rate if error_rate is not None else settings.AI_FAKE_ERROR_RATE
+        self.shape = shape or settings.AI_FAKE_RESPONSE_SHAPE
+        self.seed = seed if seed is not None else settings.AI_FAKE_SEED
+        self.model_name = model_name
+        if self.shape not in FAKE_RESPONSE_SHAPES:
+            raise ValueError(f"Unknown fake response shape: {self.shape}")
+        self._attempts: Dict[bytes, int] = {}
+
+    def plan(self, prompt: str) -> Dict:
+        """Latency, outcome and body for a prompt, without waiting"""
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest()
+        rng = random.Random(digest)
+        latency = self.latency_ms / 1000.0 * rng.lognormvariate(0, self.latency_sigma) if self.latency_ms else 0.0
+
+        if len(self._attempts) > 100_000:
+            self._attempts.clear()
+        attempt = self._attempts[digest] = self._attempts.get(digest, 0) + 1
+        if random.Random(digest + attempt.to_bytes(4, "big")).random() < self.error_rate:
+            code = rng.choice((429, 503))
+            return {"latency": latency, "error": code, "retry_after": 1.0 if code == 429 else None}
+
+        shape = self.shape if self.shape != "mixed" else rng.choice(("json", "markdown", "text"))
+        body = self._answer(prompt, rng)
+        if shape == "json":
+            text = json.dumps(body)
+        elif shape == "markdown":
+            text = f"Here is the analysis:\n```json\n{json.dumps(body, indent=2)}\n```"
+        else:
+            text = body["summary"]
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        output_tokens = len(text) // CHARS_PER_TOKEN
+        return {
+            "latency": latency,
+            "text": text,
+            "total_tokens": prompt_tokens + output_tokens,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+        }
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        plan = self.plan(prompt)
+        await asyncio.sleep(plan["latency"])
+        if "error" in plan:
+            raise LLMBackendError(f"Fake backend error {plan['error']}", code=plan["error"], retry_after=plan["retry_after"])
+        return LLMResponse(plan["text"], plan["total_tokens"], plan["prompt_tokens"], plan["output_tokens"])
+
+    def _answer(self, prompt: str, rng: random.Random) -> Dict:
+        names = list(dict.fromkeys(re.findall(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+)+\b", prompt)))[:8]
+        dates = list(dict.fromkeys(re.findall(r"\b\d{4}-\d{2}-\d{2}\b", prompt)))[:8]
+        words = len(prompt.split())
+        return {
+            "summary": (
+                f"The document contains about {words} words. "
+                f"It mentions {len(names)} named parties and {len(dates)} dates. "
+                f"This summary was produced by the fake backend."
+            ),
+            "extracted_data": {"word_count": words, "dates": dates},
+            "key_entities": {"persons": [], "companies": names, "locations": [], "dates": dates},
+            "confidence_score": round(rng.uniform(0.6, 0.99), 2),
+        }
+
+
+class HTTPBackend(LLMBackend):
+    def __init__(self, url: str = None, model_name: str = None, timeout: float = None):
+        self.url = url or settings.AI_BACKEND_URL
+        self.model_name = model_name or settings.AI_BACKEND_MODEL
+        self.timeout = timeout or settings.LLM_REQUEST_TIMEOUT_SECONDS
+        if not self.url:
+            raise ValueError("AI_BACKEND_URL is required for the http backend")
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        # urllib blocks; keep it off the event loop
+        return await asyncio.to_thread(self._post, prompt)
+
+    def _post(self, prompt: str) -> LLMResponse:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"model": self.model_name, "prompt": prompt}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After")
+            raise LLMBackendError(
+                f"LLM backend returned {e.code}",
+                code=e.code,
+                retry_after=float(retry_after) if retry_after else None
+            ) from e
+        except (urllib.error.URLError, OSError) as e:
+            # Refused connections, resets and socket timeouts: the backend
+            # is briefly unreachable, so retry as for a 503
+            raise LLMBackendError(f"LLM backend unreachable: {e}", code=503) from e
+        usage = payload.get("usage") or {}
+        return LLMResponse(
+            payload.get("text", ""),
+            usage.get("total_tokens"),
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens")
+        )
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Backend selected by AI_BACKEND (or name)"""
+    name = (name or settings.AI_BACKEND).lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "fake":
+        return FakeBackend()
+    if name == "http":
+        return HTTPBackend()
+    raise ValueError(f"Unknown AI backend: {name}")
@@ -0,0 +1,422 @@
+"""
+LLM Client
+
+Async client for model calls shared by every analysis path:
+
+- Rate limiting: a token bucket per quota (requests and tokens per
+  minute) kept in Redis and updated by one Lua script, so all API and
+  worker processes draw from the same quota. A caller that would exceed
+  it sleeps exactly until enough has refilled, plus a little jitter, and
+  no request is sent just to be rejected.
+- Concurrency: at most LLM_MAX_CONCURRENCY requests in flight per event
+  loop.
+- Retries: throttling and transient server errors are retried with
+  exponential backoff and full jitter, so workers throttled together do
+  not retry together.
+
+Token use is reserved up front from the prompt length plus
+LLM_MAX_OUTPUT_TOKENS, and corrected once the response reports actual
+usage. Requests and tokens are also counted per minute for usage().
+
+Without Redis each process falls back to a local bucket with the same
+limits; the quota is then enforced per process rather than overall.
+"""
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+import redis
+
+from app.config import settings
+from app.redis_client import get_redis
+from app.services.analysis_metrics import analysis_metrics
+from app.services.text_extraction import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Reserves one request and ARGV[3] tokens if both buckets allow it.
+# Returns 0 on success, otherwise the milliseconds until they would.
+_RESERVE = """
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+
+local function level(key, limit)
+    local state = redis.call("HMGET", key, "level", "ts")
+    local value = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    return math.min(limit, value + (now - ts) * limit / 60000)
+end
+
+local requests_left = level(KEYS[1], rpm)
+local tokens_left = level(KEYS[2], tpm)
+local wait = 0
+if requests_left < 1 then
+    wait = math.max(wait, (1 - requests_left) * 60000 / rpm)
+end
+if tokens_left < tokens then
+    wait = math.max(wait, (tokens - tokens_left) * 60000 / tpm)
+end
+if wait > 0 then
+    return math.ceil(wait)
+end
+
+redis.call("HSET", KEYS[1], "level", tostring(requests_left - 1), "ts", now)
+redis.call("HSET", KEYS[2], "level", tostring(tokens_left - tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], 120000)
+redis.call("PEXPIRE", KEYS[2], 120000)
+redis.call("HINCRBY", KEYS[3], "requests", 1)
+redis.call("HINCRBY", KEYS[3], "tokens", tokens)
+redis.call("EXPIRE", KEYS[3], 180)
+return 0
+"""
+
+# Corrects the token bucket (and usage) by ARGV[2] tokens, which may be
+# negative; the bucket may go into debt, delaying later reservations
+_ADJUST = """
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local tpm = tonumber(ARGV[1])
+local delta = tonumber(ARGV[2])
+local state = redis.call("HMGET", KEYS[1], "level", "ts")
+local value = tonumber(state[1]) or tpm
+local ts = tonumber(state[2]) or now
+value = math.min(tpm, value + (now - ts) * tpm / 60000) - delta
+redis.call("HSET", KEYS[1], "level", tostring(value), "ts", now)
+redis.call("PEXPIRE", KEYS[1], 120000)
+redis.call("HINCRBY", KEYS[2], "tokens", delta)
+redis.call("EXPIRE", KEYS[2], 180)
+return 0
+"""
+
+# How long Redis is skipped after an error
+REDIS_BACKOFF_SECONDS = 5.0
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A model call failed"""
+
+
+class LLMRetryableError(LLMError):
+    """A model call was throttled or hit a transient error on every attempt"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMResponse(NamedTuple):
+    text: str
+    total_tokens: Optional[int] = None  # As reported by the provider
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)]"""
+    base = base if base is not None else settings.LLM_BACKOFF_BASE_SECONDS
+    cap = cap if cap is not None else settings.LLM_BACKOFF_MAX_SECONDS
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_tokens(prompt: str, max_output_tokens: int = None) -> int:
+    """Tokens to reserve for a request before its real usage is known"""
+    max_output_tokens = max_output_tokens if max_output_tokens is not None else settings.LLM_MAX_OUTPUT_TOKENS
+    return len(prompt) // CHARS_PER_TOKEN + 1 + max_output_tokens
+
+
+def token_usage(prompt: str, response: LLMResponse) -> Tuple[int, int]:
+    """Prompt and output tokens of a call, estimated from lengths where the provider did not report them"""
+    prompt_tokens = response.prompt_tokens
+    if prompt_tokens is None:
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+    output_tokens = response.output_tokens
+    if output_tokens is None:
+        if response.total_tokens is not None:
+            output_tokens = max(response.total_tokens - prompt_tokens, 0)
+        else:
+            output_tokens = len(response.text or "") // CHARS_PER_TOKEN
+    return prompt_tokens, output_tokens
+
+
+def parse_json_response(text: str) -> Dict:
+    """
+    Parse a JSON answer, which models often wrap in a markdown code fence
+
+    Raises:
+        json.JSONDecodeError: The answer is not JSON
+    """
+    if "```json" in text:
+        start = text.find("```json") + 7
+        text = text[start:text.find("```", start)]
+    elif "```" in text:
+        start = text.find("```") + 3
+        text = text[start:text.find("```", start)]
+    return json.loads(text.strip())
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error from a provider SDK or HTTP call is worth retrying"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, LLMRetryableError)):
+        return True
+    for attribute in ("code", "status_code", "status"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS_CODES
+    # google.api_core exceptions without a numeric code
+    return type(error).__name__ in {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded"}
+
+
+class LocalTokenBucket:
+    """In-process token bucket pair, used while Redis is unavailable"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.limits = (requests_per_minute, tokens_per_minute)
+        self.levels = [float(requests_per_minute), float(tokens_per_minute)]
+        self.updated_at = time.monotonic()
+        self.usage: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        with self._lock:
+            self._refill()
+            rpm, tpm = self.limits
+            wait = 0.0
+            if self.levels[0] < 1:
+                wait = max(wait, (1 - self.levels[0]) * 60 / rpm)
+            if self.levels[1] < tokens:
+                wait = max(wait, (tokens - self.levels[1]) * 60 / tpm)
+            if wait > 0:
+                return wait
+            self.levels[0] -= 1
+            self.levels[1] -= tokens
+            self._count(requests=1, tokens=tokens)
+            return 0.0
+
+    def adjust(self, delta: int):
+        with self._lock:
+            self._refill()
+            self.levels[1] -= delta
+            self._count(tokens=delta)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        for i, limit in enumerate(self.limits):
+            self.levels[i] = min(limit, self.levels[i] + elapsed * limit / 60)
+
+    def _count(self, requests: int = 0, tokens: int = 0):
+        minute = int(time.time() // 60)
+        counts = self.usage.setdefault(minute, {"requests": 0, "tokens": 0})
+        counts["requests"] += requests
+        counts["tokens"] += tokens
+        for old in [m for m in self.usage if m < minute - 2]:
+            del self.usage[old]
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute limits shared through Redis"""
+
+    def __init__(
+        self,
+        namespace: str = "pw:llm",
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        redis_factory: Callable[[], redis.Redis] = get_redis
+    ):
+        self.namespace = namespace
+        self.requests_per_minute = requests_per_minute or settings.LLM_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or settings.LLM_TOKENS_PER_MINUTE
+        self.redis_factory = redis_factory
+        self.local = LocalTokenBucket(self.requests_per_minute, self.tokens_per_minute)
+        self._redis_skip_until = 0.0
+        self._scripts = {}
+
+    def try_reserve(self, tokens: int) -> float:
+        """
+        Reserve one request and tokens
+
+        Returns:
+            0 when reserved, otherwise seconds to wait before trying again
+        """
+        # A request larger than the whole bucket would never fit
+        tokens = min(tokens, self.tokens_per_minute)
+        client = self._redis()
+        if client is not None:
+            try:
+                wait_ms = self._script(client, _RESERVE)(
+                    keys=[self._key("rpm"), self._key("tpm"), self._usage_key()],
+                    args=[self.requests_per_minute, self.tokens_per_minute, tokens]
+                )
+                return int(wait_ms) / 1000.0
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        return self.local.reserve(tokens)
+
+    async def acquire(self, tokens: int):
+        """Wait until one request and tokens fit in the quota"""
+        while True:
+            wait = self.try_reserve(tokens)
+            if wait <= 0:
+                return
+            # Jitter spreads out waiters that were told the same refill time
+            await asyncio.sleep(wait + random.uniform(0, min(1.0, wait * 0.25)))
+
+    def adjust(self, delta: int):
+        """Correct the reserved tokens once real usage is known"""
+        if not delta:
+            return
+        client = self._redis()
+        if client is not None:
+            try:
+                self._script(client, _ADJUST)(
+                    keys=[self._key("tpm"), self._usage_key()],
+                    args=[self.tokens_per_minute, delta]
+                )
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        self.local.adjust(delta)
+
+    def usage(self) -> Dict:
+        """Requests and tokens in the current and the previous minute"""
+        minute = int(time.time() // 60)
+        counts = {}
+        client = self._redis()
+        if client is not None:
+            try:
+                for label, m in (("current_minute", minute), ("previous_minute", minute - 1)):
+                    values = client.hgetall(self._usage_key(m))
+                    counts[label] = {
+                        "requests": int(values.get(b"requests", 0)),
+                        "tokens": int(values.get(b"tokens", 0)),
+                    }
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                counts = {}
+        shared = bool(counts)
+        if not shared:
+            for label, m in (("current_minute", minute), ("previous_minute", minute - 1)):
+                counts[label] = dict(self.local.usage.get(m, {"requests": 0, "tokens": 0}))
+        return {
+            "requests_per_minute_limit": self.requests_per_minute,
+            "tokens_per_minute_limit": self.tokens_per_minute,
+            "shared": shared,
+            **counts,
+        }
+
+    def _script(self, client: redis.Redis, source: str):
+        # Registered scripts run by SHA and reload themselves after a flush
+        key = (id(client), source)
+        if key not in self._scripts:
+            self._scripts[key] = client.register_script(source)
+        return self._scripts[key]
+
+    def _key(self, bucket: str) -> str:
+        return f"{self.namespace}:bucket:{bucket}"
+
+    def _usage_key(self, minute: int = None) -> str:
+        minute = minute if minute is not None else int(time.time() // 60)
+        return f"{self.namespace}:usage:{minute}"
+
+    def _redis(self) -> Optional[redis.Redis]:
+        if time.monotonic() < self._redis_skip_until:
+            return None
+        return self.redis_factory()
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"LLM rate limiter Redis unavailable, limiting per process for {REDIS_BACKOFF_SECONDS:.0f}s: {error}")
+        self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+
+class LLMClient:
+    def __init__(
+        self,
+        call: Callable[[str], Awaitable[LLMResponse]],
+        limiter: RateLimiter = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        timeout: float = None
+    ):
+        """
+        Args:
+            call: Sends one prompt to the provider and returns its response
+            limiter: Shared rate limiter
+            max_concurrency: Requests in flight per event loop
+            max_retries: Retries after the first attempt
+            timeout: Seconds before one attempt is abandoned
+        """
+        self.call = call
+        self.limiter = limiter or rate_limiter
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else settings.LLM_MAX_RETRIES
+        self.timeout = timeout or settings.LLM_REQUEST_TIMEOUT_SECONDS
+        # asyncio primitives belong to one loop; Celery tasks each run their own
+        self._semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    async def generate(self, prompt: str, max_output_tokens: int = None) -> LLMResponse:
+        """
+        Send a prompt within the rate limit and concurrency bound
+
+        Raises:
+            LLMRetryableError: Still throttled or failing after every retry
+            LLMError: The provider rejected the request
+        """
+        reserved = estimate_tokens(prompt, max_output_tokens)
+        attempt = 0
+        while True:
+            async with self._semaphore():
+                waited_from = time.monotonic()
+                await self.limiter.acquire(reserved)
+                called_at = time.monotonic()
+                analysis_metrics.observe_wait(called_at - waited_from)
+                try:
+                    response = await asyncio.wait_for(self.call(prompt), timeout=self.timeout)
+                except Exception as e:
+                    error = e
+                    analysis_metrics.observe_call(time.monotonic() - called_at, "error")
+                else:
+                    analysis_metrics.observe_call(time.monotonic() - called_at, "ok")
+                    if response.total_tokens is not None:
+                        self.limiter.adjust(response.total_tokens - reserved)
+                    return response
+
+            if not is_retryable(error):
+                raise LLMError(str(error)) from error
+            if attempt >= self.max_retries:
+                raise LLMRetryableError(
+                    f"Model call failed after {attempt + 1} attempts: {error}",
+                    retry_after=getattr(error, "retry_after", None)
+                ) from error
+
+            # Retry-After from the provider, else exponential backoff with jitter
+            delay = getattr(error, "retry_after", None) or backoff_delay(attempt)
+            logger.warning(f"Model call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def generate_sync(self, prompt: str, max_output_tokens: int = None) -> LLMResponse:
+        """generate() for synchronous callers such as Celery tasks"""
+        return asyncio.run(self.generate(prompt, max_output_tokens))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+
+# Quota shared by every client in this process (and, through Redis, all processes)
+rate_limiter = RateLimiter()
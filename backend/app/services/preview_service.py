@@ -0,0 +1,221 @@
+"""
+Preview Service
+
+Renders first-page thumbnails and low-resolution previews for PDFs and
+images. Renders are stored under previews/<content_hash>/<size>.jpg, so
+identical files (re-uploads, restored versions, copies in other
+projects) share one set of renders and a new version never invalidates
+an old one.
+
+Only PDFs and images are fetched at all: other documents (CAD files,
+office documents) are skipped by their stored extension or file type,
+and a file whose first bytes are neither a PDF nor an image header
+stops downloading there.
+
+PDF rendering needs pypdfium2 and all rendering needs Pillow; without
+them previews are skipped and documents simply have none.
+"""
+import io
+import hashlib
+import logging
+import tempfile
+import uuid
+from typing import BinaryIO, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.document import DocumentVersion, FileTypeEnum
+from app.services.document_service import DocumentService
+from app.services.storage_service import storage_service
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover - optional dependency
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels for each rendition
+PREVIEW_SIZES = {
+    "thumb": 256,
+    "small": 512,
+    "preview": 1280,
+}
+PREVIEW_CONTENT_TYPE = "image/jpeg"
+JPEG_QUALITY = 80
+
+# Extensions of stored files that may get previews
+PREVIEW_EXTENSIONS = {"pdf", "jpg", "jpeg", "png", "gif", "bmp", "tif", "tiff", "webp"}
+
+# Leading bytes of the formats rendered
+PREVIEW_SIGNATURES = (
+    b"%PDF-",
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG\r\n\x1a\n",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+    b"II*\x00",  # TIFF
+    b"MM\x00*",
+)
+
+# Source files are spooled to disk above this size while rendering
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+
+class PreviewService:
+    def __init__(self, storage=None):
+        self.storage = storage or storage_service
+        self.document_service = DocumentService()
+
+    def preview_key(self, content_hash: str, size: str) -> str:
+        return f"previews/{content_hash}/{size}.jpg"
+
+    def has_preview(self, content_hash: Optional[str], size: str) -> bool:
+        """Whether a rendition exists for this content"""
+        return bool(content_hash) and self.storage.object_exists(self.preview_key(content_hash, size))
+
+    def generate_previews(self, db: Session, version_id: str) -> Dict:
+        """
+        Render all preview sizes for a document version
+
+        Args:
+            db: Database session
+            version_id: DocumentVersion UUID
+
+        Returns:
+            Dict with content_hash, status ("rendered", "cached",
+            "unsupported" or "unavailable") and the sizes written
+        """
+        version = db.query(DocumentVersion).filter(
+            DocumentVersion.id == uuid.UUID(version_id)
+        ).first()
+        if not version:
+            raise LookupError("Document version not found")
+
+        if Image is None:
+            logger.warning("Pillow is not installed; skipping previews")
+            return {"content_hash": version.content_hash, "status": "unavailable", "sizes": []}
+
+        if not self._previewable(version):
+            return {"content_hash": version.content_hash, "status": "unsupported", "sizes": []}
+
+        if self._all_cached(version.content_hash):
+            return {"content_hash": version.content_hash, "status": "cached", "sizes": []}
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as source:
+            digest = hashlib.sha256()
+            stream = self.document_service.open_version_stream(version)
+            try:
+                for piece in stream:
+                    if source.tell() == 0 and not self._has_signature(piece):
+                        return {"content_hash": version.content_hash, "status": "unsupported", "sizes": []}
+                    digest.update(piece)
+                    source.write(piece)
+            finally:
+                # Stops the download when the header was rejected
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+            source.seek(0)
+
+            if not version.content_hash:
+                # Renders are keyed by content hash; versions stored without
+                # one (bulk and resumable uploads) get it recorded now
+                version.content_hash = digest.hexdigest()
+                db.commit()
+                self.document_service.invalidate_document_cache(version.document_id)
+                if self._all_cached(version.content_hash):
+                    return {"content_hash": version.content_hash, "status": "cached", "sizes": []}
+
+            image = self._render_first_page(source)
+
+        if image is None:
+            return {"content_hash": version.content_hash, "status": "unsupported", "sizes": []}
+
+        # Largest first, so each size is downscaled from the previous one
+        written = []
+        for size, pixels in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+            image.thumbnail((pixels, pixels), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            self.storage.put_object(
+                self.preview_key(version.content_hash, size),
+                buffer.getvalue(),
+                content_type=PREVIEW_CONTENT_TYPE
+            )
+            written.append(size)
+
+        return {"content_hash": version.content_hash, "status": "rendered", "sizes": written}
+
+    def _previewable(self, version: DocumentVersion) -> bool:
+        """
+        Whether a version may get a preview, before fetching it
+
+        Decided by the stored file's extension where its path has one,
+        else by the document's file type (taken from the uploaded file
+        name); never by the editable display name. The file's header
+        has the final word.
+        """
+        filename = (version.file_path or "").rsplit("/", 1)[-1]
+        if "." in filename:
+            return filename.rsplit(".", 1)[-1].lower() in PREVIEW_EXTENSIONS
+        document = version.document
+        return document is not None and document.file_type in (FileTypeEnum.PDF, FileTypeEnum.IMAGE)
+
+    def _has_signature(self, head: bytes) -> bool:
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return True
+        return head.startswith(PREVIEW_SIGNATURES)
+
+    def _all_cached(self, content_hash: Optional[str]) -> bool:
+        return bool(content_hash) and all(self.has_preview(content_hash, size) for size in PREVIEW_SIZES)
+
+    def _render_first_page(self, source: BinaryIO):
+        """Return an RGB PIL image of the first page, or None if unsupported"""
+        header = source.read(5)
+        source.seek(0)
+
+        if header == b"%PDF-":
+            if pdfium is None:
+                logger.warning("pypdfium2 is not installed; skipping PDF preview")
+                return None
+            pdf = pdfium.PdfDocument(source)
+            try:
+                if len(pdf) == 0:
+                    return None
+                page = pdf[0]
+                width, height = page.get_size()
+                # Render straight at the largest preview size
+                scale = max(PREVIEW_SIZES.values()) / max(width, height, 1)
+                return self._flatten(page.render(scale=scale).to_pil())
+            finally:
+                pdf.close()
+
+        try:
+            image = Image.open(source)
+            # JPEG can decode at reduced scale, avoiding full-size bitmaps
+            image.draft("RGB", (max(PREVIEW_SIZES.values()),) * 2)
+            image.load()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            logger.info(f"No preview for unsupported or oversized file: {e}")
+            return None
+        return self._flatten(image)
+
+    def _flatten(self, image):
+        """Convert to RGB, putting transparent areas on a white background"""
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image.convert("RGB")
+
+
+# Singleton instance
+preview_service = PreviewService()
@@ -1,3 +1,4 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import uuid
 
@@ -18,7 +19,13 @@ class ProjectService:
         db.refresh(db_project)
         return db_project
 
-    def list_user_projects(self, db: Session, user_id: str, skip: int, limit: int):
+    def list_user_projects(self, db: Session, user_id: str, skip: int, limit: int, fields: list = None):
+        if fields:
+            # Column projection: rows come back as dicts without ORM hydration
+            stmt = select(*[getattr(Project, name) for name in fields]).where(
+                Project.owner_id == uuid.UUID(user_id)
+            ).offset(skip).limit(limit)
+            return [dict(row) for row in db.execute(stmt).mappings()]
         return db.query(Project).filter(Project.owner_id == uuid.UUID(user_id)).offset(skip).limit(limit).all()
 
     def update_project(self, db: Session, project: Project, project_data: ProjectUpdate):
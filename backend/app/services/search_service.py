@@ -0,0 +1,253 @@
+"""
+Full-Text Search Service
+
+Ranked search over document names, descriptions and analysis text. One
+DocumentSearchEntry row is kept per document and refreshed on upload and
+after analysis. PostgreSQL ranks with a generated, GIN-indexed tsvector
+column; SQLite (tests and local runs) uses an FTS5 virtual table.
+"""
+import re
+import uuid
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.document import Document
+from app.models.document_analysis import DocumentAnalysis
+from app.models.search import DocumentSearchEntry
+
+logger = logging.getLogger(__name__)
+
+# Must match the configuration baked into the generated search_vector column
+TEXT_SEARCH_CONFIG = "english"
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+
+class PostgresSearchBackend:
+    """tsvector/GIN backend; the vector is maintained by the database"""
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(DocumentSearchEntry).values(entries)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DocumentSearchEntry.document_id],
+            set_={
+                "project_id": stmt.excluded.project_id,
+                "name": stmt.excluded.name,
+                "description": stmt.excluded.description,
+                "summary": stmt.excluded.summary,
+                "body": stmt.excluded.body,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        ))
+
+    def remove(self, db: Session, document_ids: List[uuid.UUID]):
+        db.execute(delete(DocumentSearchEntry).where(DocumentSearchEntry.document_id.in_(document_ids)))
+
+    def search(self, db: Session, project_id: uuid.UUID, query: str, limit: int, offset: int) -> List[Dict]:
+        # Rank and page first, then build headlines for the page only:
+        # ts_headline re-parses the text and is the expensive part
+        rows = db.execute(text("""
+            WITH q AS (
+                SELECT websearch_to_tsquery(CAST(:config AS regconfig), :query) AS query
+            ), hits AS (
+                SELECT s.document_id, ts_rank_cd(s.search_vector, q.query, 32) AS rank
+                FROM document_search s
+                JOIN documents d ON d.id = s.document_id AND d.deleted_at IS NULL
+                CROSS JOIN q
+                WHERE s.project_id = :project_id AND s.search_vector @@ q.query
+                ORDER BY rank DESC, s.document_id
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT d.id AS document_id, d.name, d.discipline, d.status, d.file_type, hits.rank,
+                   ts_headline(
+                       CAST(:config AS regconfig),
+                       left(concat_ws(' ', s.description, s.summary, s.body), :headline_chars),
+                       q.query,
+                       :headline_options
+                   ) AS snippet
+            FROM hits
+            JOIN document_search s ON s.document_id = hits.document_id
+            JOIN documents d ON d.id = hits.document_id
+            CROSS JOIN q
+            ORDER BY hits.rank DESC, hits.document_id
+        """), {
+            "config": TEXT_SEARCH_CONFIG,
+            "query": query,
+            "project_id": project_id,
+            "limit": limit,
+            "offset": offset,
+            "headline_chars": settings.SEARCH_HEADLINE_CHARS,
+            "headline_options": (
+                f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, "
+                "MaxFragments=2, MaxWords=24, MinWords=8, FragmentDelimiter=\" … \""
+            ),
+        }).mappings().all()
+        return [dict(row) for row in rows]
+
+
+class SQLiteSearchBackend:
+    """FTS5 backend for tests and local development"""
+
+    # bm25 column weights: document_id, project_id, name, description, summary, body
+    BM25_WEIGHTS = "0.0, 0.0, 10.0, 4.0, 4.0, 1.0"
+
+    def __init__(self):
+        self._ready = set()
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        self._ensure_table(db)
+        self.remove(db, [entry["document_id"] for entry in entries])
+        db.execute(text("""
+            INSERT INTO document_search_fts (document_id, project_id, name, description, summary, body)
+            VALUES (:document_id, :project_id, :name, :description, :summary, :body)
+        """), [
+            {**entry, "document_id": entry["document_id"].hex, "project_id": entry["project_id"].hex}
+            for entry in entries
+        ])
+
+    def remove(self, db: Session, document_ids: List[uuid.UUID]):
+        self._ensure_table(db)
+        for document_id in document_ids:
+            db.execute(
+                text("DELETE FROM document_search_fts WHERE document_id = :document_id"),
+                {"document_id": document_id.hex}
+            )
+
+    def search(self, db: Session, project_id: uuid.UUID, query: str, limit: int, offset: int) -> List[Dict]:
+        self._ensure_table(db)
+        # Quote every term so user input can never be parsed as FTS5 syntax
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+
+        rows = db.execute(text(f"""
+            SELECT d.id AS document_id, d.name, d.discipline, d.status, d.file_type,
+                   -bm25(document_search_fts, {self.BM25_WEIGHTS}) AS rank,
+                   snippet(document_search_fts, -1, :start, :stop, ' … ', 24) AS snippet
+            FROM document_search_fts f
+            JOIN documents d ON d.id = f.document_id AND d.deleted_at IS NULL
+            WHERE document_search_fts MATCH :query AND f.project_id = :project_id
+            ORDER BY rank DESC, d.id
+            LIMIT :limit OFFSET :offset
+        """), {
+            "query": " ".join(f'"{term}"' for term in terms),
+            "project_id": project_id.hex,
+            "start": HIGHLIGHT_START,
+            "stop": HIGHLIGHT_STOP,
+            "limit": limit,
+            "offset": offset,
+        }).mappings().all()
+        return [{**row, "document_id": uuid.UUID(row["document_id"])} for row in rows]
+
+    def _ensure_table(self, db: Session):
+        engine = db.get_bind()
+        if engine.url in self._ready:
+            return
+        db.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS document_search_fts USING fts5(
+                document_id UNINDEXED, project_id UNINDEXED,
+                name, description, summary, body,
+                tokenize = 'porter unicode61'
+            )
+        """))
+        self._ready.add(engine.url)
+
+
+class SearchService:
+    def __init__(self):
+        self._backends = {
+            "postgresql": PostgresSearchBackend(),
+            "sqlite": SQLiteSearchBackend(),
+        }
+
+    def index_document(self, db: Session, document: Document, analysis: Optional[DocumentAnalysis] = None):
+        """
+        Refresh the search entry for one document (the caller commits)
+
+        Args:
+            db: Database session
+            document: Document to index
+            analysis: Latest analysis; looked up when not given
+        """
+        if analysis is None:
+            analysis = db.query(DocumentAnalysis).filter(
+                DocumentAnalysis.document_id == document.id
+            ).order_by(DocumentAnalysis.analyzed_at.desc()).first()
+
+        self.index_entries(db, [self.build_entry(document, analysis)])
+
+    def index_entries(self, db: Session, entries: List[Dict]):
+        """Upsert prepared search entries (see build_entry)"""
+        if entries:
+            self._backend(db).upsert(db, entries)
+
+    def build_entry(self, document, analysis: Optional[DocumentAnalysis] = None) -> Dict:
+        """Search entry for a Document (or a dict with the same fields)"""
+        get = document.get if isinstance(document, dict) else lambda key: getattr(document, key)
+        body = analysis.ocr_text if analysis is not None else None
+        return {
+            "document_id": get("id"),
+            "project_id": get("project_id"),
+            "name": get("name"),
+            "description": get("description"),
+            "summary": analysis.summary if analysis is not None else None,
+            "body": body[:settings.SEARCH_MAX_BODY_CHARS] if body else None,
+            "updated_at": datetime.utcnow(),
+        }
+
+    def remove_document(self, db: Session, document_id: uuid.UUID):
+        """Drop a document from the index (the caller commits)"""
+        self._backend(db).remove(db, [document_id])
+
+    def remove_documents(self, db: Session, document_ids: List[uuid.UUID]):
+        """Drop several documents from the index (the caller commits)"""
+        if document_ids:
+            self._backend(db).remove(db, document_ids)
+
+    def search(
+        self,
+        db: Session,
+        project_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict:
+        """
+        Ranked full-text search within a project
+
+        Args:
+            db: Database session
+            project_id: Project UUID
+            query: Free text; quoted phrases and -exclusions work on PostgreSQL
+            limit: Page size
+            offset: Number of ranked hits to skip
+
+        Returns:
+            Dict with results (best first, with highlighted snippets) and
+            next_offset (None on the last page)
+        """
+        # One extra row tells whether another page exists without a COUNT(*)
+        rows = self._backend(db).search(db, uuid.UUID(project_id), query, limit + 1, offset)
+        return {
+            "query": query,
+            "results": rows[:limit],
+            "next_offset": offset + limit if len(rows) > limit else None,
+        }
+
+    def _backend(self, db: Session):
+        dialect = db.get_bind().dialect.name
+        if dialect not in self._backends:
+            raise ValueError(f"Full-text search is not supported on {dialect}")
+        return self._backends[dialect]
+
+
+# Singleton instance
+search_service = SearchService()
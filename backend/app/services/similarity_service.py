@@ -0,0 +1,215 @@
+"""
+Similarity Service
+
+"Similar documents" over analysis text. Each analyzed document's summary
+and extracted text are cut into chunks of about SIMILARITY_CHUNK_CHARS,
+embedded (see app.services.embeddings) and appended to its project's
+vector index (see app.services.vector_index) right after the analysis is
+stored. A document's similarity to another is its best chunk match.
+
+Indexes live on local disk under SIMILARITY_INDEX_PATH, one directory
+per project, and are shared by every process on the host. They can be
+rebuilt from the stored analyses at any time (backfill_similarity_index),
+so losing one costs a re-embedding, not data.
+"""
+import os
+import threading
+import uuid
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.document import Document
+from app.models.document_analysis import DocumentAnalysis
+from app.services.chunked_analysis import split_into_chunks
+from app.services.embeddings import Embedder, create_embedder
+from app.services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Chunk matches fetched per requested result; several usually belong to
+# the same document
+CANDIDATES_PER_RESULT = 8
+
+# Chunks of a document searched with, spread over it; long specs would
+# otherwise scan most of the index
+QUERY_CHUNKS = 16
+
+
+class SimilarityService:
+    def __init__(self, root: str = None, embedder: Embedder = None):
+        self.root = root or settings.SIMILARITY_INDEX_PATH
+        self._embedder = embedder
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = create_embedder()
+        return self._embedder
+
+    def index_for(self, project_id) -> VectorIndex:
+        key = str(project_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = VectorIndex(os.path.join(self.root, key), self.embedder.name, self.embedder.dim)
+                self._indexes[key] = index
+            return index
+
+    def chunk_texts(self, summary: Optional[str], ocr_text: Optional[str], page_offsets: Optional[List[int]] = None) -> List[str]:
+        """
+        Texts embedded for one analysis
+
+        Analyses without extracted text (failed or unavailable ones) give
+        none: their boilerplate summaries would all look alike.
+        """
+        if not ocr_text or not ocr_text.strip():
+            return []
+        chunks = split_into_chunks(ocr_text, page_offsets or [], settings.SIMILARITY_CHUNK_CHARS)
+        chunks = [chunk for chunk in chunks if chunk.strip()][:settings.SIMILARITY_MAX_CHUNKS]
+        if summary and summary.strip():
+            chunks.insert(0, summary)
+        return chunks
+
+    def index_analysis(self, project_id, document_id, analysis: DocumentAnalysis) -> bool:
+        """
+        Replace a document's vectors with its analysis
+
+        Returns:
+            True when the project's index is due for a rebuild
+        """
+        index = self.index_for(project_id)
+        manifest = index.add(uuid.UUID(str(document_id)), self._vectors(analysis))
+        return index.needs_rebuild(manifest)
+
+    def index_analyses(self, project_id, analyses: List[DocumentAnalysis]) -> int:
+        """Replace the vectors of several documents of a project at once"""
+        documents = [(uuid.UUID(str(analysis.document_id)), self._vectors(analysis)) for analysis in analyses]
+        if documents:
+            self.index_for(project_id).add_many(documents)
+        return len(documents)
+
+    def index_document(self, db: Session, document_id) -> Optional[Dict]:
+        """
+        Index a document's stored analysis
+
+        Returns:
+            Dict with project_id and needs_rebuild; None without an
+            analysis
+        """
+        row = db.query(Document, DocumentAnalysis).join(
+            DocumentAnalysis, DocumentAnalysis.document_id == Document.id
+        ).filter(Document.id == uuid.UUID(str(document_id))).first()
+        if row is None:
+            return None
+        document, analysis = row
+        return {
+            "project_id": str(document.project_id),
+            "needs_rebuild": self.index_analysis(document.project_id, document.id, analysis)
+        }
+
+    def remove(self, project_id, document_ids: List):
+        """Drop documents from a project's results; never raises"""
+        try:
+            self.index_for(project_id).remove([uuid.UUID(str(d)) for d in document_ids])
+        except Exception as e:
+            logger.warning(f"Could not remove documents from the similarity index of project {project_id}: {e}")
+
+    def rebuild(self, project_id) -> Dict:
+        return self.index_for(project_id).rebuild()
+
+    def find_similar(self, db: Session, document_id: str, limit: int = 10) -> Optional[List[Dict]]:
+        """
+        Documents of the same project most similar to a document
+
+        Args:
+            db: Database session
+            document_id: Document UUID
+            limit: Maximum number of documents
+
+        Returns:
+            Dicts with document_id, name, file_type, discipline, status,
+            score (cosine similarity of the best matching chunks) and
+            matches (chunk pairs among the nearest neighbours), best
+            first; None if the document does not exist
+
+        Raises:
+            ValueError: Invalid document ID
+        """
+        document = db.query(Document).filter(
+            Document.id == uuid.UUID(document_id),
+            Document.deleted_at.is_(None)
+        ).first()
+        if document is None:
+            return None
+
+        index = self.index_for(document.project_id)
+        queries = index.rows_of(document.id)
+        if not len(queries):
+            # Not indexed (yet): embed the stored analysis on the fly
+            analysis = db.query(DocumentAnalysis).filter(DocumentAnalysis.document_id == document.id).first()
+            queries = self._vectors(analysis) if analysis else []
+            if not len(queries):
+                return []
+        if len(queries) > QUERY_CHUNKS:
+            queries = queries[np.linspace(0, len(queries) - 1, QUERY_CHUNKS).astype(int)]
+
+        best: Dict[bytes, float] = {}
+        matches: Dict[bytes, int] = {}
+        own = document.id.bytes
+        for docs, scores in index.search(queries, limit * CANDIDATES_PER_RESULT):
+            for doc, score in zip(docs, scores):
+                key = doc.tobytes()
+                if key == own:
+                    continue
+                matches[key] = matches.get(key, 0) + 1
+                if score > best.get(key, -1.0):
+                    best[key] = float(score)
+        if not best:
+            return []
+
+        # Over-fetch, since deleted documents may still have vectors
+        ranked = sorted(best, key=best.get, reverse=True)[:limit * 2]
+        documents = {
+            d.id: d for d in db.query(Document).filter(
+                Document.id.in_([uuid.UUID(bytes=key) for key in ranked]),
+                Document.project_id == document.project_id,
+                Document.deleted_at.is_(None)
+            ).all()
+        }
+
+        results = []
+        for key in ranked:
+            similar = documents.get(uuid.UUID(bytes=key))
+            if similar is None:
+                continue
+            results.append({
+                "document_id": similar.id,
+                "name": similar.name,
+                "file_type": similar.file_type,
+                "discipline": similar.discipline,
+                "status": similar.status,
+                "score": round(best[key], 4),
+                "matches": matches[key],
+            })
+            if len(results) == limit:
+                break
+        return results
+
+    def stats(self, project_id) -> Dict:
+        return self.index_for(project_id).stats()
+
+    def _vectors(self, analysis: DocumentAnalysis) -> np.ndarray:
+        texts = self.chunk_texts(analysis.summary, analysis.ocr_text, analysis.page_offsets)
+        if not texts:
+            return np.empty((0, self.embedder.dim), np.float32)
+        return self.embedder.embed(texts)
+
+
+# Singleton instance
+similarity_service = SimilarityService()
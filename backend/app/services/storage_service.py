@@ -0,0 +1,198 @@
+"""
+Object Storage Service
+
+Thin wrapper around the document object store. Production uses S3;
+the local filesystem backend (STORAGE_BACKEND=local) keeps development
+and benchmarks independent of AWS.
+"""
+import os
+import shutil
+import uuid
+import logging
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Default read size when streaming objects back to clients
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class S3StorageBackend:
+    """Storage backend for Amazon S3 (or any S3-compatible service)"""
+
+    scheme = "s3"
+
+    def __init__(self):
+        import boto3
+
+        self.bucket = settings.AWS_S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_REGION
+        )
+
+    def url_for(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def key_from_url(self, url: str) -> str:
+        prefix = f"s3://{self.bucket}/"
+        return url[len(prefix):] if url.startswith(prefix) else url
+
+    def put_object(self, key: str, data: bytes, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **extra)
+
+    def upload_fileobj(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None):
+        # boto3 switches to a multipart upload for large files, so the
+        # object never has to be held in memory
+        extra = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra)
+
+    def open_stream(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def get_object(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def object_exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def delete_object(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def create_multipart_upload(self, key: str, content_type: Optional[str] = None) -> str:
+        extra = {"ContentType": content_type} if content_type else {}
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, **extra)
+        return response["UploadId"]
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return response["ETag"]
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Dict]):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalStorageBackend:
+    """Storage backend writing objects below STORAGE_PATH"""
+
+    scheme = "file"
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or settings.STORAGE_PATH)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _multipart_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, ".multipart", upload_id)
+
+    def url_for(self, key: str) -> str:
+        return f"file://{key}"
+
+    def key_from_url(self, url: str) -> str:
+        return url[len("file://"):] if url.startswith("file://") else url
+
+    def put_object(self, key: str, data: bytes, content_type: Optional[str] = None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def upload_fileobj(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, STREAM_CHUNK_SIZE)
+
+    def open_stream(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def get_object(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def object_exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete_object(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def create_multipart_upload(self, key: str, content_type: Optional[str] = None) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._multipart_dir(upload_id))
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        part_path = os.path.join(self._multipart_dir(upload_id), f"{part_number:05d}")
+        with open(part_path, "wb") as f:
+            f.write(data)
+        return f"\"{part_number}\""
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Dict]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_dir = self._multipart_dir(upload_id)
+        with open(path, "wb") as out:
+            for part in sorted(parts, key=lambda p: p["PartNumber"]):
+                with open(os.path.join(part_dir, f"{part['PartNumber']:05d}"), "rb") as f:
+                    shutil.copyfileobj(f, out, STREAM_CHUNK_SIZE)
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        shutil.rmtree(self._multipart_dir(upload_id), ignore_errors=True)
+
+
+def create_storage_backend(backend: Optional[str] = None):
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = (backend or settings.STORAGE_BACKEND).lower()
+    if backend == "local":
+        return LocalStorageBackend()
+    if backend == "s3":
+        return S3StorageBackend()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# Singleton instance
+storage_service = create_storage_backend()
@@ -0,0 +1,353 @@
+"""
+Task Locks
+
+Keeps periodic and per-project Celery tasks from running twice at once,
+whether beat ticks pile up behind a slow run or two beats run in an HA
+setup.
+
+- A lock is a Redis key holding a fencing token, drawn from a counter
+  per key that only grows: every acquisition gets a larger token than
+  any before it. Runs that write call fence() in their transaction: it
+  records the token in task_fences, whose row stays locked until the
+  commit, and refuses a token lower than one already recorded. A run
+  that stalled past its TTL and was taken over can therefore not
+  commit, however late it gets there.
+- Locks expire after TASK_LOCK_TTL_SECONDS and are renewed every third
+  of it while the task runs, so a crashed worker frees its key by
+  itself.
+- A run that finds its key locked is skipped, or with coalesce it
+  leaves a rerun flag: the holder runs the task once more when it
+  finishes, however many runs were coalesced meanwhile. Changes made
+  during a run are never left uncomputed.
+
+Without Redis tasks run unlocked rather than not at all. Runs are
+counted by task and outcome in projectwise_task_lock_runs_total.
+"""
+import time
+import inspect
+import logging
+import threading
+import functools
+from datetime import datetime
+from typing import Callable, Optional
+
+import redis
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.task_fence import TaskFence
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Takes the lock with the next fencing token if it is free; otherwise
+# returns 0, leaving a rerun flag when ARGV[2] is 1
+_ACQUIRE = """
+if redis.call("exists", KEYS[1]) == 1 then
+    if ARGV[2] == "1" then
+        redis.call("set", KEYS[3], 1, "PX", ARGV[1])
+    end
+    return 0
+end
+local token = redis.call("incr", KEYS[2])
+redis.call("set", KEYS[1], token, "PX", ARGV[1])
+return token
+"""
+
+# Extends the lock if it still holds our token
+_RENEW = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Takes a pending rerun flag while keeping the lock (1), or releases the
+# lock (0); -1 if the lock no longer holds our token
+_FINISH = """
+if redis.call("get", KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+if redis.call("del", KEYS[2]) == 1 then
+    redis.call("pexpire", KEYS[1], ARGV[2])
+    return 1
+end
+redis.call("del", KEYS[1])
+return 0
+"""
+
+# Releases the lock if it still holds our token
+_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Raises the token counter to at least ARGV[1]
+_ADVANCE = """
+if tonumber(redis.call("get", KEYS[1]) or "0") < tonumber(ARGV[1]) then
+    redis.call("set", KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# How long Redis is skipped after an error
+REDIS_BACKOFF_SECONDS = 5.0
+
+if prometheus_client is not None:
+    LOCK_RUNS = prometheus_client.Counter(
+        "projectwise_task_lock_runs", "Runs of locked tasks by outcome", ["task", "outcome"]
+    )
+
+
+class HeldLock:
+    """A lock taken by this process, renewed from a background thread until stopped"""
+
+    def __init__(self, locks: "TaskLocks", key: str, token: int, ttl_ms: int):
+        self.locks = locks
+        self.key = key
+        self.token = token
+        self.ttl_ms = ttl_ms
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="task-lock-keeper", daemon=True)
+        self._thread.start()
+
+    def holds(self) -> bool:
+        """Whether the lock still holds this run's token; writes use TaskLocks.fence"""
+        if self.lost:
+            return False
+        try:
+            value = self.locks.redis_factory().get(self.locks.lock_key(self.key))
+        except redis.RedisError as e:
+            # Can't tell; the renewals decide
+            logger.warning(f"Could not check task lock {self.key}: {e}")
+            return True
+        if value is None or int(value) != self.token:
+            self.lost = True
+        return not self.lost
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.ttl_ms / 3000):
+            try:
+                renewed = self.locks._script(_RENEW)(
+                    keys=[self.locks.lock_key(self.key)], args=[self.token, self.ttl_ms]
+                )
+            except redis.RedisError as e:
+                # Next renewal tries again; the lock outlives a few misses
+                logger.warning(f"Could not renew task lock {self.key}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost task lock {self.key} (token {self.token})")
+                self.lost = True
+                return
+
+
+class TaskLocks:
+    def __init__(self, namespace: str = "pw:lock", redis_factory: Callable[[], redis.Redis] = get_redis):
+        self.namespace = namespace
+        self.redis_factory = redis_factory
+        self._redis_skip_until = 0.0
+        self._scripts = {}
+        self._local = threading.local()
+
+    def acquire(self, key: str, ttl: float = None, coalesce: bool = False) -> Optional[HeldLock]:
+        """
+        Take a lock
+
+        Returns:
+            The held lock, or None if it is taken (with coalesce, a rerun
+            is requested from its holder)
+
+        Raises:
+            redis.RedisError: Redis is unavailable
+        """
+        ttl_ms = int((ttl or settings.TASK_LOCK_TTL_SECONDS) * 1000)
+        token = self._script(_ACQUIRE)(
+            keys=[self.lock_key(key), self._fence_key(key), self._rerun_key(key)],
+            args=[ttl_ms, 1 if coalesce else 0]
+        )
+        if not token:
+            return None
+        return HeldLock(self, key, int(token), ttl_ms)
+
+    def finish(self, held: HeldLock) -> bool:
+        """
+        Release a lock, unless a rerun was requested meanwhile
+
+        Returns:
+            True when the holder must run again, still holding the lock
+        """
+        try:
+            outcome = self._script(_FINISH)(
+                keys=[self.lock_key(held.key), self._rerun_key(held.key)], args=[held.token, held.ttl_ms]
+            )
+        except redis.RedisError as e:
+            # The lock expires by itself
+            logger.warning(f"Could not release task lock {held.key}: {e}")
+            outcome = 0
+        if outcome == -1:
+            held.lost = True
+        if outcome != 1:
+            held.stop()
+        return outcome == 1
+
+    def fence(self, db: Session, held: HeldLock) -> bool:
+        """
+        Record a run's token in its transaction, before it commits
+
+        The fence row stays locked until the transaction ends, so a run
+        taking the lock over meanwhile waits and then records its larger
+        token after ours.
+
+        Returns:
+            False if a later token already wrote: the caller must roll
+            back, and the run counts as having lost its lock
+        """
+        insert = self._insert(db)
+        stmt = insert(TaskFence).values(key=held.key, token=held.token, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TaskFence.key],
+            set_={"token": stmt.excluded.token, "updated_at": stmt.excluded.updated_at},
+            where=TaskFence.token <= stmt.excluded.token
+        ).returning(TaskFence.token)
+        if db.execute(stmt).first() is not None:
+            return True
+
+        if held.holds():
+            # Still ours in Redis yet behind the database: the counter was
+            # lost with Redis data. Move it past the recorded token so the
+            # next run can write again.
+            recorded = db.query(TaskFence.token).filter(TaskFence.key == held.key).scalar()
+            logger.warning(f"Task lock counter of {held.key} is behind its fence ({held.token} < {recorded}); advancing it")
+            try:
+                self._script(_ADVANCE)(keys=[self._fence_key(held.key)], args=[recorded])
+            except redis.RedisError as e:
+                logger.warning(f"Could not advance task lock counter of {held.key}: {e}")
+        held.lost = True
+        return False
+
+    def current(self) -> Optional[HeldLock]:
+        """Lock held by the singleton task running in this thread"""
+        return getattr(self._local, "held", None)
+
+    def singleton(self, key: str, ttl: float = None, coalesce: bool = False):
+        """
+        Decorate a task function so one run per key is in flight
+
+        Place it under @celery_app.task.
+
+        Args:
+            key: Lock key, formatted with the function's arguments, e.g.
+                "kpi:project:{project_id}"
+            ttl: Seconds the lock outlives a dead worker (default
+                TASK_LOCK_TTL_SECONDS)
+            coalesce: Runs finding the key locked make the holder run
+                once more, instead of being dropped
+
+        Returns:
+            Decorator; a skipped or coalesced run returns a dict with
+            success, skipped and coalesced
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                lock_key = key.format(**bound.arguments)
+                name = func.__name__
+
+                client_ok = self._redis_available()
+                try:
+                    held = self.acquire(lock_key, ttl, coalesce) if client_ok else None
+                except redis.RedisError as e:
+                    self._redis_failed(e)
+                    client_ok = False
+                if not client_ok:
+                    self._count(name, "unlocked")
+                    return func(*args, **kwargs)
+                if held is None:
+                    outcome = "coalesced" if coalesce else "skipped"
+                    self._count(name, outcome)
+                    logger.info(f"{name} already running for {lock_key}; {outcome}")
+                    return {"success": True, "skipped": True, "coalesced": coalesce}
+
+                outer, self._local.held = self.current(), held
+                try:
+                    runs = 0
+                    while True:
+                        self._count(name, "reran" if runs else "ran")
+                        result = func(*args, **kwargs)
+                        runs += 1
+                        if held.lost or not self.finish(held):
+                            break
+                finally:
+                    self._local.held = outer
+                    if not held._stop.is_set():
+                        # Raised out of the task: release, dropping any rerun
+                        self._release(held)
+                if held.lost:
+                    self._count(name, "lost")
+                return result
+
+            return wrapper
+        return decorator
+
+    def lock_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _fence_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}:fence"
+
+    def _rerun_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}:rerun"
+
+    def _release(self, held: HeldLock):
+        held.stop()
+        try:
+            self._script(_RELEASE)(keys=[self.lock_key(held.key)], args=[held.token])
+        except redis.RedisError as e:
+            logger.warning(f"Could not release task lock {held.key}: {e}")
+
+    def _insert(self, db: Session):
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert
+
+    def _count(self, task: str, outcome: str):
+        if prometheus_client is not None:
+            LOCK_RUNS.labels(task, outcome).inc()
+
+    def _script(self, source: str):
+        # Registered scripts run by SHA and reload themselves after a flush
+        client = self.redis_factory()
+        key = (id(client), source)
+        if key not in self._scripts:
+            self._scripts[key] = client.register_script(source)
+        return self._scripts[key]
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_skip_until
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Task lock Redis unavailable, running tasks unlocked for {REDIS_BACKOFF_SECONDS:.0f}s: {error}")
+        self._redis_skip_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+
+# Singleton instance
+task_locks = TaskLocks()
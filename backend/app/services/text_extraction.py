@@ -0,0 +1,414 @@
+"""
+Text Extraction
+
+Budgeted text extraction for analysis. Pages (PDF), paragraphs (DOCX),
+blocks of rows (XLSX) or blocks of lines (TXT) are pulled from a lazy
+generator and extraction stops as soon as the character budget is met,
+so a 2,000-page spec book or a 500,000-row BOQ costs as much as the part
+the prompt actually uses. Apart from PDFs, files are streamed: memory
+stays flat however large they are. Parts are collected in a list and
+joined once, and the start offset of every part in the joined text is
+recorded.
+
+When most of a large PDF is needed (no budget, or a big one), page
+ranges are parsed in a shared process pool and merged back in page
+order. PyPDF2 is pure Python, so this is what scales with cores. Inside
+daemonic processes (Celery's prefork pool) no child processes can be
+started, and extraction falls back to the serial path.
+"""
+import codecs
+import datetime
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from lxml import etree
+from openpyxl import load_workbook
+from PyPDF2 import PdfReader
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change alters the extracted text; cached extractions
+# and analyses are keyed by it
+EXTRACTOR_VERSION = "2"
+
+# Rough characters per model token, for token budgets
+CHARS_PER_TOKEN = 4
+
+PAGE_SEPARATOR = "\n"
+
+Source = Union[str, BinaryIO]
+
+# Called with (parts read, total parts) as extraction advances
+PageCallback = Callable[[int, int], None]
+
+# Rough size of the parts spreadsheets and plain text are cut into
+BLOCK_CHARS = 16_000
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Encodings told apart by their byte order mark
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all extractions in this process"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = settings.EXTRACTION_WORKERS or os.cpu_count() or 1
+                # spawn: forking a threaded API or worker process is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def can_use_process_pool() -> bool:
+    """Whether this process may start extraction workers"""
+    return settings.EXTRACTION_WORKERS != 1 and not multiprocessing.current_process().daemon
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Worker: text of pages [start, stop) of the PDF at path"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages_parallel(
+    path: str,
+    page_count: int,
+    parallelism: int = None,
+    pages_per_task: int = None,
+    pool: Executor = None
+) -> Iterator[str]:
+    """
+    Yield PDF page texts in order, parsing page ranges in a process pool
+
+    At most parallelism ranges are in flight, so a consumer that stops
+    early (a met budget) leaves little wasted work; ranges not yet
+    started are cancelled when the generator is closed.
+    """
+    parallelism = parallelism or settings.EXTRACTION_DOCUMENT_PARALLELISM
+    pages_per_task = pages_per_task or settings.EXTRACTION_PAGES_PER_TASK
+    pool = pool or get_extraction_pool()
+
+    ranges = ((start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task))
+    pending = deque(pool.submit(_extract_page_range, path, start, stop) for start, stop in itertools.islice(ranges, parallelism))
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_extract_page_range, path, *next_range))
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pdf_pages(source: Source, max_chars: Optional[int] = None, on_page: PageCallback = None) -> Iterator[str]:
+    """Yield the text of each PDF page, parsing pages only as they are consumed"""
+    reader = PdfReader(source)
+    page_count = len(reader.pages)
+    report = on_page or (lambda done, total: None)
+
+    if (
+        isinstance(source, str)
+        and page_count >= settings.EXTRACTION_PARALLEL_MIN_PAGES
+        and (max_chars is None or max_chars >= settings.EXTRACTION_PARALLEL_MIN_CHARS)
+        and can_use_process_pool()
+    ):
+        done = 0
+        try:
+            for text in iter_pdf_pages_parallel(source, page_count):
+                done += 1
+                report(done, page_count)
+                yield text
+            return
+        except BrokenProcessPool as e:
+            # A worker died; finish in-process and start a fresh pool next time
+            logger.warning(f"Extraction pool failed, continuing in-process from page {done}: {e}")
+            _discard_pool()
+        for i in range(done, page_count):
+            text = reader.pages[i].extract_text() or ""
+            report(i + 1, page_count)
+            yield text
+        return
+
+    for i, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        report(i + 1, page_count)
+        yield text
+
+
+def iter_docx_paragraphs(source: Source, on_page: PageCallback = None) -> Iterator[str]:
+    """
+    Yield the text of each DOCX paragraph, table cells included
+
+    word/document.xml is parsed incrementally and every paragraph is
+    dropped from the tree once read. Progress is reported in bytes of
+    the uncompressed XML, the only total known up front.
+    """
+    with zipfile.ZipFile(source) as archive:
+        info = archive.getinfo("word/document.xml")
+        with archive.open(info) as stream:
+            reader = _CountingReader(stream)
+            for _, element in etree.iterparse(reader, events=("end",), tag=f"{WORD_NAMESPACE}p"):
+                text = "".join(_docx_run_text(element))
+                # Free the paragraph, and siblings already read
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+                if on_page:
+                    on_page(reader.position, info.file_size)
+                yield text
+
+
+def _docx_run_text(paragraph) -> Iterator[str]:
+    for node in paragraph.iter(f"{WORD_NAMESPACE}t", f"{WORD_NAMESPACE}tab", f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr"):
+        if node.tag == f"{WORD_NAMESPACE}t":
+            yield node.text or ""
+        elif node.tag == f"{WORD_NAMESPACE}tab":
+            yield "\t"
+        else:
+            yield "\n"
+
+
+class _CountingReader:
+    """File wrapper counting the bytes read through it"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.position += len(data)
+        return data
+
+
+def iter_xlsx_rows(source: Source, on_page: PageCallback = None) -> Iterator[str]:
+    """
+    Yield blocks of spreadsheet rows, one tab-separated line per row
+
+    The workbook is opened read-only, so rows are streamed from the
+    sheet XML instead of loaded; cached formula results are read rather
+    than formulas. Each sheet starts with a "Sheet: <title>" line and
+    empty rows are skipped. Progress is reported in rows, against the
+    sheets' declared dimensions. Sheets written without a dimension
+    record (some exporters) are scanned once by openpyxl on opening,
+    still at flat memory; shared strings are held in memory.
+    """
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        total = sum(sheet.max_row or 0 for sheet in workbook.worksheets)
+        done = 0
+        for sheet in workbook.worksheets:
+            lines = [f"Sheet: {sheet.title}"]
+            size = len(lines[0])
+            for row in sheet.iter_rows(values_only=True):
+                done += 1
+                cells = [_cell_text(value) for value in row]
+                while cells and not cells[-1]:
+                    cells.pop()
+                if not cells:
+                    continue
+                line = "\t".join(cells)
+                lines.append(line)
+                size += len(line) + 1
+                if size >= BLOCK_CHARS:
+                    if on_page:
+                        on_page(done, max(total, done))
+                    yield "\n".join(lines)
+                    lines, size = [], 0
+            if lines:
+                if on_page:
+                    on_page(done, max(total, done))
+                yield "\n".join(lines)
+    finally:
+        workbook.close()
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        # Date cells come back as midnight datetimes
+        return value.date().isoformat()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def iter_text_blocks(source: Source, on_page: PageCallback = None) -> Iterator[str]:
+    """
+    Yield a plain text file in blocks of whole lines
+
+    The encoding comes from a byte order mark, else UTF-8 if the start
+    of the file decodes as such, else Windows-1252 (what older Windows
+    tools write); undecodable bytes are replaced. Line endings are
+    normalized. Progress is reported in bytes.
+    """
+    binary = open(source, "rb") if isinstance(source, str) else source
+    try:
+        # Works for in-memory files too, which have fileno() but raise on it
+        total = binary.seek(0, io.SEEK_END)
+        binary.seek(0)
+        encoding = _sniff_encoding(binary.read(BLOCK_CHARS))
+        binary.seek(0)
+
+        decoder = io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline=None)
+        carry = ""
+        try:
+            while True:
+                block = decoder.read(BLOCK_CHARS)
+                if not block:
+                    break
+                block = carry + block
+                # Cut after the last full line; a longer line is cut anywhere
+                cut = block.rfind("\n")
+                if cut < 0:
+                    carry, text = "", block
+                else:
+                    carry, text = block[cut + 1:], block[:cut]
+                if on_page:
+                    position = binary.tell()
+                    on_page(position, max(total, position))
+                yield text
+            if carry:
+                yield carry
+        finally:
+            # Leave a caller's file open
+            decoder.detach()
+    finally:
+        if isinstance(source, str):
+            binary.close()
+
+
+def _sniff_encoding(sample: bytes) -> str:
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # A multi-byte character may be cut at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def collect_text(parts: Iterable[str], max_chars: Optional[int]) -> Dict:
+    """
+    Join parts until max_chars characters have been collected
+
+    Args:
+        parts: Page (or paragraph) texts, usually a lazy generator
+        max_chars: Character budget, None for everything; the generator
+            is not advanced past it
+
+    Returns:
+        Dict with text (at most max_chars), page_offsets (start of each
+        part in text), pages_read and truncated (budget reached, so the
+        rest of the document was not read)
+    """
+    collected = []
+    offsets = []
+    length = 0
+    truncated = False
+
+    for part in parts:
+        offsets.append(length)
+        collected.append(part)
+        length += len(part) + len(PAGE_SEPARATOR)
+        if max_chars is not None and length >= max_chars:
+            # Stop without pulling (and parsing) another page
+            truncated = True
+            break
+
+    if hasattr(parts, "close"):
+        parts.close()
+
+    text = PAGE_SEPARATOR.join(collected)
+    if max_chars is not None:
+        text = text[:max_chars]
+
+    return {
+        "text": text,
+        "page_offsets": offsets,
+        "pages_read": len(offsets),
+        "truncated": truncated,
+    }
+
+
+def extract_text(
+    source: Source,
+    file_type: str,
+    max_chars: int = None,
+    max_tokens: int = None,
+    on_page: PageCallback = None
+) -> Dict:
+    """
+    Extract up to a budget of text from a document
+
+    Args:
+        source: File path or binary file object; large PDFs are only
+            parsed in parallel from a path
+        file_type: File type (pdf, docx, ...)
+        max_chars: Character budget
+        max_tokens: Token budget, converted with CHARS_PER_TOKEN; with
+            neither budget the whole document is extracted
+        on_page: Progress callback, called with (pages read, page count)
+            for PDFs, (rows read, row count) for XLSX and (bytes read,
+            byte count) for DOCX and TXT
+
+    Returns:
+        collect_text result; empty text for unsupported types
+    """
+    if max_chars is None and max_tokens is not None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+
+    file_type = file_type.lower()
+    if file_type == "pdf":
+        parts = iter_pdf_pages(source, max_chars, on_page)
+    elif file_type in ["docx", "doc"]:
+        parts = iter_docx_paragraphs(source, on_page)
+    elif file_type in ["xlsx", "xlsm"]:
+        parts = iter_xlsx_rows(source, on_page)
+    elif file_type == "txt":
+        parts = iter_text_blocks(source, on_page)
+    else:
+        parts = iter(())
+
+    return collect_text(parts, max_chars)
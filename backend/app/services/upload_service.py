@@ -0,0 +1,200 @@
+"""
+Resumable Upload Service
+
+tus-style protocol for very large files: a session is created with the
+declared length, chunks are appended at explicit offsets, progress can be
+queried at any time, and the session is finalized into a Document once
+every byte has arrived. Each chunk becomes one part of a storage multipart
+upload, and the part list is persisted on the session row so any API node
+can accept the next chunk.
+"""
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.document import Document
+from app.models.upload_session import UploadSession, UploadSessionStatusEnum
+from app.services.document_service import DocumentService
+from app.services.storage_service import storage_service
+
+logger = logging.getLogger(__name__)
+
+
+class UploadConflictError(ValueError):
+    """Raised when a chunk does not start at the session's current offset"""
+
+
+class UploadService:
+    def __init__(self):
+        self.storage = storage_service
+        self.document_service = DocumentService()
+
+    def create_session(
+        self,
+        db: Session,
+        project_id: str,
+        user_id: str,
+        upload_length: int,
+        filename: str,
+        name: str = None,
+        description: str = None,
+        discipline: str = None,
+        content_type: str = None
+    ) -> UploadSession:
+        """Start a resumable upload"""
+        if upload_length <= 0:
+            raise ValueError("Upload-Length must be positive")
+        if upload_length > settings.UPLOAD_MAX_SIZE:
+            raise ValueError(f"Upload exceeds maximum size of {settings.UPLOAD_MAX_SIZE} bytes")
+
+        storage_key = self.document_service.new_storage_key(project_id)
+        upload_id = self.storage.create_multipart_upload(storage_key, content_type=content_type)
+
+        session = UploadSession(
+            id=uuid.uuid4(),
+            project_id=uuid.UUID(project_id),
+            owner_id=uuid.UUID(user_id),
+            filename=filename,
+            name=name,
+            description=description,
+            discipline=discipline,
+            content_type=content_type,
+            upload_length=upload_length,
+            upload_offset=0,
+            storage_key=storage_key,
+            storage_upload_id=upload_id,
+            parts=[],
+            status=UploadSessionStatusEnum.ACTIVE,
+            expires_at=self._expiry()
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+        return session
+
+    def get_session(self, db: Session, session_id: str) -> Optional[UploadSession]:
+        """Get upload session by ID"""
+        return db.query(UploadSession).filter(
+            UploadSession.id == uuid.UUID(session_id)
+        ).first()
+
+    def append_chunk(self, db: Session, session_id: str, offset: int, data: bytes) -> UploadSession:
+        """
+        Append a chunk at the given offset
+
+        The session row is locked for the duration of the part upload, so
+        two nodes receiving the same chunk cannot both advance the offset.
+        """
+        session = self._lock_active_session(db, session_id)
+
+        if offset != session.upload_offset:
+            db.rollback()
+            raise UploadConflictError(
+                f"Upload-Offset {offset} does not match current offset {session.upload_offset}"
+            )
+
+        new_offset = offset + len(data)
+        if new_offset > session.upload_length:
+            db.rollback()
+            raise ValueError("Chunk extends past the declared Upload-Length")
+        if new_offset < session.upload_length and len(data) < settings.UPLOAD_CHUNK_MIN_SIZE:
+            db.rollback()
+            raise ValueError(
+                f"Only the final chunk may be smaller than {settings.UPLOAD_CHUNK_MIN_SIZE} bytes"
+            )
+
+        part_number = len(session.parts or []) + 1
+        etag = self.storage.upload_part(session.storage_key, session.storage_upload_id, part_number, data)
+
+        # Reassign rather than mutate so the JSON column is flagged dirty
+        session.parts = (session.parts or []) + [{"PartNumber": part_number, "ETag": etag}]
+        session.upload_offset = new_offset
+        session.expires_at = self._expiry()
+        db.commit()
+        db.refresh(session)
+        return session
+
+    def finalize(self, db: Session, session_id: str) -> Document:
+        """Complete the multipart upload and create the Document/DocumentVersion"""
+        session = self._lock_active_session(db, session_id)
+
+        if session.upload_offset != session.upload_length:
+            db.rollback()
+            raise UploadConflictError(
+                f"Upload incomplete: {session.upload_offset} of {session.upload_length} bytes received"
+            )
+
+        self.storage.complete_multipart_upload(
+            session.storage_key,
+            session.storage_upload_id,
+            session.parts
+        )
+
+        session.status = UploadSessionStatusEnum.COMPLETED
+        document = self.document_service.create_document_record(
+            db,
+            project_id=str(session.project_id),
+            user_id=str(session.owner_id),
+            filename=session.filename,
+            file_path=self.storage.url_for(session.storage_key),
+            file_size=session.upload_length,
+            name=session.name,
+            description=session.description,
+            discipline=session.discipline
+        )
+        session.document_id = document.id
+        db.commit()
+        return document
+
+    def abort(self, db: Session, session_id: str):
+        """Abort an upload and discard the received parts"""
+        session = self._lock_active_session(db, session_id)
+        self._abort_storage_upload(session)
+        session.status = UploadSessionStatusEnum.ABORTED
+        db.commit()
+
+    def cleanup_expired_sessions(self, db: Session, batch_size: int = 100) -> int:
+        """
+        Abort sessions whose TTL has elapsed and delete finished session rows
+
+        Returns:
+            Number of sessions removed
+        """
+        now = datetime.utcnow()
+        sessions = db.query(UploadSession).filter(
+            UploadSession.expires_at < now
+        ).limit(batch_size).with_for_update(skip_locked=True).all()
+
+        for session in sessions:
+            if session.status == UploadSessionStatusEnum.ACTIVE:
+                self._abort_storage_upload(session)
+            db.delete(session)
+
+        db.commit()
+        return len(sessions)
+
+    def _lock_active_session(self, db: Session, session_id: str) -> UploadSession:
+        session = db.query(UploadSession).filter(
+            UploadSession.id == uuid.UUID(session_id)
+        ).with_for_update().first()
+
+        if not session:
+            db.rollback()
+            raise LookupError("Upload session not found")
+        if session.status != UploadSessionStatusEnum.ACTIVE or session.expires_at < datetime.utcnow():
+            db.rollback()
+            raise LookupError("Upload session is no longer active")
+        return session
+
+    def _abort_storage_upload(self, session: UploadSession):
+        try:
+            self.storage.abort_multipart_upload(session.storage_key, session.storage_upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort multipart upload for session {session.id}: {e}")
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
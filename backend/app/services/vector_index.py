@@ -0,0 +1,469 @@
+"""
+Vector Index
+
+On-disk nearest-neighbour index for one project's chunk embeddings,
+built on NumPy only. Rows are appended to flat files (float16 vectors,
+16-byte document ids, a live flag and an inverted-list assignment) and
+a small manifest records how many rows are complete, so readers in other
+processes memory-map exactly the committed prefix. Writers serialize on
+an fcntl lock in the index directory; the manifest is replaced
+atomically after the data files are flushed.
+
+Search is exact (one matrix product) while the index is small. Past
+SIMILARITY_IVF_MIN_VECTORS a rebuild trains an inverted-file quantizer
+(spherical k-means over a sample): every row is assigned to its nearest
+centroid, and a search scans only the rows of the SIMILARITY_IVF_PROBES
+centroids nearest its queries, a few thousand out of a million. Rows added
+later are assigned to the existing centroids; the next rebuild retrains
+and drops rows of replaced documents. A rebuild writes a new generation
+of files, so readers holding the old ones are never disturbed.
+"""
+import fcntl
+import json
+import math
+import os
+import threading
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# Rows assigned or converted per block, bounding temporary memory
+BLOCK_ROWS = 65536
+
+# Rebuild once rows outgrow the trained quantizer this many times over,
+# or this share of rows belongs to replaced documents
+REBUILD_GROWTH = 2.0
+REBUILD_DEAD_SHARE = 0.3
+
+# Unindexed rows scanned exactly before postings are rebuilt in memory
+MAX_TAIL_SHARE = 0.05
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids maximizing cosine similarity to their rows"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        # Empty clusters restart at a random row
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class VectorIndex:
+    """
+    One project's index directory
+
+    Instances are cheap and safe to share between threads; they reload
+    when another process commits rows or a new generation.
+    """
+
+    def __init__(self, path: str, embedder_name: str, dim: int):
+        self.path = path
+        self.embedder_name = embedder_name
+        self.dim = dim
+        self._reload_lock = threading.Lock()
+        self._state = None  # (manifest, arrays, postings)
+
+    # Writing
+
+    def add(self, document_id: uuid.UUID, vectors: np.ndarray) -> Dict:
+        """
+        Replace a document's rows with vectors
+
+        Returns:
+            The committed manifest
+        """
+        return self.add_many([(document_id, vectors)])
+
+    def add_many(self, documents: List[Tuple[uuid.UUID, np.ndarray]]) -> Dict:
+        """Replace the rows of several documents in one commit"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None or manifest["embedder"] != self.embedder_name:
+                if manifest is None:
+                    manifest = self._create_generation(0)
+                else:
+                    logger.warning(f"Similarity index {self.path} was built with {manifest['embedder']}; starting over")
+                    old_gen = manifest["generation"]
+                    manifest = self._create_generation(old_gen + 1)
+                    self._write_manifest(manifest)
+                    self._remove_generation(old_gen)
+            self._kill_rows(manifest, [document_id for document_id, _ in documents])
+
+            documents = [(document_id, vectors) for document_id, vectors in documents if len(vectors)]
+            if documents:
+                vectors = np.concatenate([np.asarray(v, dtype=np.float32) for _, v in documents])
+                docs = np.concatenate([
+                    np.tile(np.frombuffer(document_id.bytes, dtype=np.uint8), (len(v), 1)) for document_id, v in documents
+                ])
+                centroids = self._centroids(manifest)
+                labels = nearest_centroids(vectors, centroids) if centroids is not None else np.full(len(vectors), -1, np.int32)
+                gen = manifest["generation"]
+                self._append(gen, "vectors", vectors.astype(np.float16))
+                self._append(gen, "docs", docs)
+                self._append(gen, "live", np.ones(len(vectors), dtype=np.uint8))
+                self._append(gen, "assign", labels)
+                manifest["count"] += len(vectors)
+            self._write_manifest(manifest)
+            return manifest
+
+    def remove(self, document_ids: List[uuid.UUID]):
+        """Drop documents from search results; their rows go at the next rebuild"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is not None:
+                self._kill_rows(manifest, document_ids)
+                self._write_manifest(manifest)
+
+    def needs_rebuild(self, manifest: Dict = None) -> bool:
+        manifest = manifest or self._read_manifest()
+        if manifest is None:
+            return False
+        count = manifest["count"]
+        if count < settings.SIMILARITY_IVF_MIN_VECTORS:
+            return manifest["dead"] > REBUILD_DEAD_SHARE * max(count, 1) and count > 1000
+        if not manifest["trained_count"]:
+            return True
+        return count > REBUILD_GROWTH * manifest["trained_count"] or manifest["dead"] > REBUILD_DEAD_SHARE * count
+
+    def rebuild(self, iterations: int = 8) -> Dict:
+        """
+        Compact live rows into a new generation and retrain the quantizer
+
+        The slow part (k-means and assigning every row) runs without the
+        write lock; rows committed meanwhile are carried over under it.
+
+        Returns:
+            Dict with rows, lists and generation; skipped when another
+            rebuild of this index is running
+        """
+        with self._rebuild_lock() as acquired:
+            if not acquired:
+                return {"skipped": True}
+            return self._rebuild(iterations)
+
+    def _rebuild(self, iterations: int) -> Dict:
+        manifest, arrays = self._open(self._read_manifest())
+        if manifest is None:
+            return {"rows": 0, "lists": 0, "generation": None}
+        old_gen = manifest["generation"]
+        new_gen = old_gen + 1
+        count = manifest["count"]
+        keep = np.flatnonzero(arrays["live"][:count])
+
+        centroids = None
+        if len(keep) >= settings.SIMILARITY_IVF_MIN_VECTORS:
+            lists = int(min(4096, max(16, 2 * math.sqrt(len(keep)))))
+            sample = np.random.default_rng(0).choice(keep, size=min(len(keep), 40 * lists), replace=False)
+            centroids = spherical_kmeans(np.asarray(arrays["vectors"][np.sort(sample)], dtype=np.float32), lists, iterations)
+
+        self._write_rows(new_gen, arrays, keep, centroids, truncate=True)
+
+        with self._write_lock():
+            current = self._read_manifest()
+            if current["generation"] != old_gen:
+                raise RuntimeError(f"Similarity index {self.path} was rebuilt concurrently")
+            _, arrays = self._open(current)
+            # Rows committed while training, and replacements of kept rows
+            tail = np.arange(count, current["count"])
+            tail = tail[arrays["live"][tail] == 1]
+            self._write_rows(new_gen, arrays, tail, centroids, truncate=False)
+            live = np.concatenate([arrays["live"][keep], np.ones(len(tail), dtype=np.uint8)])
+            live.tofile(self._path(new_gen, "live"))
+            if centroids is not None:
+                np.save(self._path(new_gen, "centroids"), centroids)
+            rows = len(keep) + len(tail)
+            new_manifest = {
+                "embedder": self.embedder_name,
+                "dim": self.dim,
+                "generation": new_gen,
+                "count": rows,
+                "dead": int(rows - live.sum()),
+                "trained_count": rows if centroids is not None else 0,
+                "lists": len(centroids) if centroids is not None else 0,
+            }
+            self._write_manifest(new_manifest)
+            self._remove_generation(old_gen)
+        logger.info(f"Rebuilt similarity index {self.path}: {rows} rows, {new_manifest['lists']} lists")
+        return {"rows": rows, "lists": new_manifest["lists"], "generation": new_gen}
+
+    # Reading
+
+    def search(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Nearest live rows for each query vector
+
+        Returns:
+            Per query, (document ids as an (n, 16) uint8 array, scores),
+            best first; at most k rows
+        """
+        state = self._current()
+        if state is None:
+            return [(np.empty((0, 16), np.uint8), np.empty(0, np.float32)) for _ in queries]
+        manifest, arrays, postings = state
+        queries = np.asarray(queries, dtype=np.float32)
+        count = manifest["count"]
+        if postings is None:
+            return self._search_exact(arrays, count, queries, k)
+
+        order, offsets, indexed, centroids = postings
+        # The lists closest to any of the queries (chunks of one document
+        # mostly agree), and every query's closest list; their rows are
+        # scored once, in file order
+        probes = min(settings.SIMILARITY_IVF_PROBES, len(centroids))
+        affinity = queries @ centroids.T
+        lists = np.union1d(np.argpartition(-affinity.max(axis=0), probes - 1)[:probes], affinity.argmax(axis=1))
+        rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists] + [np.arange(indexed, count)]))
+        rows = rows[arrays["live"][rows] == 1]
+        if not len(rows):
+            return [(np.empty((0, 16), np.uint8), np.empty(0, np.float32)) for _ in queries]
+        scores = np.asarray(arrays["vectors"][rows], dtype=np.float32) @ queries.T
+        docs = arrays["docs"][rows]
+
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, min(k, len(column)) - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append((docs[top], column[top]))
+        return results
+
+    def rows_of(self, document_id: uuid.UUID) -> np.ndarray:
+        """Stored vectors of a document's live rows"""
+        state = self._current()
+        if state is None:
+            return np.empty((0, self.dim), np.float32)
+        manifest, arrays, _ = state
+        rows = self._document_rows(arrays, manifest["count"], [document_id])
+        return np.asarray(arrays["vectors"][rows], dtype=np.float32)
+
+    def stats(self) -> Dict:
+        manifest = self._read_manifest()
+        if manifest is None:
+            return {"rows": 0, "live_rows": 0, "lists": 0, "embedder": self.embedder_name}
+        return {
+            "rows": manifest["count"],
+            "live_rows": manifest["count"] - manifest["dead"],
+            "lists": manifest["lists"],
+            "embedder": manifest["embedder"],
+        }
+
+    def _search_exact(self, arrays, count: int, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # Every query against every row, a block at a time, keeping the
+        # best k of each query
+        live = np.asarray(arrays["live"][:count]) == 1
+        dense = arrays.get("dense")
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, count, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, count)
+            block = dense[start:end] if dense is not None else np.asarray(arrays["vectors"][start:end], dtype=np.float32)
+            scores = queries @ block.T
+            scores[:, ~live[start:end]] = -np.inf
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), (len(queries), end - start))], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            keep = np.isfinite(scores)
+            scores, rows = scores[keep], rows[keep]
+            order = np.argsort(-scores)
+            results.append((arrays["docs"][rows[order]], scores[order]))
+        return results
+
+    def _current(self):
+        manifest = self._read_manifest()
+        if manifest is None or manifest["embedder"] != self.embedder_name:
+            return None
+        state = self._state
+        if state is not None and state[0]["generation"] == manifest["generation"] and state[0]["count"] == manifest["count"]:
+            return state
+        with self._reload_lock:
+            state = self._state
+            if state is None or state[0]["generation"] != manifest["generation"] or state[0]["count"] != manifest["count"]:
+                state = self._load(manifest, state)
+                self._state = state
+        return state
+
+    def _load(self, manifest: Dict, previous):
+        manifest, arrays = self._open(manifest)
+        count = manifest["count"]
+        if count and count < settings.SIMILARITY_IVF_MIN_VECTORS:
+            # Small enough to keep converted for exact search
+            arrays["dense"] = np.asarray(arrays["vectors"][:count], dtype=np.float32)
+
+        postings = None
+        centroids = self._centroids(manifest)
+        if centroids is not None:
+            if (
+                previous is not None
+                and previous[2] is not None
+                and previous[0]["generation"] == manifest["generation"]
+                and count - previous[2][2] <= MAX_TAIL_SHARE * count
+            ):
+                # Few new rows: keep the postings and scan the tail exactly
+                postings = previous[2]
+            else:
+                labels = np.asarray(arrays["assign"][:count])
+                order = np.argsort(labels, kind="stable").astype(np.int64)
+                offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))])
+                postings = (order, offsets, count, centroids)
+        return manifest, arrays, postings
+
+    def _open(self, manifest: Optional[Dict]):
+        if manifest is None:
+            return None, None
+        gen, count = manifest["generation"], manifest["count"]
+
+        def mapped(name, dtype, shape, mode="r"):
+            if not count:
+                return np.empty(shape, dtype)
+            return np.memmap(self._path(gen, name), dtype=dtype, mode=mode, shape=shape)
+
+        return manifest, {
+            "vectors": mapped("vectors", np.float16, (count, self.dim)),
+            "docs": mapped("docs", np.uint8, (count, 16)),
+            "live": mapped("live", np.uint8, (count,)),
+            "assign": mapped("assign", np.int32, (count,)),
+        }
+
+    # Files
+
+    def _write_rows(self, gen: int, arrays, rows: np.ndarray, centroids: Optional[np.ndarray], truncate: bool):
+        mode = "wb" if truncate else "ab"
+        with open(self._path(gen, "vectors"), mode) as vectors, open(self._path(gen, "docs"), mode) as docs, \
+                open(self._path(gen, "assign"), mode) as assign:
+            for start in range(0, len(rows), BLOCK_ROWS):
+                block = np.sort(rows[start:start + BLOCK_ROWS])
+                data = np.asarray(arrays["vectors"][block])
+                data.tofile(vectors)
+                np.asarray(arrays["docs"][block]).tofile(docs)
+                labels = nearest_centroids(data, centroids) if centroids is not None else np.full(len(block), -1, np.int32)
+                labels.tofile(assign)
+
+    def _kill_rows(self, manifest: Dict, document_ids: List[uuid.UUID]):
+        count = manifest["count"]
+        if not count:
+            return
+        _, arrays = self._open(manifest)
+        rows = self._document_rows(arrays, count, document_ids)
+        if len(rows):
+            live = np.memmap(self._path(manifest["generation"], "live"), dtype=np.uint8, mode="r+", shape=(count,))
+            manifest["dead"] += int(live[rows].sum())
+            live[rows] = 0
+            live.flush()
+
+    def _document_rows(self, arrays, count: int, document_ids: List[uuid.UUID]) -> np.ndarray:
+        if not count:
+            return np.empty(0, np.int64)
+        # Compare 16-byte ids as pairs of 64-bit words: the first word
+        # narrows the rows down, the second confirms them
+        docs = np.asarray(arrays["docs"][:count]).view(np.uint64)
+        wanted = np.array([np.frombuffer(d.bytes, dtype=np.uint64) for d in document_ids]).reshape(-1, 2)
+        rows = np.flatnonzero(np.isin(docs[:, 0], wanted[:, 0]))
+        if not len(rows):
+            return rows
+        ids = {tuple(words) for words in wanted.tolist()}
+        return rows[[tuple(words) in ids for words in docs[rows].tolist()]]
+
+    def _centroids(self, manifest: Dict) -> Optional[np.ndarray]:
+        if not manifest["lists"]:
+            return None
+        return np.load(self._path(manifest["generation"], "centroids"))
+
+    def _append(self, gen: int, name: str, data: np.ndarray):
+        with open(self._path(gen, name), "ab") as f:
+            data.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _create_generation(self, gen: int) -> Dict:
+        for name in ("vectors", "docs", "live", "assign"):
+            open(self._path(gen, name), "wb").close()
+        return {
+            "embedder": self.embedder_name,
+            "dim": self.dim,
+            "generation": gen,
+            "count": 0,
+            "dead": 0,
+            "trained_count": 0,
+            "lists": 0,
+        }
+
+    def _remove_generation(self, gen: int):
+        for name in ("vectors", "docs", "live", "assign", "centroids"):
+            try:
+                os.remove(self._path(gen, name))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, gen: int, name: str) -> str:
+        suffix = "npy" if name == "centroids" else "bin"
+        return os.path.join(self.path, f"{name}.{gen}.{suffix}")
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: Dict):
+        tmp = os.path.join(self.path, f".{MANIFEST}.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+    @contextmanager
+    def _rebuild_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "rebuild.lock"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -1,8 +1,10 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import uuid
 
 from app.models.workflow import RFI, Transmittal
 from app.schemas.workflow import RFICreate, RFIUpdate, TransmittalCreate
+from app.services.dirty_projects import dirty_projects
 
 class WorkflowService:
     def create_rfi(self, db: Session, project_id: str, created_by: str, rfi_data: RFICreate):
@@ -13,10 +15,15 @@ class WorkflowService:
         )
         db.add(db_rfi)
         db.commit()
+        dirty_projects.mark(db_rfi.project_id)
         db.refresh(db_rfi)
         return db_rfi
 
-    def list_project_rfis(self, db: Session, project_id: str):
+    def list_project_rfis(self, db: Session, project_id: str, fields: list = None):
+        if fields:
+            # Column projection: rows come back as dicts without ORM hydration
+            stmt = select(*[getattr(RFI, name) for name in fields]).where(RFI.project_id == uuid.UUID(project_id))
+            return [dict(row) for row in db.execute(stmt).mappings()]
         return db.query(RFI).filter(RFI.project_id == uuid.UUID(project_id)).all()
 
     def get_rfi(self, db: Session, rfi_id: str):
@@ -29,6 +36,7 @@ class WorkflowService:
             for key, value in update_data.items():
                 setattr(db_rfi, key, value)
             db.commit()
+            dirty_projects.mark(db_rfi.project_id)
             db.refresh(db_rfi)
         return db_rfi
 
@@ -40,6 +48,7 @@ class WorkflowService:
         )
         db.add(db_transmittal)
         db.commit()
+        dirty_projects.mark(db_transmittal.project_id)
         db.refresh(db_transmittal)
         return db_transmittal
 
@@ -1,184 +1,378 @@
 """
 AI Analysis Background Tasks
 
-Celery tasks for asynchronous document analysis
+Celery tasks for asynchronous document analysis. Documents are queued as
+analysis jobs (see app.services.analysis_queue) and drained by
+process_analysis_jobs tasks, which claim jobs in batches; a minutely beat
+queues unanalyzed documents and keeps enough drainers running.
 """
 import logging
+import math
+import time
+from collections import Counter
 from datetime import datetime
+from typing import Dict, Optional
 import uuid
 
-from app.tasks.celery_app import celery_app
+from app.tasks.celery_app import PRIORITY_HIGH, celery_app
+from app.tasks.similarity_tasks import rebuild_similarity_index
+from app.config import settings
 from app.database import SessionLocal
-from app.models.document import Document
+from app.models.analysis_job import AnalysisJobStatusEnum
+from app.models.document import Document, DocumentVersion
 from app.models.document_analysis import DocumentAnalysis
-from app.services.ai_analysis_service import ai_service
+from app.services.analysis_cache_service import analysis_cache
+from app.services.analysis_metrics import analysis_metrics
+from app.services.analysis_progress import AnalysisProgress, progress_publisher
+from app.services.analysis_queue import LeaseKeeper, analysis_queue, new_worker_id
+from app.services.dirty_projects import dirty_projects
+from app.services.document_service import DocumentService
+from app.services.llm_client import LLMRetryableError
+from app.services.task_lock import task_locks
+from app.services.search_service import search_service
+from app.services.similarity_service import similarity_service
 
 logger = logging.getLogger(__name__)
+document_service = DocumentService()
 
+# Priority of manually triggered analyses; the pending scan queues at 0
+MANUAL_PRIORITY = 10
 
-@celery_app.task(
-    bind=True,
-    max_retries=3,
-    default_retry_delay=60
-)
-def analyze_document_async(self, document_id: str, file_path: str):
+
+def run_document_analysis(db, document_id: str, progress: Optional[AnalysisProgress] = None) -> Dict:
+    """
+    Analyze a document's current version and stage the result rows
+
+    Nothing is committed, so the caller can commit the analysis together
+    with its job's completion. The current version is read from storage;
+    content analyzed before is served from the analysis cache without
+    extraction or a model call.
+
+    Args:
+        db: Database session (the caller commits)
+        document_id: Document UUID
+        progress: Receives extraction and model call progress
+
+    Returns:
+        Dict with success; failures (no document, no stored version) are
+        permanent
+
+    Raises:
+        LLMRetryableError: The model stayed throttled
+    """
+    document = db.query(Document).filter(
+        Document.id == uuid.UUID(document_id)
+    ).first()
+
+    if not document:
+        logger.error(f"Document {document_id} not found")
+        return {
+            "success": False,
+            "error": "Document not found"
+        }
+
+    # Check if analysis already exists
+    existing_analysis = db.query(DocumentAnalysis).filter(
+        DocumentAnalysis.document_id == uuid.UUID(document_id)
+    ).first()
+
+    if existing_analysis:
+        logger.info(f"Analysis already exists for document {document_id}")
+        return {
+            "success": True,
+            "message": "Analysis already exists",
+            "analysis_id": str(existing_analysis.id)
+        }
+
+    version = db.query(DocumentVersion).filter(
+        DocumentVersion.id == document.current_version_id
+    ).first()
+
+    if not version:
+        logger.error(f"Document {document_id} has no stored version")
+        return {
+            "success": False,
+            "error": "Document has no stored version"
+        }
+
+    # Perform AI analysis
+    analysis_result = analysis_cache.analyze_version(
+        db,
+        version,
+        file_type=document.file_type,
+        filename=document.name,
+        progress=progress
+    )
+
+    # Create DocumentAnalysis record
+    analysis = DocumentAnalysis(
+        document_id=uuid.UUID(document_id),
+        summary=analysis_result["summary"],
+        extracted_data=analysis_result["extracted_data"],
+        ocr_text=analysis_result["ocr_text"],
+        page_offsets=analysis_result.get("page_offsets"),
+        key_entities=analysis_result["key_entities"],
+        confidence_score=analysis_result["confidence_score"],
+        processing_time=analysis_result["processing_time"],
+        cache_status=analysis_result["cache"],
+        **(analysis_result.get("timings") or {}),
+        analyzed_by=analysis_result["analyzed_by"],
+        analyzed_at=datetime.utcnow()
+    )
+
+    db.add(analysis)
+
+    # Make the summary and extracted text searchable
+    search_service.index_document(db, document, analysis)
+
+    # Update document status
+    document.status = "analyzed"
+    db.flush()
+
+    logger.info(
+        f"Analyzed document {document_id} "
+        f"in {analysis_result['processing_time']:.2f}s "
+        f"(confidence: {analysis_result['confidence_score']:.2f}, cache: {analysis_result['cache']})"
+    )
+
+    return {
+        "success": True,
+        "document_id": document_id,
+        "analysis_id": str(analysis.id),
+        "confidence_score": analysis_result["confidence_score"],
+        "processing_time": analysis_result["processing_time"],
+        "cache": analysis_result["cache"],
+        "project_id": str(document.project_id),
+        "file_type": document.file_type,
+        "timings": analysis_result.get("timings")
+    }
+
+
+def index_similarity(db, document_id: str):
+    """
+    Add a stored analysis to its project's similar-documents index
+
+    The analysis is committed already, so failures are only logged; the
+    next backfill_similarity_index picks the document up.
+    """
+    if not settings.SIMILARITY_ENABLED:
+        return
+    try:
+        indexed = similarity_service.index_document(db, document_id)
+    except Exception as e:
+        logger.warning(f"Could not index document {document_id} for similarity: {e}", exc_info=True)
+        return
+    if indexed and indexed["needs_rebuild"]:
+        rebuild_similarity_index.delay(indexed["project_id"])
+
+
+def process_job(db, job: Dict, worker_id: str) -> Dict:
+    """
+    Run one claimed job and record its outcome
+
+    Returns:
+        Dict with outcome ("succeeded", "requeued", "failed" or "lost",
+        when another worker took over the lease) and the analysis result
+    """
+    document_id = str(job["document_id"])
+    progress = progress_publisher.tracker(document_id)
+    progress.stage("started", attempt=job["attempts"])
+
+    try:
+        result = run_document_analysis(db, document_id, progress)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error analyzing document {document_id} (attempt {job['attempts']}): {e}", exc_info=True)
+        retry_after = e.retry_after if isinstance(e, LLMRetryableError) else None
+        status = analysis_queue.fail(db, job["id"], worker_id, str(e), retry_after=retry_after)
+        db.commit()
+        if status == AnalysisJobStatusEnum.FAILED.value:
+            document_service.invalidate_document_cache(document_id)
+            progress.stage("failed", error=str(e))
+            return {"outcome": "failed", "error": str(e)}
+        if status:
+            progress.stage("retrying", error=str(e), attempt=job["attempts"])
+            return {"outcome": "requeued", "error": str(e)}
+        return {"outcome": "lost", "error": str(e)}
+
+    if not result["success"]:
+        db.rollback()
+        analysis_queue.fail(db, job["id"], worker_id, result["error"], permanent=True)
+        db.commit()
+        document_service.invalidate_document_cache(document_id)
+        progress.stage("failed", error=result["error"])
+        return {"outcome": "failed", **result}
+
+    # Fenced on the lease: a worker that lost it must not record a second analysis
+    if not analysis_queue.complete(db, job["id"], worker_id):
+        db.rollback()
+        logger.warning(f"Lost the lease on analysis job {job['id']}; discarding the result")
+        return {"outcome": "lost"}
+
+    db.commit()
+    document_service.invalidate_document_cache(document_id)
+    if "project_id" in result:
+        dirty_projects.mark(result["project_id"])
+    if "timings" in result:
+        analysis_metrics.observe(result["file_type"], result["cache"], result["processing_time"], result["timings"])
+    index_similarity(db, document_id)
+    # Push the result itself, so clients need not fetch it
+    progress.stage("stored", result=document_service.get_analysis_result(db, document_id))
+    return {"outcome": "succeeded", **result}
+
+
+@celery_app.task
+def process_analysis_jobs(drain_seconds: float = None, batch_size: int = None):
+    """
+    Drain the analysis job queue
+
+    Claims batches of jobs and analyzes them one after another until the
+    queue is empty or drain_seconds have passed. Any number of these run
+    side by side; each claims different jobs.
+
+    Args:
+        drain_seconds: No new batch is claimed after this
+        batch_size: Jobs claimed at a time
+
+    Returns:
+        Dict with success status, outcome counts and cache outcomes
+    """
+    drain_seconds = drain_seconds if drain_seconds is not None else settings.ANALYSIS_DRAIN_SECONDS
+    deadline = time.monotonic() + drain_seconds
+    worker_id = new_worker_id()
+    outcomes = Counter()
+    cache = Counter()
+    db = SessionLocal()
+
+    try:
+        with LeaseKeeper(worker_id) as keeper:
+            while time.monotonic() < deadline:
+                jobs = analysis_queue.claim(db, worker_id, batch_size)
+                if not jobs:
+                    break
+                keeper.add([job["id"] for job in jobs])
+                for job in jobs:
+                    try:
+                        result = process_job(db, job, worker_id)
+                    finally:
+                        keeper.discard(job["id"])
+                    outcomes[result["outcome"]] += 1
+                    if "cache" in result:
+                        cache[result["cache"]] += 1
+
+        if outcomes:
+            logger.info(f"Analysis worker {worker_id} finished: {dict(outcomes)}")
+
+        return {
+            "success": True,
+            "worker_id": worker_id,
+            "processed": sum(outcomes.values()),
+            "outcomes": dict(outcomes),
+            "cache": dict(cache)
+        }
+
+    except Exception as e:
+        # Claimed jobs are picked up again once their leases expire
+        logger.error(f"Error in process_analysis_jobs: {e}", exc_info=True)
+        return {
+            "success": False,
+            "worker_id": worker_id,
+            "error": str(e)
+        }
+
+    finally:
+        db.close()
+
+
+@celery_app.task
+def analyze_document_async(document_id: str, file_path: str = None):
     """
-    Analyze document asynchronously using Gemini AI
-    
+    Queue a document for analysis ahead of the pending scan
+
+    Kept for callers of the earlier per-document task; the job is run by
+    a drainer like any other, so a document is never analyzed twice.
+
     Args:
         document_id: Document UUID
-        file_path: Path to uploaded file
-        
+        file_path: Unused; accepted so tasks queued with it still run
+
     Returns:
-        Dict with analysis results
+        Dict with success status and job id
     """
     db = SessionLocal()
-    
+
     try:
-        logger.info(f"Starting AI analysis for document {document_id}")
-        
-        # Get document
-        document = db.query(Document).filter(
-            Document.id == uuid.UUID(document_id)
-        ).first()
-        
-        if not document:
-            logger.error(f"Document {document_id} not found")
-            return {
-                "success": False,
-                "error": "Document not found"
-            }
-        
-        # Check if analysis already exists
-        existing_analysis = db.query(DocumentAnalysis).filter(
-            DocumentAnalysis.document_id == uuid.UUID(document_id)
-        ).first()
-        
-        if existing_analysis:
-            logger.info(f"Analysis already exists for document {document_id}")
-            return {
-                "success": True,
-                "message": "Analysis already exists",
-                "analysis_id": str(existing_analysis.id)
-            }
-        
-        # Perform AI analysis
-        analysis_result = ai_service.analyze_document(
-            file_path=file_path,
-            file_type=document.file_type,
-            filename=document.name
-        )
-        
-        # Create DocumentAnalysis record
-        analysis = DocumentAnalysis(
-            document_id=uuid.UUID(document_id),
-            summary=analysis_result["summary"],
-            extracted_data=analysis_result["extracted_data"],
-            ocr_text=analysis_result["ocr_text"],
-            key_entities=analysis_result["key_entities"],
-            confidence_score=analysis_result["confidence_score"],
-            processing_time=analysis_result["processing_time"],
-            analyzed_by=analysis_result["analyzed_by"],
-            analyzed_at=datetime.utcnow()
-        )
-        
-        db.add(analysis)
-        
-        # Update document status
-        document.status = "analyzed"
-        
+        job_id = analysis_queue.enqueue(db, uuid.UUID(document_id), priority=MANUAL_PRIORITY)
         db.commit()
-        
-        logger.info(
-            f"Successfully analyzed document {document_id} "
-            f"in {analysis_result['processing_time']:.2f}s "
-            f"(confidence: {analysis_result['confidence_score']:.2f})"
-        )
-        
+        progress_publisher.publish(document_id, "queued")
+        process_analysis_jobs.apply_async(priority=PRIORITY_HIGH)
         return {
             "success": True,
             "document_id": document_id,
-            "analysis_id": str(analysis.id),
-            "confidence_score": analysis_result["confidence_score"],
-            "processing_time": analysis_result["processing_time"]
+            "job_id": str(job_id)
         }
-        
+
     except Exception as e:
         db.rollback()
-        logger.error(f"Error analyzing document {document_id}: {e}", exc_info=True)
-        
-        # Retry on certain errors
-        if "rate limit" in str(e).lower() or "timeout" in str(e).lower():
-            raise self.retry(exc=e)
-        
-        # Update document status to failed
-        try:
-            document = db.query(Document).filter(
-                Document.id == uuid.UUID(document_id)
-            ).first()
-            if document:
-                document.status = "failed"
-                db.commit()
-        except:
-            pass
-        
+        logger.error(f"Error queueing analysis for document {document_id}: {e}", exc_info=True)
         return {
             "success": False,
             "document_id": document_id,
             "error": str(e)
         }
-        
+
     finally:
         db.close()
 
 
 @celery_app.task
+@task_locks.singleton("analysis:pending")
 def analyze_pending_documents():
     """
-    Analyze all pending documents
-    
-    Useful for batch processing or recovery
+    Queue documents awaiting analysis and keep the queue draining
+
+    Runs every minute: queues documents with neither an analysis nor a
+    job, fails jobs whose workers died on their last attempt, and starts
+    up to ANALYSIS_QUEUE_DRAINERS drainers for the work that is waiting.
     """
     db = SessionLocal()
-    
+
     try:
-        logger.info("Checking for pending documents to analyze")
-        
-        # Find documents without analysis
-        documents = db.query(Document).filter(
-            Document.status.in_(['draft', 'review']),
-            ~Document.id.in_(
-                db.query(DocumentAnalysis.document_id)
+        queued = analysis_queue.enqueue_pending(db)
+        reaped = analysis_queue.reap(db)
+        db.commit()
+        progress_publisher.publish_many(queued, "queued")
+        progress_publisher.publish_many(reaped, "failed", error="Lease expired on the last attempt")
+        for document_id in reaped:
+            document_service.invalidate_document_cache(document_id)
+
+        stats = analysis_queue.stats(db)
+        waiting = stats["queued"] + stats["expired_leases"]
+        drainers = min(settings.ANALYSIS_QUEUE_DRAINERS, math.ceil(waiting / settings.ANALYSIS_JOB_BATCH_SIZE))
+        for _ in range(drainers):
+            process_analysis_jobs.delay()
+
+        if queued or reaped or drainers:
+            logger.info(
+                f"Queued {len(queued)} documents for analysis, failed {len(reaped)} abandoned jobs, "
+                f"started {drainers} drainers for {waiting} waiting jobs"
             )
-        ).limit(10).all()
-        
-        if not documents:
-            logger.info("No pending documents found")
-            return {
-                "success": True,
-                "documents_found": 0
-            }
-        
-        # Trigger analysis for each
-        for doc in documents:
-            # Assume file is stored at uploads/{doc.id}/{doc.name}
-            file_path = f"uploads/{doc.id}/{doc.name}"
-            analyze_document_async.delay(str(doc.id), file_path)
-        
-        logger.info(f"Triggered analysis for {len(documents)} documents")
-        
+
         return {
             "success": True,
-            "documents_found": len(documents),
-            "documents_triggered": len(documents)
+            "documents_queued": len(queued),
+            "jobs_reaped": len(reaped),
+            "jobs_waiting": waiting,
+            "drainers_started": drainers
         }
-        
+
     except Exception as e:
+        db.rollback()
         logger.error(f"Error in analyze_pending_documents: {e}", exc_info=True)
         return {
             "success": False,
             "error": str(e)
         }
-        
+
     finally:
         db.close()
@@ -1,12 +1,85 @@
+"""
+Celery application
+
+Work is split over named queues so that a manual re-analysis never waits
+behind a weekly cleanup or a KPI fan-out:
+
+    analysis     analysis job drainers and the pending scan (waits on the model)
+    previews     page preview rendering (CPU)
+    similarity   similarity index rebuilds and backfills (CPU)
+    kpi          KPI calculation and threshold checks
+    maintenance  upload session cleanup and archiving
+    default      anything not routed
+
+Each queue is consumed by a worker profile sized for its work (see
+WORKER_PROFILES and app.tasks.worker). Within a queue, messages are
+taken by priority: on Redis, 0 is taken first and 9 last.
+"""
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init
+from kombu import Queue
+
+from app.config import settings
+
+# Message priorities (Redis order: lower is taken first)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+PRIORITY_STEPS = [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW]
+
+QUEUES = ["analysis", "previews", "similarity", "kpi", "maintenance", "default"]
+
+TASK_ROUTES = {
+    "app.tasks.ai_analysis_tasks.*": {"queue": "analysis"},
+    "app.tasks.document_tasks.generate_document_previews": {"queue": "previews"},
+    "app.tasks.document_tasks.*": {"queue": "maintenance"},
+    "app.tasks.similarity_tasks.*": {"queue": "similarity"},
+    "app.tasks.kpi_tasks.cleanup_old_kpi_data": {"queue": "maintenance"},
+    "app.tasks.kpi_tasks.*": {"queue": "kpi"},
+}
+
+# Queues, pool and sizing of each worker profile. Model calls leave the
+# analysis drainers idle most of the time, so they run as threads; their
+# PDF parsing still uses every core through the extraction process pool,
+# which prefork children (daemonic) cannot start. CPU-bound work runs in
+# prefork processes, one per core, reserving one message at a time so a
+# long render never holds back a queued one. A concurrency of 0 means
+# the CPU count.
+WORKER_PROFILES = {
+    "analysis": {
+        "queues": ["analysis"],
+        "pool": "threads",
+        "concurrency": settings.WORKER_ANALYSIS_CONCURRENCY,
+        "prefetch_multiplier": 1,
+    },
+    "cpu": {
+        "queues": ["previews", "similarity"],
+        "pool": "prefork",
+        "concurrency": settings.WORKER_CPU_CONCURRENCY,
+        "prefetch_multiplier": 1,
+    },
+    "background": {
+        "queues": ["kpi", "maintenance", "default"],
+        "pool": "prefork",
+        "concurrency": settings.WORKER_BACKGROUND_CONCURRENCY,
+        "prefetch_multiplier": 4,
+    },
+    # Everything in one worker, for development and small installs
+    "all": {
+        "queues": QUEUES,
+        "pool": "prefork",
+        "concurrency": 0,
+        "prefetch_multiplier": 1,
+    },
+}
 
 # Create a Celery instance
 celery_app = Celery(
     "tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0",
-    include=["app.tasks.document_tasks", "app.tasks.kpi_tasks", "app.tasks.ai_analysis_tasks"],
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+    include=["app.tasks.document_tasks", "app.tasks.kpi_tasks", "app.tasks.ai_analysis_tasks", "app.tasks.similarity_tasks"],
 )
 
 # Optional configuration
@@ -16,15 +89,41 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    task_queues=[Queue(name, routing_key=name) for name in QUEUES],
+    task_default_queue="default",
+    task_routes=TASK_ROUTES,
+    # Unprioritized messages would otherwise be taken first on Redis
+    task_default_priority=PRIORITY_NORMAL,
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "sep": ":",
+        # A worker on several queues empties them in the order given to -Q
+        "queue_order_strategy": "priority",
+    },
+    # Profiles override this; reserved messages can't be reprioritized
+    worker_prefetch_multiplier=1,
 )
 
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Export analysis and task lock metrics from workers that have METRICS_PORT set"""
+    from app.services.analysis_metrics import analysis_metrics
+    analysis_metrics.start_server()
+
+
 # Celery Beat Schedule for periodic tasks
 celery_app.conf.beat_schedule = {
-    # Calculate KPIs every 5 minutes for all active projects
+    # Calculate KPIs every 5 minutes for projects that changed
     'calculate-kpis-every-5-minutes': {
-        'task': 'app.tasks.kpi_tasks.calculate_kpis_for_all_projects',
+        'task': 'app.tasks.kpi_tasks.calculate_kpis_for_dirty_projects',
         'schedule': crontab(minute='*/5'),  # Every 5 minutes
     },
+    # Recalculate KPIs of all active projects hourly, as a safety net
+    'calculate-kpis-full-sweep-hourly': {
+        'task': 'app.tasks.kpi_tasks.calculate_kpis_for_all_projects',
+        'schedule': crontab(minute=2),  # Every hour at :02
+    },
     # Check thresholds every 15 minutes for all active projects
     'check-thresholds-every-15-minutes': {
         'task': 'app.tasks.kpi_tasks.check_thresholds_for_all_projects',
@@ -36,10 +135,20 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(hour=2, minute=0, day_of_week=0),  # Sunday 2 AM
         'kwargs': {'days_to_keep': 1095}  # 3 years for ISO 9001:2015
     },
-    # Analyze pending documents every hour
-    'analyze-pending-documents-hourly': {
+    # Queue unanalyzed documents and start analysis queue drainers every minute
+    'analyze-pending-documents-every-minute': {
         'task': 'app.tasks.ai_analysis_tasks.analyze_pending_documents',
-        'schedule': crontab(minute=0),  # Every hour
+        'schedule': crontab(),  # Every minute
+    },
+    # Garbage-collect abandoned resumable uploads every hour
+    'cleanup-expired-upload-sessions-hourly': {
+        'task': 'app.tasks.document_tasks.cleanup_expired_upload_sessions',
+        'schedule': crontab(minute=30),  # Every hour at :30
+    },
+    # Archive long-deleted documents and reclaim storage (Sunday at 3 AM)
+    'archive-deleted-documents-weekly': {
+        'task': 'app.tasks.document_tasks.archive_deleted_documents',
+        'schedule': crontab(hour=3, minute=0, day_of_week=0),  # Sunday 3 AM
     },
 }
 
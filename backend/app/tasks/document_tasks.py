@@ -0,0 +1,170 @@
+"""
+Document Background Tasks
+
+Celery tasks for document storage housekeeping, retention and preview rendering
+"""
+import logging
+from typing import List
+
+from app.tasks.celery_app import celery_app
+from app.database import SessionLocal
+from app.services.upload_service import UploadService
+from app.services.archive_service import ArchiveService
+from app.services.preview_service import preview_service
+from app.services.task_lock import task_locks
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+@task_locks.singleton("documents:upload-cleanup")
+def cleanup_expired_upload_sessions(batch_size: int = 100):
+    """
+    Garbage-collect abandoned resumable uploads
+    
+    Aborts the storage multipart upload of every session whose TTL has
+    elapsed (discarding the parts already received) and deletes the
+    session rows. Finished sessions are removed once they expire as well.
+    
+    Args:
+        batch_size: Sessions handled per transaction
+        
+    Returns:
+        Dict with success status and sessions removed
+    """
+    db = SessionLocal()
+    upload_service = UploadService()
+    
+    try:
+        removed = 0
+        while True:
+            count = upload_service.cleanup_expired_sessions(db, batch_size=batch_size)
+            removed += count
+            if count < batch_size:
+                break
+        
+        logger.info(f"Removed {removed} expired upload sessions")
+        
+        return {
+            "success": True,
+            "sessions_removed": removed
+        }
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error cleaning up upload sessions: {e}", exc_info=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+        
+    finally:
+        db.close()
+
+
+@celery_app.task
+@task_locks.singleton("documents:archive")
+def archive_deleted_documents(retention_days: int = None, batch_size: int = None):
+    """
+    Move long-deleted documents to the archive and reclaim their storage
+    
+    Runs batch after batch until no document deleted more than
+    retention_days ago is left, then sweeps chunks orphaned by any
+    earlier interrupted run.
+    
+    Args:
+        retention_days: Minimum age of the soft delete (DOCUMENT_RETENTION_DAYS)
+        batch_size: Documents per transaction (ARCHIVE_BATCH_SIZE)
+        
+    Returns:
+        Dict with success status and totals
+    """
+    db = SessionLocal()
+    archive_service = ArchiveService()
+    
+    try:
+        totals = {"documents": 0, "versions": 0, "comments": 0, "objects_deleted": 0, "chunks_deleted": 0}
+        while True:
+            result = archive_service.archive_deleted_documents(
+                db,
+                retention_days=retention_days,
+                batch_size=batch_size
+            )
+            for key in totals:
+                totals[key] += result[key]
+            if result["documents"] == 0:
+                break
+        
+        totals["chunks_deleted"] += archive_service.purge_orphaned_chunks(db)
+        logger.info(f"Archived {totals['documents']} deleted documents")
+        
+        return {
+            "success": True,
+            **totals
+        }
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error archiving deleted documents: {e}", exc_info=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+        
+    finally:
+        db.close()
+
+
+@celery_app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60
+)
+def generate_document_previews(self, version_id: str):
+    """
+    Render thumbnails and previews for a document version
+    
+    Renders are keyed by content hash, so a version whose content was
+    rendered before (restores, re-uploads) costs one existence check.
+    
+    Args:
+        version_id: DocumentVersion UUID
+        
+    Returns:
+        Dict with success status, render status and sizes written
+    """
+    db = SessionLocal()
+    
+    try:
+        result = preview_service.generate_previews(db, version_id)
+        logger.info(f"Previews for version {version_id}: {result['status']}")
+        
+        return {
+            "success": True,
+            "version_id": version_id,
+            **result
+        }
+        
+    except LookupError as e:
+        return {
+            "success": False,
+            "version_id": version_id,
+            "error": str(e)
+        }
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error rendering previews for version {version_id}: {e}", exc_info=True)
+        raise self.retry(exc=e)
+        
+    finally:
+        db.close()
+
+
+def enqueue_previews(version_ids: List):
+    """Queue preview rendering; an unavailable broker never fails an upload"""
+    for version_id in version_ids:
+        try:
+            generate_document_previews.delay(str(version_id))
+        except Exception as e:
+            logger.warning(f"Could not queue previews for version {version_id}: {e}")
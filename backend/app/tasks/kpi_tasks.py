@@ -12,7 +12,9 @@ import uuid
 
 from app.tasks.celery_app import celery_app
 from app.database import SessionLocal
+from app.services.dirty_projects import dirty_projects
 from app.services.kpi_service import KPIService
+from app.services.task_lock import task_locks
 from app.models.kpi import KPIMetric, KPIHistory, DashboardAlert
 from app.models.project import Project
 
@@ -26,6 +28,7 @@ logger = logging.getLogger(__name__)
     max_retries=3,
     default_retry_delay=60  # 1 minute
 )
+@task_locks.singleton("kpi:project:{project_id}", coalesce=True)
 def calculate_and_store_kpis(self, project_id: str):
     """
     Calculate all KPIs and store in database
@@ -35,7 +38,10 @@ def calculate_and_store_kpis(self, project_id: str):
     2. Stores current values in kpi_metrics table
     3. Archives values in kpi_history table for trend analysis
     
-    Runs every 5 minutes via Celery Beat
+    Runs for changed projects every 5 minutes via Celery Beat. One run
+    per project at a time: a run queued while one is in flight makes it
+    run again once it finishes, and a run whose lock expired (a stalled
+    worker) discards its values instead of committing over a newer run.
     
     Args:
         project_id: Project UUID as string
@@ -99,6 +105,20 @@ def calculate_and_store_kpis(self, project_id: str):
             )
             db.add(history)
         
+        # Fencing: refused if a run took over after our lock expired
+        lock = task_locks.current()
+        if lock is not None and not task_locks.fence(db, lock):
+            db.rollback()
+            # Normally the newer run computes them; mark anyway in case
+            # the refusal came from a reset lock counter
+            dirty_projects.mark(project_id)
+            logger.warning(f"Lost KPI lock of project {project_id} (token {lock.token}); discarding values")
+            return {
+                "success": False,
+                "project_id": project_id,
+                "error": "Lock lost"
+            }
+        
         # Commit all changes
         db.commit()
         
@@ -140,6 +160,7 @@ def calculate_and_store_kpis(self, project_id: str):
     max_retries=3,
     default_retry_delay=60
 )
+@task_locks.singleton("kpi:thresholds:{project_id}")
 def check_kpi_thresholds(self, project_id: str):
     """
     Check KPI thresholds and generate alerts
@@ -150,7 +171,8 @@ def check_kpi_thresholds(self, project_id: str):
     3. Generates alerts for KPIs that crossed thresholds
     4. Avoids duplicate alerts for same KPI
     
-    Runs every 15 minutes via Celery Beat
+    Runs every 15 minutes via Celery Beat; skipped while a check of the
+    same project is in flight, which would raise the same alerts
     
     Args:
         project_id: Project UUID as string
@@ -259,12 +281,71 @@ def check_kpi_thresholds(self, project_id: str):
 
 
 @celery_app.task
+@task_locks.singleton("kpi:dirty")
+def calculate_kpis_for_dirty_projects():
+    """
+    Calculate KPIs for active projects that changed
+    
+    Takes the projects marked dirty by write paths since the last run
+    (see app.services.dirty_projects) and triggers their calculation.
+    Runs every 5 minutes via Celery Beat; without Redis every active
+    project is recalculated instead.
+    
+    Returns:
+        Dict with success status and project count
+    """
+    dirty = dirty_projects.pop_all()
+    if dirty is None:
+        logger.warning("Dirty project set unavailable; calculating KPIs for all active projects")
+        return calculate_kpis_for_all_projects()
+    if not dirty:
+        return {
+            "success": True,
+            "projects_triggered": 0
+        }
+    
+    db = SessionLocal()
+    
+    try:
+        project_ids = [uuid.UUID(project_id) for project_id in dirty]
+        projects = db.query(Project.id).filter(
+            Project.id.in_(project_ids),
+            Project.status == 'active'
+        ).all()
+        
+        for project_id, in projects:
+            calculate_and_store_kpis.delay(str(project_id))
+        
+        logger.info(f"Triggered KPI calculation for {len(projects)} of {len(dirty)} changed projects")
+        
+        return {
+            "success": True,
+            "projects_triggered": len(projects)
+        }
+        
+    except Exception as e:
+        # Put them back for the next run
+        dirty_projects.mark(*dirty)
+        logger.error(f"Error triggering KPI calculations for changed projects: {e}", exc_info=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+        
+    finally:
+        db.close()
+
+
+@celery_app.task
+@task_locks.singleton("kpi:sweep")
 def calculate_kpis_for_all_projects():
     """
     Calculate KPIs for all active projects
     
-    This is a convenience task that triggers KPI calculation
-    for all active projects in the system.
+    Full sweep behind calculate_kpis_for_dirty_projects: catches lost
+    dirty marks and KPIs that move with time alone (rolling windows).
+    Runs hourly via Celery Beat; a tick arriving while a sweep is in
+    flight (or from a second beat) is skipped.
     
     Returns:
         Dict with success status and project count
@@ -302,12 +383,14 @@ def calculate_kpis_for_all_projects():
 
 
 @celery_app.task
+@task_locks.singleton("kpi:thresholds")
 def check_thresholds_for_all_projects():
     """
     Check thresholds for all active projects
     
     This is a convenience task that triggers threshold checking
-    for all active projects in the system.
+    for all active projects in the system. Skipped while a previous
+    tick is still in flight.
     
     Returns:
         Dict with success status and project count
@@ -345,6 +428,7 @@ def check_thresholds_for_all_projects():
 
 
 @celery_app.task
+@task_locks.singleton("kpi:cleanup")
 def cleanup_old_kpi_data(days_to_keep: int = 1095):
     """
     Clean up old KPI data
@@ -0,0 +1,124 @@
+"""
+Similarity Index Background Tasks
+
+Celery tasks keeping the per-project similar-document indexes compact
+and rebuilding them from stored analyses
+"""
+import logging
+import uuid
+
+from sqlalchemy.orm import selectinload, undefer
+
+from app.tasks.celery_app import PRIORITY_LOW, celery_app
+from app.database import SessionLocal
+from app.models.document import Document
+from app.models.document_analysis import DocumentAnalysis
+from app.services.similarity_service import similarity_service
+
+logger = logging.getLogger(__name__)
+
+# Analyses loaded per query while backfilling
+BACKFILL_BATCH_SIZE = 50
+
+
+@celery_app.task
+def rebuild_similarity_index(project_id: str):
+    """
+    Compact a project's similarity index and retrain its quantizer
+
+    Queued after an analysis leaves the index due for a rebuild; a
+    rebuild already running for the project makes this one a no-op.
+
+    Args:
+        project_id: Project UUID
+
+    Returns:
+        Dict with success status, rows and inverted lists
+    """
+    try:
+        result = similarity_service.rebuild(project_id)
+        return {
+            "success": True,
+            "project_id": project_id,
+            **result
+        }
+
+    except Exception as e:
+        logger.error(f"Error rebuilding similarity index of project {project_id}: {e}", exc_info=True)
+        return {
+            "success": False,
+            "project_id": project_id,
+            "error": str(e)
+        }
+
+
+# Behind rebuilds for fresh analyses
+@celery_app.task(priority=PRIORITY_LOW)
+def backfill_similarity_index(project_id: str = None):
+    """
+    Index the stored analyses of live documents
+
+    Run after enabling similarity, changing SIMILARITY_EMBEDDER or
+    SIMILARITY_DIM, or losing an index directory. Documents already
+    indexed are replaced, so it is safe to repeat.
+
+    Args:
+        project_id: Only this project (default: every project)
+
+    Returns:
+        Dict with success status, documents indexed and projects rebuilt
+    """
+    db = SessionLocal()
+
+    try:
+        indexed = 0
+        projects = set()
+        last_id = None
+        while True:
+            query = db.query(Document.id, Document.project_id).join(
+                DocumentAnalysis, DocumentAnalysis.document_id == Document.id
+            ).filter(Document.deleted_at.is_(None))
+            if project_id:
+                query = query.filter(Document.project_id == uuid.UUID(project_id))
+            if last_id is not None:
+                query = query.filter(Document.id > last_id)
+            batch = query.order_by(Document.id).limit(BACKFILL_BATCH_SIZE).all()
+            if not batch:
+                break
+
+            analyses = db.query(DocumentAnalysis).options(
+                undefer("*"),
+                selectinload(DocumentAnalysis.stored_text)
+            ).filter(
+                DocumentAnalysis.document_id.in_([document_id for document_id, _ in batch])
+            ).all()
+            projects_of = dict(batch)
+            for project in set(projects_of.values()):
+                indexed += similarity_service.index_analyses(
+                    project, [a for a in analyses if projects_of[a.document_id] == project]
+                )
+                projects.add(project)
+            last_id = batch[-1][0]
+            # Analysis text is large; don't keep it in the identity map
+            db.expunge_all()
+
+        for project in projects:
+            similarity_service.rebuild(project)
+
+        logger.info(f"Backfilled similarity indexes: {indexed} documents in {len(projects)} projects")
+
+        return {
+            "success": True,
+            "documents_indexed": indexed,
+            "projects_rebuilt": len(projects)
+        }
+
+    except Exception as e:
+        logger.error(f"Error backfilling similarity indexes: {e}", exc_info=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+    finally:
+        db.close()
@@ -0,0 +1,56 @@
+"""
+Celery worker launcher
+
+Starts a worker with one of the profiles of app.tasks.celery_app:
+
+    python -m app.tasks.worker analysis
+    python -m app.tasks.worker cpu
+    python -m app.tasks.worker background
+    python -m app.tasks.worker all
+
+Further arguments go to `celery worker` and win over the profile, e.g.
+`python -m app.tasks.worker cpu --concurrency 4 --loglevel debug`.
+"""
+import sys
+from typing import List
+
+from app.tasks.celery_app import WORKER_PROFILES, celery_app
+
+
+def worker_argv(profile: str, extra: List[str] = ()) -> List[str]:
+    """
+    `celery worker` arguments of a profile
+
+    Raises:
+        ValueError: Unknown profile
+    """
+    options = WORKER_PROFILES.get(profile)
+    if options is None:
+        raise ValueError(f"Unknown worker profile: {profile} (one of {', '.join(WORKER_PROFILES)})")
+
+    argv = [
+        "worker",
+        "--queues", ",".join(options["queues"]),
+        "--pool", options["pool"],
+        "--prefetch-multiplier", str(options["prefetch_multiplier"]),
+        "--hostname", f"{profile}@%h",
+        "--loglevel", "info",
+    ]
+    if options["concurrency"]:
+        argv += ["--concurrency", str(options["concurrency"])]
+    return argv + list(extra)
+
+
+def main(args: List[str] = None):
+    args = sys.argv[1:] if args is None else args
+    if not args or args[0].startswith("-"):
+        sys.exit(f"Usage: python -m app.tasks.worker {{{'|'.join(WORKER_PROFILES)}}} [celery worker options]")
+    try:
+        argv = worker_argv(args[0], args[1:])
+    except ValueError as e:
+        sys.exit(str(e))
+    celery_app.worker_main(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Text compression for large stored text
+
+zstd when the zstandard package is installed, zlib otherwise. The codec
+is stored next to the data, so rows written by either remain readable
+after ANALYSIS_TEXT_CODEC changes.
+"""
+import zlib
+from typing import Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+from app.config import settings
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def compress_text(text: str, codec: str = None) -> Tuple[str, bytes]:
+    """
+    Compress UTF-8 text
+
+    Returns:
+        (codec used, compressed bytes); zlib when zstd was asked for but
+        zstandard is not installed
+    """
+    codec = codec or settings.ANALYSIS_TEXT_CODEC
+    data = text.encode("utf-8")
+    if codec == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec in ("zstd", "zlib"):
+        return "zlib", zlib.compress(data, ZLIB_LEVEL)
+    if codec == "none":
+        return "none", data
+    raise ValueError(f"Unknown text codec: {codec}")
+
+
+def decompress_text(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Text was stored with zstd; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "none":
+        return bytes(data).decode("utf-8")
+    raise ValueError(f"Unknown text codec: {codec}")
@@ -0,0 +1,66 @@
+"""
+Shared helpers for the benchmark scripts
+
+Benchmarks run against the database in DATABASE_URL. When it is not set
+they fall back to a throwaway SQLite file so they can run on a laptop;
+SQLite has no native UUID type, so UUID columns are stored as CHAR(32)
+for that case only.
+"""
+import os
+import tempfile
+import time
+import uuid
+
+_workdir = tempfile.mkdtemp(prefix="projectwise-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/bench.sqlite")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("STORAGE_PATH", os.path.join(_workdir, "storage"))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "")
+
+from sqlalchemy import UUID  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+
+
+@compiles(UUID, "sqlite")
+def _compile_uuid_sqlite(type_, compiler, **kw):
+    return "CHAR(32)"
+
+
+WORKDIR = _workdir
+
+
+def setup_database():
+    """Create all tables and return (session, user, project)"""
+    from app.database import engine, SessionLocal
+    from app.models import Base, User, Project
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = User(email=f"bench-{uuid.uuid4()}@example.com", name="Benchmark", hashed_password="x")
+    db.add(user)
+    db.commit()
+    project = Project(name="Benchmark project", owner_id=user.id)
+    db.add(project)
+    db.commit()
+    return db, user, project
+
+
+class Timer:
+    """Context manager measuring wall-clock seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,154 @@
+"""
+Analysis pipeline throughput benchmark
+
+Uploads synthetic PDFs, queues them as analysis jobs and drains the
+queue end to end (job claims, storage read, extraction, analysis cache,
+rate-limited model calls, result rows and search indexing) with
+process_analysis_jobs in several worker processes, against the fake
+backend in-process or the stand-in HTTP server. No provider quota is
+used.
+
+Reports documents per minute, p50/p99 analysis time and time from
+enqueue to completion, outcomes, and the jobs and peak RSS of each
+worker.
+
+    python -m benchmarks.bench_analysis_pipeline --documents 200 --workers 4 --latency-ms 800
+    python -m benchmarks.bench_analysis_pipeline --backend http --error-rate 0.05 --shape mixed
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import time
+from collections import Counter
+
+from benchmarks._support import Timer, percentile, setup_database
+from benchmarks.bench_pdf_extraction import build_pdf
+
+
+def run_worker(ready, start, results):
+    """Drain the job queue until it is empty, like a prefork Celery worker"""
+    logging.getLogger().setLevel(logging.ERROR)
+    from app.tasks.ai_analysis_tasks import process_analysis_jobs
+
+    ready.set()
+    start.wait()
+    report = process_analysis_jobs.apply(kwargs={"drain_seconds": 86400}).get()
+    # Linux reports kilobytes
+    results.put((os.getpid(), report, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=4, help="pages per document")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="share of documents re-uploading earlier content")
+    parser.add_argument("--backend", choices=("fake", "http"), default="fake")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="median model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--shape", choices=("json", "markdown", "text", "mixed"), default="markdown")
+    parser.add_argument("--rpm", type=int, default=100000, help="LLM requests per minute quota")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Workers are spawned and read their settings from the environment
+    os.environ.update({
+        "AI_BACKEND": args.backend,
+        "AI_FAKE_LATENCY_MS": str(args.latency_ms),
+        "AI_FAKE_LATENCY_SIGMA": str(args.latency_sigma),
+        "AI_FAKE_ERROR_RATE": str(args.error_rate),
+        "AI_FAKE_RESPONSE_SHAPE": args.shape,
+        "AI_FAKE_SEED": str(args.seed),
+        "LLM_REQUESTS_PER_MINUTE": str(args.rpm),
+        "LLM_BACKOFF_BASE_SECONDS": "0.2",
+        "EXTRACTION_WORKERS": "1",
+    })
+    server = None
+    if args.backend == "http":
+        from benchmarks.llm_stub_server import serve
+        server = serve(
+            latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate, shape=args.shape, seed=args.seed
+        )
+        os.environ["AI_BACKEND_URL"] = f"http://127.0.0.1:{server.server_address[1]}/generate"
+
+    from types import SimpleNamespace
+    from app.models.analysis_job import AnalysisJob
+    from app.models.document_analysis import DocumentAnalysis
+    from app.services.analysis_queue import analysis_queue
+    from app.services.document_service import DocumentService
+
+    db, user, project = setup_database()
+    service = DocumentService()
+    rng = random.Random(args.seed)
+    contents = []
+    document_ids = []
+    for i in range(args.documents):
+        if contents and rng.random() < args.duplicate_ratio:
+            data = rng.choice(contents)
+        else:
+            data = build_pdf(args.pages, 300, label=f"doc{i}sheet")
+            contents.append(data)
+        upload = SimpleNamespace(file=io.BytesIO(data), content_type="application/pdf")
+        fields = service._store_file(db, str(project.id), upload)
+        document = service.create_document_record(
+            db, str(project.id), str(user.id), f"spec-{i}.pdf", name=f"spec-{i}.pdf", **fields
+        )
+        document_ids.append(document.id)
+    db.commit()
+    analysis_queue.enqueue_pending(db, limit=len(document_ids))
+    db.commit()
+
+    context = multiprocessing.get_context("spawn")
+    ready = [context.Event() for _ in range(args.workers)]
+    start = context.Event()
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(ready[i], start, results))
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for event in ready:
+        event.wait()
+
+    with Timer() as timer:
+        start.set()
+        reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    processing = [seconds for (seconds,) in db.query(DocumentAnalysis.processing_time).filter(
+        DocumentAnalysis.document_id.in_(document_ids)
+    )]
+    waits = [(finished - created).total_seconds() for created, finished in db.query(
+        AnalysisJob.created_at, AnalysisJob.finished_at
+    ).filter(AnalysisJob.document_id.in_(document_ids), AnalysisJob.finished_at.isnot(None))]
+    db.close()
+    outcomes = Counter()
+    for _, report, _ in reports:
+        outcomes.update(report.get("cache", {}))
+        outcomes.update({name: count for name, count in report.get("outcomes", {}).items() if name != "succeeded"})
+
+    print(f"Documents:   {args.documents} x {args.pages} pages, {args.workers} workers, "
+          f"{args.backend} backend ({args.latency_ms:.0f} ms median, {args.error_rate:.0%} errors, {args.shape})")
+    print(f"Throughput:  {args.documents / timer.elapsed * 60:.0f} documents/min ({timer.elapsed:.1f}s)")
+    print(f"Analysis:    p50 {percentile(processing, 50):.2f}s  p99 {percentile(processing, 99):.2f}s  "
+          f"max {max(processing):.2f}s")
+    print(f"Queued→done: p50 {percentile(waits, 50):.2f}s  p99 {percentile(waits, 99):.2f}s  "
+          f"max {max(waits):.2f}s")
+    print(f"Outcomes:    " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+    for pid, report, peak_mb in sorted(reports, key=lambda r: r[0]):
+        print(f"Worker {pid}: {report.get('processed', 0)} jobs, peak RSS {peak_mb:.0f} MB")
+    if server is not None:
+        print(f"Stand-in:    {server.stats['requests']} requests, {server.stats['errors']} errors")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
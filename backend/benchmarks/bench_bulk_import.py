@@ -0,0 +1,101 @@
+"""
+Bulk import benchmark
+
+Builds a ZIP with N small files and imports it through BulkImportService,
+compared with the serial per-file path (one put + one commit per file).
+A fixed per-request storage latency can be injected to mimic S3.
+
+    python -m benchmarks.bench_bulk_import --files 10000 --latency-ms 20
+"""
+import argparse
+import io
+import os
+import time
+import zipfile
+
+from benchmarks._support import Timer, setup_database
+
+
+class LatencyStorage:
+    """Wraps a storage backend and sleeps on every write"""
+
+    def __init__(self, backend, latency: float):
+        self.backend = backend
+        self.latency = latency
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def put_object(self, key, data, content_type=None):
+        time.sleep(self.latency)
+        self.backend.put_object(key, data, content_type)
+
+    def upload_fileobj(self, key, fileobj, content_type=None):
+        time.sleep(self.latency)
+        self.backend.upload_fileobj(key, fileobj, content_type)
+
+
+def build_archive(count: int, size: int) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i in range(count):
+            archive.writestr(f"drawings/sheet-{i:05d}.pdf", os.urandom(size // 2) * 2)
+    buffer.seek(0)
+    return buffer
+
+
+def run_serial(db, project, user, storage, archive: io.BytesIO, limit: int) -> float:
+    """Baseline: the upload_document path, one file and one commit at a time"""
+    from app.services.document_service import DocumentService
+
+    service = DocumentService()
+    service.storage = storage
+    archive.seek(0)
+    with Timer() as timer, zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist()[:limit]:
+            data = zf.read(info)
+            key = service.new_storage_key(str(project.id))
+            storage.put_object(key, data)
+            service.create_document_record(
+                db, str(project.id), str(user.id), info.filename,
+                storage.url_for(key), len(data)
+            )
+    return timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=4096, help="bytes per file")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated storage latency per object")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--serial-sample", type=int, default=500, help="files timed on the serial path")
+    args = parser.parse_args()
+
+    from app.services.bulk_import_service import BulkImportService
+    from app.services.storage_service import storage_service
+
+    db, user, project = setup_database()
+    storage = LatencyStorage(storage_service, args.latency_ms / 1000.0)
+
+    archive = build_archive(args.files, args.size)
+    print(f"Archive: {args.files} files, {archive.getbuffer().nbytes / 1e6:.1f} MB compressed")
+
+    service = BulkImportService(storage=storage, concurrency=args.concurrency, batch_size=args.batch_size)
+    with Timer() as timer:
+        manifest = service.import_files(db, str(project.id), str(user.id), [("bundle.zip", archive)])
+    bulk_rate = manifest["created"] / timer.elapsed
+    print(f"Bulk import:   {manifest['created']} created, {manifest['failed']} failed "
+          f"in {timer.elapsed:.2f}s ({bulk_rate:.0f} files/s)")
+
+    sample = min(args.serial_sample, args.files)
+    serial_elapsed = run_serial(db, project, user, storage, archive, sample)
+    serial_rate = sample / serial_elapsed
+    print(f"Serial upload: {sample} files in {serial_elapsed:.2f}s ({serial_rate:.0f} files/s)")
+    print(f"Speedup:       {bulk_rate / serial_rate:.1f}x "
+          f"(projected serial time for {args.files} files: {args.files / serial_rate:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
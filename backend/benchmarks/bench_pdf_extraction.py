@@ -0,0 +1,96 @@
+"""
+Parallel PDF extraction benchmark
+
+Builds a text-heavy PDF of a few hundred pages and extracts all of it,
+first in-process and then through process pools of increasing size,
+checking that every run returns the same pages in the same order.
+Reports pages per second for each worker count; on an N-core machine
+throughput should grow roughly linearly up to N workers.
+
+    python -m benchmarks.bench_pdf_extraction --pages 400 --workers 1,2,4,8
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks._support import WORKDIR, Timer
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from app.services.text_extraction import iter_pdf_pages_parallel  # noqa: E402
+
+
+def build_pdf(pages: int, words: int, label: str = "sheet") -> bytes:
+    """Minimal PDF with one Helvetica text stream per page; label varies the text"""
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    font_id = 1
+    pages_id = 2 + 2 * pages
+    page_ids = []
+    for i in range(pages):
+        text = " ".join(f"{label}{i}note{j}" for j in range(words))
+        lines = [text[k:k + 90] for k in range(0, len(text), 90)]
+        content = b"BT /F1 8 Tf 20 800 Td 10 TL " + b" ".join(b"(" + line.encode() + b") '" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        )
+        page_ids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % p for p in page_ids) + b"] /Count %d >>" % pages)
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF" % (len(objects) + 1, len(objects), xref)
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--workers", default=None, help="comma-separated pool sizes (default 1,2,4,... up to the CPU count)")
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",")]
+    else:
+        worker_counts = sorted({1, cpus} | {2 ** i for i in range(1, cpus.bit_length()) if 2 ** i <= cpus})
+
+    path = os.path.join(WORKDIR, "fixture.pdf")
+    with open(path, "wb") as f:
+        f.write(build_pdf(args.pages, args.words))
+    print(f"Fixture: {args.pages} pages, {os.path.getsize(path) / 1e6:.1f} MB, {cpus} CPUs")
+
+    with Timer() as t:
+        expected = [page.extract_text() or "" for page in PdfReader(path).pages]
+    baseline = args.pages / t.elapsed
+    print(f"{'in-process':>12}: {t.elapsed:7.2f}s  {baseline:8.1f} pages/s")
+
+    context = multiprocessing.get_context("spawn")
+    for workers in worker_counts:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # Start the workers before timing
+            list(pool.map(abs, range(workers)))
+            with Timer() as t:
+                pages = list(iter_pdf_pages_parallel(
+                    path, args.pages, parallelism=workers * 2, pages_per_task=args.pages_per_task, pool=pool
+                ))
+        assert pages == expected, "parallel extraction changed the page text or order"
+        rate = args.pages / t.elapsed
+        print(f"{workers:>4} workers: {t.elapsed:7.2f}s  {rate:8.1f} pages/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Similar-documents index benchmark
+
+Fills a project's vector index with synthetic chunk embeddings (clustered
+like real documents, several chunks per document), trains it and times
+similarity queries, exhaustively and through the inverted lists, at
+several probe counts. Recall is the share of the exact top-k documents
+the inverted lists find as well.
+
+Reports fill and rebuild time, index size on disk and p50/p99 query
+latency for one document's chunks.
+
+    python -m benchmarks.bench_similarity --vectors 200000
+    python -m benchmarks.bench_similarity --vectors 1000000 --probes 4 12 32
+"""
+import argparse
+import os
+import uuid
+
+import numpy as np
+
+from benchmarks._support import WORKDIR, Timer, percentile
+
+
+def synthetic_documents(rng, count: int, dim: int, chunks: int, topics: np.ndarray, noise: float):
+    """Documents drawn around random topics, as (id, unit vectors) pairs"""
+    for _ in range(count):
+        topic = topics[rng.integers(len(topics))]
+        # Chunks lie at a cosine of 1 / sqrt(1 + noise^2) from their topic
+        vectors = topic + noise * rng.standard_normal((chunks, dim), dtype=np.float32) / np.sqrt(dim)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield uuid.uuid4(), vectors
+
+
+def top_documents(docs: np.ndarray, scores: np.ndarray, k: int) -> set:
+    best = {}
+    for doc, score in zip(docs, scores):
+        key = doc.tobytes()
+        best[key] = max(best.get(key, -1.0), float(score))
+    return set(sorted(best, key=best.get, reverse=True)[:k])
+
+
+def time_queries(index, queries, k: int):
+    latencies, results = [], []
+    for query in queries:
+        with Timer() as timer:
+            results.append(index.search(query, k))
+        latencies.append(timer.elapsed * 1000)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000, help="chunks in the index")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per document")
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=1.0, help="higher spreads documents away from their topics")
+    parser.add_argument("--queries", type=int, default=50, help="query documents")
+    parser.add_argument("--limit", type=int, default=10, help="similar documents per query")
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 12, 32])
+    args = parser.parse_args()
+
+    from app.config import settings
+    from app.services.similarity_service import CANDIDATES_PER_RESULT, QUERY_CHUNKS
+    from app.services.vector_index import VectorIndex
+
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((args.topics, args.dim), dtype=np.float32)
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+    path = os.path.join(WORKDIR, "similarity")
+    index = VectorIndex(path, "bench", args.dim)
+    k = args.limit * CANDIDATES_PER_RESULT
+
+    documents = args.vectors // args.chunks
+    with Timer() as fill:
+        batch = []
+        for document in synthetic_documents(rng, documents, args.dim, args.chunks, topics, args.noise):
+            batch.append(document)
+            if len(batch) == 500:
+                index.add_many(batch)
+                batch = []
+        if batch:
+            index.add_many(batch)
+    queries = [vectors[:QUERY_CHUNKS] for _, vectors in synthetic_documents(rng, args.queries, args.dim, args.chunks, topics, args.noise)]
+
+    # Exhaustive search over the untrained index
+    exact_latencies, exact = time_queries(index, queries, k)
+    truth = [top_documents(np.concatenate([d for d, _ in r]), np.concatenate([s for _, s in r]), args.limit) for r in exact]
+
+    settings.SIMILARITY_IVF_MIN_VECTORS = min(settings.SIMILARITY_IVF_MIN_VECTORS, args.vectors)
+    with Timer() as rebuild:
+        built = index.rebuild()
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    print(f"Index: {built['rows']} chunks of {args.dim} dims in {documents} documents, {built['lists']} lists, {size / 2**20:.0f} MiB")
+    print(f"Fill: {fill.elapsed:.1f}s ({args.vectors / fill.elapsed:,.0f} chunks/s), rebuild: {rebuild.elapsed:.1f}s")
+    print(f"Query: {min(args.chunks, QUERY_CHUNKS)} chunks, top {k} each, {args.queries} documents")
+    print(f"  exact        p50 {percentile(exact_latencies, 50):7.1f} ms  p99 {percentile(exact_latencies, 99):7.1f} ms")
+    for probes in args.probes:
+        settings.SIMILARITY_IVF_PROBES = probes
+        time_queries(index, queries[:2], k)  # load the postings
+        latencies, results = time_queries(index, queries, k)
+        found = [
+            top_documents(np.concatenate([d for d, _ in r]), np.concatenate([s for _, s in r]), args.limit)
+            for r in results
+        ]
+        recall = np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)])
+        print(
+            f"  ivf {probes:3d} probes p50 {percentile(latencies, 50):7.1f} ms  p99 {percentile(latencies, 99):7.1f} ms"
+            f"  recall@{args.limit} {recall:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
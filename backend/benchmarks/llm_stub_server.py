@@ -0,0 +1,112 @@
+"""
+Stand-in LLM server
+
+Serves the HTTP backend protocol (see app/services/llm_backends.py) from
+the deterministic fake backend, so the analysis pipeline can be load
+tested over real HTTP without provider quota:
+
+    python -m benchmarks.llm_stub_server --port 8089 --latency-ms 800 --error-rate 0.02
+
+and run the workers with AI_BACKEND=http AI_BACKEND_URL=http://localhost:8089/generate.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import _support  # noqa: F401  (environment defaults for app.config)
+
+from app.services.llm_backends import FAKE_RESPONSE_SHAPES, FakeBackend  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "invalid JSON"})
+            return
+
+        plan = self.server.backend.plan(str(request.get("prompt", "")))
+        time.sleep(plan["latency"])
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+        if "error" in plan:
+            with self.server.stats_lock:
+                self.server.stats["errors"] += 1
+            headers = {"Retry-After": str(plan["retry_after"])} if plan["retry_after"] else {}
+            self._send(plan["error"], {"error": "stand-in error"}, headers)
+            return
+        self._send(200, {
+            "text": plan["text"],
+            "usage": {
+                "total_tokens": plan["total_tokens"],
+                "prompt_tokens": plan["prompt_tokens"],
+                "completion_tokens": plan["output_tokens"],
+            },
+        })
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, **fake_options) -> ThreadingHTTPServer:
+    """
+    Start the stand-in server on a background thread
+
+    Args:
+        host: Interface to bind
+        port: Port, 0 for any free one (see server.server_address)
+        fake_options: FakeBackend arguments (latency_ms, error_rate, ...)
+
+    Returns:
+        The running server; stats counts requests and errors
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.backend = FakeBackend(**fake_options)
+    server.stats = {"requests": 0, "errors": 0}
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--shape", choices=FAKE_RESPONSE_SHAPES, default="markdown")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(
+        args.host, args.port,
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, shape=args.shape, seed=args.seed
+    )
+    print(f"LLM stand-in listening on http://{args.host}:{server.server_address[1]}/generate")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"{server.stats['requests']} requests, {server.stats['errors']} errors")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
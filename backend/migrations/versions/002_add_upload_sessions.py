@@ -0,0 +1,52 @@
+"""Add upload sessions for resumable uploads
+
+Revision ID: 002_add_upload_sessions
+Revises: 001_add_kpi_models
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '002_add_upload_sessions'
+down_revision = '001_add_kpi_models'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create upload_sessions table
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('project_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('owner_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('name', sa.String(255), nullable=True),
+        sa.Column('description', sa.String(1000), nullable=True),
+        sa.Column('discipline', sa.String(100), nullable=True),
+        sa.Column('content_type', sa.String(255), nullable=True),
+        sa.Column('upload_length', sa.BigInteger(), nullable=False),
+        sa.Column('upload_offset', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('storage_key', sa.String(500), nullable=False),
+        sa.Column('storage_upload_id', sa.String(255), nullable=False),
+        sa.Column('parts', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(50), nullable=False, server_default='active'),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.text('NOW()')),
+        sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.text('NOW()')),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id']),
+    )
+    
+    # Index used by the garbage collector
+    op.create_index('idx_upload_sessions_status_expires', 'upload_sessions', ['status', 'expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_upload_sessions_status_expires', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
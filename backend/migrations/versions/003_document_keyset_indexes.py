@@ -0,0 +1,48 @@
+"""Add partial composite indexes for keyset document pagination
+
+Revision ID: 003_document_keyset_indexes
+Revises: 002_add_upload_sessions
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_document_keyset_indexes'
+down_revision = '002_add_upload_sessions'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+
+
+def upgrade() -> None:
+    # Built CONCURRENTLY so large documents tables stay writable
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_documents_project_created_live', 'documents',
+            ['project_id', 'created_at', 'id'],
+            postgresql_where=LIVE_ROWS,
+            postgresql_include=['name', 'status', 'discipline', 'file_type'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_documents_project_discipline_created_live', 'documents',
+            ['project_id', 'discipline', 'created_at', 'id'],
+            postgresql_where=LIVE_ROWS,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_documents_project_status_created_live', 'documents',
+            ['project_id', 'status', 'created_at', 'id'],
+            postgresql_where=LIVE_ROWS,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_documents_project_status_created_live', table_name='documents', postgresql_concurrently=True)
+        op.drop_index('idx_documents_project_discipline_created_live', table_name='documents', postgresql_concurrently=True)
+        op.drop_index('idx_documents_project_created_live', table_name='documents', postgresql_concurrently=True)
@@ -0,0 +1,67 @@
+"""Add per-document version counter and unique version numbers
+
+Revision ID: 004_document_version_counter
+Revises: 003_document_keyset_indexes
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_document_version_counter'
+down_revision = '003_document_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'documents',
+        sa.Column('version_counter', sa.Integer(), nullable=False, server_default='0')
+    )
+    
+    # Concurrent restores could already have produced duplicate numbers;
+    # move every duplicate after the document's highest version
+    op.execute("""
+        WITH ranked AS (
+            SELECT id, document_id, created_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY document_id, version_number ORDER BY created_at, id
+                   ) AS rn
+            FROM document_versions
+        ), duplicates AS (
+            SELECT id, document_id,
+                   ROW_NUMBER() OVER (PARTITION BY document_id ORDER BY created_at, id) AS shift
+            FROM ranked
+            WHERE rn > 1
+        )
+        UPDATE document_versions v
+        SET version_number = m.max_version + d.shift
+        FROM duplicates d
+        JOIN (
+            SELECT document_id, MAX(version_number) AS max_version
+            FROM document_versions
+            GROUP BY document_id
+        ) m ON m.document_id = d.document_id
+        WHERE v.id = d.id
+    """)
+    
+    # Seed the counter from existing versions
+    op.execute("""
+        UPDATE documents d
+        SET version_counter = COALESCE(
+            (SELECT MAX(v.version_number) FROM document_versions v WHERE v.document_id = d.id), 0
+        )
+    """)
+    
+    op.create_unique_constraint(
+        'uq_document_versions_document_version',
+        'document_versions',
+        ['document_id', 'version_number']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_document_versions_document_version', 'document_versions', type_='unique')
+    op.drop_column('documents', 'version_counter')
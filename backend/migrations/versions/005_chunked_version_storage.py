@@ -0,0 +1,41 @@
+"""Add content-defined chunk storage for document versions
+
+Revision ID: 005_chunked_version_storage
+Revises: 004_document_version_counter
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_chunked_version_storage'
+down_revision = '004_document_version_counter'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create storage_chunks table
+    op.create_table(
+        'storage_chunks',
+        sa.Column('hash', sa.String(64), primary_key=True),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    
+    # Existing versions stay whole files
+    op.add_column('document_versions', sa.Column('content_hash', sa.String(64), nullable=True))
+    op.add_column(
+        'document_versions',
+        sa.Column('storage_mode', sa.String(20), nullable=False, server_default='full')
+    )
+    op.add_column('document_versions', sa.Column('chunk_manifest', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_versions', 'chunk_manifest')
+    op.drop_column('document_versions', 'storage_mode')
+    op.drop_column('document_versions', 'content_hash')
+    op.drop_table('storage_chunks')
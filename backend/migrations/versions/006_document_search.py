@@ -0,0 +1,68 @@
+"""Add full-text search index for documents
+
+Revision ID: 006_document_search
+Revises: 005_chunked_version_storage
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '006_document_search'
+down_revision = '005_chunked_version_storage'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create document_search table
+    op.create_table(
+        'document_search',
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('project_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(255), nullable=True),
+        sa.Column('description', sa.String(1000), nullable=True),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    )
+    op.create_index('idx_document_search_project', 'document_search', ['project_id'])
+    
+    # Weighted vector maintained by PostgreSQL: name > description/summary > body
+    op.execute("""
+        ALTER TABLE document_search ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(summary, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'C')
+        ) STORED
+    """)
+    
+    # Backfill live documents with their latest analysis
+    op.execute("""
+        INSERT INTO document_search (document_id, project_id, name, description, summary, body, updated_at)
+        SELECT d.id, d.project_id, d.name, d.description, a.summary, left(a.ocr_text, 500000), now()
+        FROM documents d
+        LEFT JOIN LATERAL (
+            SELECT summary, ocr_text
+            FROM document_analysis
+            WHERE document_id = d.id
+            ORDER BY analyzed_at DESC
+            LIMIT 1
+        ) a ON true
+        WHERE d.deleted_at IS NULL
+    """)
+    
+    # Built after the backfill, which is much faster than maintaining it row by row
+    op.execute("CREATE INDEX idx_document_search_vector ON document_search USING GIN (search_vector)")
+
+
+def downgrade() -> None:
+    op.drop_index('idx_document_search_vector', table_name='document_search')
+    op.drop_index('idx_document_search_project', table_name='document_search')
+    op.drop_table('document_search')
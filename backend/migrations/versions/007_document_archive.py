@@ -0,0 +1,44 @@
+"""Add document archive and deleted-document index for retention
+
+Revision ID: 007_document_archive
+Revises: 006_document_search
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '007_document_archive'
+down_revision = '006_document_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create document_archive table
+    op.create_table(
+        'document_archive',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('project_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(255), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+    )
+    op.create_index('idx_document_archive_project_archived', 'document_archive', ['project_id', 'archived_at'])
+    
+    # Only deleted rows are indexed, so live-row indexes and scans stay lean
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_deleted_at "
+            "ON documents (deleted_at) WHERE deleted_at IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_documents_deleted_at")
+    op.drop_index('idx_document_archive_project_archived', table_name='document_archive')
+    op.drop_table('document_archive')
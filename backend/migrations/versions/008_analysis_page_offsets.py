@@ -0,0 +1,23 @@
+"""Add page offsets to document analysis
+
+Revision ID: 008_analysis_page_offsets
+Revises: 007_document_archive
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_analysis_page_offsets'
+down_revision = '007_document_archive'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('document_analysis', sa.Column('page_offsets', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_analysis', 'page_offsets')
@@ -0,0 +1,44 @@
+"""Add content-hash analysis cache
+
+Revision ID: 009_analysis_cache
+Revises: 008_analysis_page_offsets
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '009_analysis_cache'
+down_revision = '008_analysis_page_offsets'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create analysis_cache table
+    op.create_table(
+        'analysis_cache',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('content_hash', sa.String(64), nullable=False),
+        sa.Column('extractor_version', sa.String(32), nullable=False),
+        sa.Column('model', sa.String(100), nullable=False),
+        sa.Column('prompt_version', sa.String(32), nullable=False),
+        sa.Column('extracted_text', sa.Text(), nullable=True),
+        sa.Column('page_offsets', sa.JSON(), nullable=True),
+        sa.Column('pages_read', sa.Integer(), nullable=True),
+        sa.Column('truncated', sa.Boolean(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=False),
+        sa.Column('processing_time', sa.Float(), nullable=True),
+        sa.Column('prompt_chars', sa.Integer(), nullable=True),
+        sa.Column('hit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_hit_at', sa.DateTime(), nullable=True),
+        # Its index also serves extraction lookups by (content_hash, extractor_version)
+        sa.UniqueConstraint('content_hash', 'extractor_version', 'model', 'prompt_version', name='uq_analysis_cache_key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('analysis_cache')
@@ -0,0 +1,32 @@
+"""Add per-chunk cache for chunked analysis
+
+Revision ID: 010_analysis_chunk_cache
+Revises: 009_analysis_cache
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010_analysis_chunk_cache'
+down_revision = '009_analysis_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create analysis_chunk_cache table
+    op.create_table(
+        'analysis_chunk_cache',
+        sa.Column('chunk_hash', sa.String(64), primary_key=True),
+        sa.Column('model', sa.String(100), primary_key=True),
+        sa.Column('prompt_version', sa.String(32), primary_key=True),
+        sa.Column('result', sa.JSON(), nullable=False),
+        sa.Column('prompt_chars', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('analysis_chunk_cache')
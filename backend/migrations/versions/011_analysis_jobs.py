@@ -0,0 +1,57 @@
+"""Add analysis job queue
+
+Revision ID: 011_analysis_jobs
+Revises: 010_analysis_chunk_cache
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '011_analysis_jobs'
+down_revision = '010_analysis_chunk_cache'
+branch_labels = None
+depends_on = None
+
+OPEN_JOBS = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade() -> None:
+    # Create analysis_jobs table
+    op.create_table(
+        'analysis_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('leased_by', sa.String(255), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'uq_analysis_jobs_open_document', 'analysis_jobs', ['document_id'],
+        unique=True, postgresql_where=OPEN_JOBS
+    )
+    op.create_index(
+        'idx_analysis_jobs_claim', 'analysis_jobs', ['status', 'priority', 'created_at'],
+        postgresql_where=OPEN_JOBS
+    )
+    op.create_index('idx_analysis_jobs_document', 'analysis_jobs', ['document_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_analysis_jobs_document', table_name='analysis_jobs')
+    op.drop_index('idx_analysis_jobs_claim', table_name='analysis_jobs')
+    op.drop_index('uq_analysis_jobs_open_document', table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
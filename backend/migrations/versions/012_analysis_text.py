@@ -0,0 +1,72 @@
+"""Move analysis text to a compressed side table
+
+Revision ID: 012_analysis_text
+Revises: 011_analysis_jobs
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# revision identifiers, used by Alembic.
+revision = '012_analysis_text'
+down_revision = '011_analysis_jobs'
+branch_labels = None
+depends_on = None
+
+# Rows copied back per batch on downgrade
+DOWNGRADE_BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    # Existing analyses keep their inline ocr_text; new ones store it here
+    op.create_table(
+        'document_analysis_text',
+        sa.Column('analysis_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('codec', sa.String(16), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('chars', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['analysis_id'], ['document_analysis.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('analysis_id')
+    )
+    # Already compressed: store out of line without trying pglz on it
+    op.execute("ALTER TABLE document_analysis_text ALTER COLUMN data SET STORAGE EXTERNAL")
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Analysis text was stored with zstd; install zstandard to downgrade")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    return bytes(data).decode("utf-8")
+
+
+def downgrade() -> None:
+    # Put the text of analyses stored since the upgrade back inline
+    bind = op.get_bind()
+    select = sa.text("""
+        SELECT analysis_id, codec, data FROM document_analysis_text
+        WHERE (CAST(:last AS uuid) IS NULL OR analysis_id > CAST(:last AS uuid))
+        ORDER BY analysis_id
+        LIMIT :limit
+    """)
+    update = sa.text("UPDATE document_analysis SET ocr_text = :text WHERE id = :id")
+    last = None
+    while True:
+        rows = bind.execute(select, {"last": last, "limit": DOWNGRADE_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        bind.execute(update, [{"id": analysis_id, "text": _decompress(codec, data)} for analysis_id, codec, data in rows])
+        last = str(rows[-1][0])
+
+    op.drop_table('document_analysis_text')
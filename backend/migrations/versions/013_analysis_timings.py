@@ -0,0 +1,42 @@
+"""Record analysis stage timings and sizes
+
+Revision ID: 013_analysis_timings
+Revises: 012_analysis_text
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013_analysis_timings'
+down_revision = '012_analysis_text'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ('cache_status', sa.String(20)),
+    ('fetch_seconds', sa.Float()),
+    ('extract_seconds', sa.Float()),
+    ('llm_seconds', sa.Float()),
+    ('parse_seconds', sa.Float()),
+    ('pages_read', sa.Integer()),
+    ('input_chars', sa.Integer()),
+    ('llm_calls', sa.Integer()),
+    ('prompt_tokens', sa.Integer()),
+    ('output_tokens', sa.Integer()),
+]
+
+
+def upgrade() -> None:
+    # Nullable without defaults: no table rewrite; older analyses stay null
+    for name, type_ in COLUMNS:
+        op.add_column('document_analysis', sa.Column(name, type_, nullable=True))
+    # KPI-002 and the timing stats scan recent analyses
+    op.create_index('idx_document_analysis_analyzed_at', 'document_analysis', ['analyzed_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_document_analysis_analyzed_at', table_name='document_analysis')
+    for name, _ in reversed(COLUMNS):
+        op.drop_column('document_analysis', name)
@@ -0,0 +1,33 @@
+"""Repair version counters of bulk-imported documents
+
+Revision ID: 014_repair_version_counters
+Revises: 013_analysis_timings
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '014_repair_version_counters'
+down_revision = '013_analysis_timings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Bulk imports left the counter at 0 next to version 1, so the next
+    # allocated number collided; raise every counter to the highest version
+    op.execute("""
+        UPDATE documents
+        SET version_counter = (
+            SELECT MAX(v.version_number) FROM document_versions v WHERE v.document_id = documents.id
+        )
+        WHERE version_counter < (
+            SELECT COALESCE(MAX(v.version_number), 0) FROM document_versions v WHERE v.document_id = documents.id
+        )
+    """)
+
+
+def downgrade() -> None:
+    # Counters only moved up to match existing versions; nothing to undo
+    pass
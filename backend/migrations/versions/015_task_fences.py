@@ -0,0 +1,29 @@
+"""Add fencing tokens of task locks
+
+Revision ID: 015_task_fences
+Revises: 014_repair_version_counters
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015_task_fences'
+down_revision = '014_repair_version_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_fences',
+        sa.Column('key', sa.String(200), nullable=False),
+        sa.Column('token', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('task_fences')
@@ -0,0 +1,91 @@
+"""Compress extracted text in the analysis cache
+
+Revision ID: 016_analysis_cache_text
+Revises: 015_task_fences
+Create Date: 2026-10-20 11:00:00.000000
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# revision identifiers, used by Alembic.
+revision = '016_analysis_cache_text'
+down_revision = '015_task_fences'
+branch_labels = None
+depends_on = None
+
+# Rows converted per batch
+BATCH_SIZE = 500
+
+# Same level as app.utils.compression
+ZLIB_LEVEL = 6
+
+
+def _batches(bind, query):
+    last = None
+    while True:
+        rows = bind.execute(sa.text(query), {"last": last, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        yield rows
+        last = str(rows[-1][0])
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Cached text was stored with zstd; install zstandard to downgrade")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    return bytes(data).decode("utf-8")
+
+
+def upgrade() -> None:
+    op.add_column('analysis_cache', sa.Column('text_codec', sa.String(16), nullable=True))
+    op.add_column('analysis_cache', sa.Column('text_data', sa.LargeBinary(), nullable=True))
+    # Already compressed: store out of line without trying pglz on it
+    op.execute("ALTER TABLE analysis_cache ALTER COLUMN text_data SET STORAGE EXTERNAL")
+
+    # zlib needs nothing outside the standard library; both codecs stay readable
+    bind = op.get_bind()
+    update = sa.text("UPDATE analysis_cache SET text_codec = 'zlib', text_data = :data WHERE id = :id")
+    for rows in _batches(bind, """
+        SELECT id, extracted_text FROM analysis_cache
+        WHERE extracted_text IS NOT NULL
+          AND (CAST(:last AS uuid) IS NULL OR id > CAST(:last AS uuid))
+        ORDER BY id
+        LIMIT :limit
+    """):
+        bind.execute(update, [
+            {"id": row_id, "data": zlib.compress(text.encode("utf-8"), ZLIB_LEVEL)} for row_id, text in rows
+        ])
+
+    op.drop_column('analysis_cache', 'extracted_text')
+
+
+def downgrade() -> None:
+    op.add_column('analysis_cache', sa.Column('extracted_text', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    update = sa.text("UPDATE analysis_cache SET extracted_text = :text WHERE id = :id")
+    for rows in _batches(bind, """
+        SELECT id, text_codec, text_data FROM analysis_cache
+        WHERE text_data IS NOT NULL
+          AND (CAST(:last AS uuid) IS NULL OR id > CAST(:last AS uuid))
+        ORDER BY id
+        LIMIT :limit
+    """):
+        bind.execute(update, [
+            {"id": row_id, "text": _decompress(codec, data)} for row_id, codec, data in rows
+        ])
+
+    op.drop_column('analysis_cache', 'text_data')
+    op.drop_column('analysis_cache', 'text_codec')